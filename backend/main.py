@@ -1,9 +1,11 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Form, Depends
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Depends, Request, Response, Query
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
 from typing import Annotated
 
 from fastapi.middleware.cors import CORSMiddleware
-import pandas as pd
-import io
+import asyncio
+import json
 import logging
 import os
 from typing import List, Optional, Dict
@@ -19,13 +21,25 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # --- Importação dos Módulos de Serviço ---
-from backend.services.supabase_client import supabase
-from backend.services.processors import desconexao_processor, monitoria_processor, sac_processor
+from backend.services.supabase_client import supabase, supabase_async
+from backend.services.supabase_async import eq, in_, neq
+from backend.services.consulta_clientes import (
+    CLIENTES_LIMITE_MAXIMO, COLUNAS_ORDENACAO, ConsultaClientes, decodificar_cursor, exportar_csv, exportar_ndjson,
+)
+from backend.services.processors import LOTES, PROCESSORS, TABELAS_DESTINO, TIPOS_INCREMENTAIS
+from backend.services.processors.desconexao_processor import MODO_INGESTAO
+from backend.services.processors.resumos import TABELAS_RESUMO
+from backend.services.ingestion import EXTENSOES_SUPORTADAS, remover_arquivo, salvar_upload_em_disco
+from backend.services import dedup, erp, jobs, lotes, metricas
+from backend.services.cache import CacheDeRespostas, etag_corresponde
+from backend.services.eventos import EVENTO_RELATORIO, EVENTO_STATS, CanalDeEventos, estado_do_job, formatar_sse
 
 # --- Carregar o Token do ERP do ambiente ---
-ERP_TOKEN = os.getenv("ERP_API_TOKEN")
+ERP_TOKEN = erp.ERP_API_TOKEN
 if not ERP_TOKEN:
     logger.warning("A variável de ambiente ERP_API_TOKEN não está definida.")
+if not erp.ERP_API_URL:
+    logger.warning("A variável de ambiente ERP_API_URL não está definida; a busca de clientes no ERP está desativada.")
 
 
 # --- Modelos Pydantic ---
@@ -45,22 +59,68 @@ class MessageResponse(BaseModel):
 class UploadResponse(BaseModel):
     message: str
     relatorio_id: int
+    duplicado: bool = False
+
+class ArquivoLoteResponse(BaseModel):
+    nome_arquivo: str
+    status: str
+    linhas_lidas: Optional[int] = None
+    registros: Optional[int] = None
+    detalhe: Optional[str] = None
+
+class UploadLoteResponse(UploadResponse):
+    arquivos: List[ArquivoLoteResponse] = []
 
 class NewKpiStatsResponse(BaseModel):
     new_critical_cases_24h: Optional[int]
     most_critical_olt: Optional[str]
     oldest_case_days: Optional[int]
 
+class ClientesPaginaResponse(BaseModel):
+    dados: List[Dict]
+    proximo_cursor: Optional[str] = None
+    total: Optional[int] = None
+
 class ReportStatusResponse(BaseModel):
     status: str
     detalhes_erro: Optional[str] = None
+    progresso: Optional[int] = None
+    registros_processados: Optional[int] = None
+    metricas: Optional[Dict] = None
+
+
+# --- Fila de processamento dos relatórios (pool de processos fora do event loop da API) ---
+gerenciador_jobs = jobs.GerenciadorDeJobs()
+# --- Eventos em tempo real: status/progresso dos relatórios e estatísticas atualizadas (GET /eventos) ---
+canal_eventos = CanalDeEventos()
+# --- Busca de clientes no ERP (pool de conexões e cache compartilhados; criado no lifespan) ---
+cliente_erp: Optional[erp.ClienteErp] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    dedup.inicializar_banco()
+    lotes.inicializar_banco()
+    erp.inicializar_banco()
+    global cliente_erp
+    if erp.ERP_API_URL:
+        cliente_erp = erp.ClienteErp()
+    gerenciador_jobs.iniciar(supabase)
+    canal_eventos.iniciar()
+    yield
+    await canal_eventos.parar()
+    if cliente_erp is not None:
+        await cliente_erp.fechar()
+        cliente_erp = None
+    gerenciador_jobs.parar()
+    await supabase_async.fechar()
 
 
 # --- Configuração do App FastAPI ---
 app = FastAPI(
     title="Plataforma de Inteligência Operacional API",
     description="API para processar e analisar relatórios de múltiplas áreas.",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -71,154 +131,489 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mapeamento dos tipos de relatório para suas funções de processamento
-PROCESSORS: Dict[str, callable] = {
-    "desconexao": desconexao_processor.processar_relatorio_desconexao,
-    "monitoria": monitoria_processor.processar_relatorio_monitoria,
-    "sac": sac_processor.processar_relatorio_sac,
-}
-
-# --- Lógica de Processamento em Background ---
-def processar_arquivo_em_background(relatorio_id: int, contents: bytes, filename: str, report_type: str):
-    logger.info(f"[Background] Iniciando processamento | ID={relatorio_id}, Tipo={report_type}, Arquivo={filename}")
-
-    try:
-        supabase.table('relatorios').update({"status": "PROCESSING"}).eq('id', relatorio_id).execute()
-        
-        file_stream = io.BytesIO(contents)
-        df = None
-        if filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file_stream)
-        elif filename.endswith('.csv'):
-            try:
-                df = pd.read_csv(file_stream, sep=',', engine='python', encoding='utf-8-sig')
-                if df.shape[1] == 1:
-                    file_stream.seek(0)
-                    df = pd.read_csv(file_stream, sep=';', engine='python', encoding='utf-8-sig')
-            except Exception:
-                file_stream.seek(0)
-                df = pd.read_csv(file_stream, sep=None, engine='python', encoding='latin-1')
-        
-        if df is None:
-             raise ValueError("Formato de arquivo inválido ou corrompido.")
-
-        logger.info(f"[Background] Colunas detectadas no arquivo: {df.columns.tolist()}")
-
-        processor_func = PROCESSORS.get(report_type)
-        logger.info(f"[Background] Processor selecionado: {processor_func.__name__ if processor_func else 'Nenhum encontrado'}")
-
-        if not processor_func:
-            raise ValueError(f"Tipo de relatório desconhecido: '{report_type}'")
-
-        processor_func(df=df, relatorio_id=relatorio_id, supabase_client=supabase)
-        
-        supabase.table('relatorios').update({"status": "COMPLETED"}).eq('id', relatorio_id).execute()
-        logger.info(f"[Background] Processamento do relatório ID: {relatorio_id} concluído com sucesso.")
-
-    except Exception as e:
-        error_detail = f"Erro ao processar o arquivo: {str(e)}"
-        logger.error(error_detail, exc_info=True)
-        supabase.table('relatorios').update(
-            {"status": "FAILED", "detalhes_erro": error_detail}
-        ).eq('id', relatorio_id).execute()
-
-
 @app.post("/upload", response_model=UploadResponse, tags=["Relatórios"])
 async def upload_relatorio(
-    background_tasks: BackgroundTasks, 
     report_type: Annotated[str, Form()],
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    perfilar: Annotated[bool, Form()] = False,
 ):
     logger.info(f"[Upload] Recebido upload | Tipo={report_type}, Arquivo={file.filename}")
 
-    if not file.filename.endswith(('.xlsx', '.xls', '.csv')):
+    if not file.filename.lower().endswith(EXTENSOES_SUPORTADAS):
         raise HTTPException(status_code=400, detail="Formato de arquivo inválido.")
+    if report_type not in PROCESSORS:
+        raise HTTPException(status_code=400, detail=f"Tipo de relatório desconhecido: '{report_type}'.")
     
-    contents = await file.read()
-    
-    insert_res = supabase.table('relatorios').insert({
-        "nome_arquivo": file.filename,
-        "status": "PENDING",
-        "tipo": report_type
-    }).execute()
-
-    if not insert_res.data:
-        raise HTTPException(status_code=500, detail="Não foi possível criar o registro do relatório.")
-    
-    relatorio_id = insert_res.data[0]['id']
-    logger.info(f"[Upload] Registro criado no Supabase | ID={relatorio_id}, Tipo={report_type}")
+    caminho_arquivo, sha256 = await salvar_upload_em_disco(file)
 
-    background_tasks.add_task(processar_arquivo_em_background, relatorio_id, contents, file.filename, report_type)
+    # O arquivo só continua no spool depois de entregue à fila: duplicados e falhas o descartam no finally
+    enfileirado = False
+    try:
+        # A trava cobre verificação + criação: envios simultâneos do mesmo arquivo geram um único relatório
+        async with dedup.trava(sha256):
+            existente = await _relatorio_do_mesmo_conteudo(sha256, report_type)
+            if existente is not None:
+                logger.info(f"[Upload] Conteúdo já enviado (sha256={sha256[:12]}) | Reaproveitando relatório ID={existente}")
+                return {
+                    "message": "Este arquivo já foi enviado; exibindo o relatório existente.",
+                    "relatorio_id": existente,
+                    "duplicado": True,
+                }
+
+            inseridos = await supabase_async.insert('relatorios', {
+                "nome_arquivo": file.filename,
+                "status": "PENDING",
+                "tipo": report_type
+            })
+            if not inseridos:
+                raise HTTPException(status_code=500, detail="Não foi possível criar o registro do relatório.")
+
+            relatorio_id = inseridos[0]['id']
+            logger.info(f"[Upload] Registro criado no Supabase | ID={relatorio_id}, Tipo={report_type}")
+            await asyncio.to_thread(dedup.registrar, sha256, report_type, relatorio_id, file.filename)
+
+        await asyncio.to_thread(jobs.enfileirar, relatorio_id, caminho_arquivo, file.filename, report_type, perfilar=perfilar)
+        enfileirado = True
+    finally:
+        if not enfileirado:
+            await asyncio.to_thread(remover_arquivo, caminho_arquivo)
+
+    gerenciador_jobs.notificar()
     
     return {"message": "Arquivo recebido! O processamento foi iniciado.", "relatorio_id": relatorio_id}
 
+@app.post("/upload/lote", response_model=UploadLoteResponse, tags=["Relatórios"])
+async def upload_lote(
+    report_type: Annotated[str, Form()],
+    files: List[UploadFile] = File(...),
+    perfilar: Annotated[bool, Form()] = False,
+):
+    """Vários arquivos (ou um .zip com eles) processados como um único relatório consolidado.
+
+    Os arquivos são lidos em paralelo; registros repetidos entre eles (mesma
+    chave, ex.: `serial_onu`) ficam com a versão do último arquivo enviado. O
+    status de cada arquivo fica em `/relatorios/{id}/arquivos`.
+    """
+    logger.info(f"[Upload] Recebido lote | Tipo={report_type}, Arquivos={len(files)}")
+
+    if report_type not in LOTES:
+        raise HTTPException(
+            status_code=400, detail=f"O envio em lote não está disponível para '{report_type}'. Tipos aceitos: {', '.join(LOTES)}.",
+        )
+
+    try:
+        diretorio, arquivos = await lotes.salvar_lote_em_disco(files)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not any(a["status"] == jobs.PENDING for a in arquivos):
+        await asyncio.to_thread(remover_arquivo, diretorio)
+        raise HTTPException(status_code=400, detail="Nenhum arquivo do lote tem um formato suportado.")
+
+    sha256 = lotes.hash_do_lote(arquivos)
+    nome_lote = f"Lote ({sum(a['status'] == jobs.PENDING for a in arquivos)} arquivos)"
+
+    # Como em /upload: o diretório só fica no spool depois de entregue à fila
+    enfileirado = False
+    try:
+        async with dedup.trava(sha256):
+            existente = await _relatorio_do_mesmo_conteudo(sha256, report_type)
+            if existente is not None:
+                logger.info(f"[Upload] Lote já enviado (sha256={sha256[:12]}) | Reaproveitando relatório ID={existente}")
+                return {
+                    "message": "Estes arquivos já foram enviados; exibindo o relatório existente.",
+                    "relatorio_id": existente,
+                    "duplicado": True,
+                    "arquivos": await asyncio.to_thread(lotes.listar_arquivos, existente),
+                }
+
+            inseridos = await supabase_async.insert('relatorios', {
+                "nome_arquivo": nome_lote,
+                "status": "PENDING",
+                "tipo": report_type
+            })
+            if not inseridos:
+                raise HTTPException(status_code=500, detail="Não foi possível criar o registro do relatório.")
+
+            relatorio_id = inseridos[0]['id']
+            logger.info(f"[Upload] Registro do lote criado no Supabase | ID={relatorio_id}, Tipo={report_type}")
+            await asyncio.to_thread(lotes.registrar_arquivos, relatorio_id, arquivos)
+            await asyncio.to_thread(dedup.registrar, sha256, report_type, relatorio_id, nome_lote)
+
+        await asyncio.to_thread(jobs.enfileirar, relatorio_id, diretorio, nome_lote, report_type, perfilar=perfilar)
+        enfileirado = True
+    finally:
+        if not enfileirado:
+            await asyncio.to_thread(remover_arquivo, diretorio)
+
+    gerenciador_jobs.notificar()
+
+    return {
+        "message": "Arquivos recebidos! O processamento foi iniciado.",
+        "relatorio_id": relatorio_id,
+        "arquivos": await asyncio.to_thread(lotes.listar_arquivos, relatorio_id),
+    }
+
+@app.get("/relatorios/{relatorio_id}/arquivos", response_model=List[ArquivoLoteResponse], tags=["Relatórios"])
+def listar_arquivos_do_lote(relatorio_id: int):
+    """Status de cada arquivo de um relatório enviado em lote."""
+    arquivos = lotes.listar_arquivos(relatorio_id)
+    if not arquivos:
+        raise HTTPException(status_code=404, detail="Nenhum envio em lote encontrado para este relatório.")
+    return arquivos
+
+async def _relatorio_do_mesmo_conteudo(sha256: str, report_type: str) -> Optional[int]:
+    """ID do relatório já criado para este conteúdo, se ele ainda estiver válido (em andamento ou concluído)."""
+    entrada = await asyncio.to_thread(dedup.buscar, sha256, report_type)
+    if entrada is None:
+        return None
+    relatorio = await supabase_async.select(
+        "relatorios", "status", filtros={"id": eq(entrada["relatorio_id"])}, unico=True,
+    )
+    if relatorio is None or relatorio["status"] not in (jobs.PENDING, jobs.PROCESSING, jobs.COMPLETED):
+        return None
+    return entrada["relatorio_id"]
+
+@app.post("/relatorios/{relatorio_id}/reprocessar", response_model=MessageResponse, tags=["Relatórios"])
+async def reprocessar_relatorio(relatorio_id: int, perfilar: bool = False):
+    """Reprocessa um relatório a partir do artefato Parquet do upload (ex.: após atualizar um processador).
+
+    Com `?perfilar=true`, grava um perfil cProfile do reprocessamento (ver `/relatorios/{id}/perfil`).
+    """
+    # SQLite e a cópia do Parquet vão para uma thread: no event loop travariam as demais requisições (inclusive o SSE)
+    job = await asyncio.to_thread(jobs.obter_job, relatorio_id)
+    if job is not None and job["status"] in (jobs.PENDING, jobs.PROCESSING):
+        raise HTTPException(status_code=409, detail="O relatório ainda está em processamento.")
+    entrada = await asyncio.to_thread(dedup.buscar_por_relatorio, relatorio_id)
+    if entrada is None:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado entre os uploads registrados.")
+    if entrada["tipo"] in TIPOS_INCREMENTAIS:
+        # As linhas do relatório foram incorporadas ao estado atual; apagá-las perderia ONUs de relatórios anteriores
+        raise HTTPException(
+            status_code=409,
+            detail="Relatórios de ingestão incremental não podem ser reprocessados; envie um snapshot mais recente.",
+        )
+    caminho_arquivo = await asyncio.to_thread(dedup.preparar_reprocessamento, relatorio_id)
+    if caminho_arquivo is None:
+        raise HTTPException(status_code=409, detail="O arquivo deste relatório não está mais disponível; envie-o novamente.")
+
+    try:
+        tabela = TABELAS_DESTINO.get(entrada["tipo"])
+        if tabela:
+            await supabase_async.delete(tabela, {"relatorio_id": eq(relatorio_id)}, timeout=60)
+        for tabela_resumo in TABELAS_RESUMO:
+            await supabase_async.delete(tabela_resumo, {"relatorio_id": eq(relatorio_id)})
+        await supabase_async.update('relatorios', {
+            "status": jobs.PENDING, "progresso": 0, "registros_processados": 0, "detalhes_erro": None,
+        }, {"id": eq(relatorio_id)})
+    except Exception:
+        await asyncio.to_thread(remover_arquivo, caminho_arquivo)
+        raise
+    finally:
+        cache_stats.invalidar()
+
+    await asyncio.to_thread(
+        jobs.enfileirar, relatorio_id, caminho_arquivo, f"{entrada['nome_arquivo']}.parquet", entrada["tipo"], perfilar=perfilar,
+    )
+    gerenciador_jobs.notificar()
+    return {"message": "Reprocessamento iniciado."}
+
+@app.post("/relatorios/{relatorio_id}/cancelar", response_model=MessageResponse, tags=["Relatórios"])
+def cancelar_relatorio(relatorio_id: int):
+    status = gerenciador_jobs.cancelar(relatorio_id, supabase)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado na fila de processamento.")
+    if status == jobs.CANCELLED:
+        return {"message": "Processamento cancelado."}
+    if status == jobs.PROCESSING:
+        return {"message": "Cancelamento solicitado; o processamento será interrompido em instantes."}
+    raise HTTPException(status_code=409, detail=f"O relatório já foi finalizado com status {status}.")
+
 @app.get("/relatorios/status/{relatorio_id}", response_model=ReportStatusResponse, tags=["Relatórios"])
-def get_report_status(relatorio_id: int):
+async def get_report_status(relatorio_id: int):
     try:
-        res = supabase.table("relatorios").select("status, detalhes_erro").eq("id", relatorio_id).single().execute()
-        if res.data:
-            return res.data
-        raise HTTPException(status_code=404, detail="Relatório não encontrado.")
+        relatorio = await supabase_async.select(
+            "relatorios", "status, detalhes_erro, progresso, registros_processados, metricas",
+            filtros={"id": eq(relatorio_id)}, unico=True,
+        )
     except Exception as e:
         logger.error(f"Erro ao buscar status do relatório {relatorio_id}: {e}")
         raise HTTPException(status_code=500, detail="Erro ao consultar o estado do relatório.")
-
-@app.get("/stats/kpis", response_model=NewKpiStatsResponse, tags=["Estatísticas Saúde da Rede"])
-def get_main_kpis():
+    if relatorio is None:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado.")
+    return relatorio
+
+@app.get("/relatorios/{relatorio_id}/perfil", tags=["Relatórios"])
+def baixar_perfil(relatorio_id: int):
+    """Perfil cProfile (formato pstats, ex.: `snakeviz relatorio_10.prof`) de um relatório enviado com `perfilar`."""
+    caminho = metricas.caminho_perfil(relatorio_id)
+    if not os.path.exists(caminho):
+        raise HTTPException(status_code=404, detail="Nenhum perfil foi gravado para este relatório.")
+    return FileResponse(caminho, media_type="application/octet-stream", filename=os.path.basename(caminho))
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Monitoramento"])
+def exportar_metricas():
+    """Métricas de processamento no formato de texto do Prometheus."""
+    return PlainTextResponse(
+        metricas.exportar_prometheus(jobs.contar_por_status(), jobs.listar_metricas_acumuladas()),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+# --- Rotas /stats ---
+# No modo "completa", as estatísticas de desconexão vêm das tabelas de resumo gravadas na
+# ingestão (docs/migrations/004_resumos_relatorios.sql). No incremental, `clientes_off` já
+# é o estado atual (uma linha por ONU) e as RPCs originais continuam agregando sobre ele.
+USAR_RESUMOS_DESCONEXAO = MODO_INGESTAO != "incremental"
+
+def _rpc_desconexao(original: str, resumo: str) -> str:
+    return resumo if USAR_RESUMOS_DESCONEXAO else original
+
+# --- Cache das rotas /stats (invalidado ao concluir relatórios e nas exclusões) ---
+cache_stats = CacheDeRespostas()
+
+def _invalidar_cache_ao_finalizar(relatorio_id: int, tipo: str, status: str):
+    if status in (jobs.COMPLETED, jobs.CANCELLED):
+        cache_stats.invalidar()
+
+gerenciador_jobs.ao_finalizar.append(_invalidar_cache_ao_finalizar)
+
+async def responder_com_cache(request: Request, chave: str, carregar) -> Response:
+    """Serve a resposta a partir do cache, respondendo 304 quando o ETag do cliente ainda é válido."""
+    corpo, etag = await cache_stats.obter(chave, carregar)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_corresponde(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=corpo, media_type="application/json", headers=headers)
+
+async def _carregar_kpis():
     try:
-        response = supabase.rpc('get_new_dashboard_kpis').execute()
-        return response.data[0] if response.data else NewKpiStatsResponse(new_critical_cases_24h=0, most_critical_olt="N/A", oldest_case_days=0)
+        dados = await supabase_async.rpc(_rpc_desconexao('get_new_dashboard_kpis', 'get_resumo_dashboard_kpis'))
+        return dados[0] if dados else NewKpiStatsResponse(new_critical_cases_24h=0, most_critical_olt="N/A", oldest_case_days=0)
     except Exception as e:
         logger.error(f"Erro ao buscar KPIs: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Erro ao buscar KPIs.")
 
-@app.get("/stats/clients-by-city", tags=["Estatísticas Saúde da Rede"])
-def get_clients_by_city():
+async def _carregar_clients_by_city():
     try:
-        response = supabase.rpc('get_clients_by_city').execute()
-        return response.data
+        dados = await supabase_async.rpc(_rpc_desconexao('get_clients_by_city', 'get_resumo_clients_by_city'))
+        return dados
     except Exception as e:
         logger.error(f"Erro em /stats/clients-by-city: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Erro ao buscar dados por cidade.")
 
-@app.get("/stats/offline-history", tags=["Estatísticas Saúde da Rede"])
-def get_offline_history():
+async def _carregar_offline_history():
     try:
-        response = supabase.rpc('get_offline_history').execute()
-        return response.data
+        dados = await supabase_async.rpc(_rpc_desconexao('get_offline_history', 'get_resumo_offline_history'))
+        return dados
     except Exception as e:
         logger.error(f"Erro em /stats/offline-history: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Erro ao buscar histórico.")
 
+@app.get("/stats/kpis", response_model=NewKpiStatsResponse, tags=["Estatísticas Saúde da Rede"])
+async def get_main_kpis(request: Request):
+    return await responder_com_cache(request, "stats:kpis", _carregar_kpis)
+
+@app.get("/stats/clients-by-city", tags=["Estatísticas Saúde da Rede"])
+async def get_clients_by_city(request: Request):
+    return await responder_com_cache(request, "stats:clients-by-city", _carregar_clients_by_city)
+
+@app.get("/stats/offline-history", tags=["Estatísticas Saúde da Rede"])
+async def get_offline_history(request: Request):
+    return await responder_com_cache(request, "stats:offline-history", _carregar_offline_history)
+
+@app.get("/clients", response_model=ClientesPaginaResponse, tags=["Clientes"])
+async def listar_clientes(
+    cidade: Annotated[Optional[List[str]], Query()] = None,
+    olt_regiao: Annotated[Optional[List[str]], Query()] = None,
+    cto: Annotated[Optional[List[str]], Query()] = None,
+    motivo_desconexao: Annotated[Optional[List[str]], Query()] = None,
+    horas_min: Annotated[Optional[int], Query(ge=0)] = None,
+    horas_max: Annotated[Optional[int], Query(ge=0)] = None,
+    busca: Optional[str] = None,
+    ordenar_por: Annotated[str, Query(enum=list(COLUNAS_ORDENACAO))] = "horas_offline",
+    direcao: Annotated[str, Query(pattern="^(asc|desc)$")] = "desc",
+    limite: Annotated[int, Query(ge=1, le=CLIENTES_LIMITE_MAXIMO)] = 50,
+    cursor: Optional[str] = None,
+    contar: bool = False,
+    formato: Annotated[str, Query(pattern="^(json|ndjson|csv)$")] = "json",
+):
+    """Clientes offline com filtros, ordenação e paginação por cursor (keyset).
+
+    A resposta traz `proximo_cursor`, que é passado em `cursor` para obter a página
+    seguinte (ausente na última). `total` só é calculado quando `contar=true`.
+    Com `formato=ndjson` ou `csv`, todas as linhas que atendem aos filtros são
+    transmitidas em streaming, ignorando `limite`.
+    """
+    try:
+        consulta = ConsultaClientes(
+            cidade=cidade, olt_regiao=olt_regiao, cto=cto, motivo_desconexao=motivo_desconexao,
+            horas_min=horas_min, horas_max=horas_max, busca=busca, ordenar_por=ordenar_por, direcao=direcao,
+        )
+        if cursor:
+            decodificar_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if formato == "ndjson":
+        return StreamingResponse(exportar_ndjson(consulta, supabase_async, cursor), media_type="application/x-ndjson")
+    if formato == "csv":
+        return StreamingResponse(
+            exportar_csv(consulta, supabase_async, cursor),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": 'attachment; filename="clientes_offline.csv"'},
+        )
+
+    try:
+        dados, proximo_cursor = await consulta.pagina(supabase_async, limite, cursor)
+        total = await consulta.contar(supabase_async) if contar else None
+        return {"dados": dados, "proximo_cursor": proximo_cursor, "total": total}
+    except Exception as e:
+        logger.error(f"Erro em /clients: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Erro ao buscar clientes.")
+
 @app.delete("/clients/all", response_model=MessageResponse, tags=["Clientes"])
-def delete_all_clients():
+async def delete_all_clients():
     try:
-        delete_res = supabase.table('clientes_off').delete().neq('id', 0).execute()
-        return {"message": f"{len(delete_res.data)} registros foram excluídos."}
+        excluidos = await supabase_async.delete('clientes_off', {"id": neq(0)}, timeout=60)
+        await supabase_async.delete('resumo_desconexao', {"relatorio_id": neq(0)}, timeout=60)
+        await supabase_async.delete('resumo_relatorios', {"tipo": eq("desconexao")})
+        # Sem os dados, reenviar os mesmos arquivos deve processá-los de novo
+        await asyncio.to_thread(dedup.esquecer, tipo="desconexao")
+        return {"message": f"{excluidos} registros foram excluídos."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        cache_stats.invalidar()
 
 @app.delete("/clients", response_model=MessageResponse, tags=["Clientes"])
-def delete_selected_clients(request: DeleteRequest):
+async def delete_selected_clients(request: DeleteRequest):
     try:
-        delete_res = supabase.table('clientes_off').delete().in_('id', request.ids).execute()
-        return {"message": f"{len(delete_res.data)} registros selecionados foram excluídos."}
+        afetados = await supabase_async.select('clientes_off', 'relatorio_id', {"id": in_(request.ids)})
+        excluidos = await supabase_async.delete('clientes_off', {"id": in_(request.ids)})
+        relatorio_ids = sorted({linha["relatorio_id"] for linha in afetados if linha.get("relatorio_id") is not None})
+        if USAR_RESUMOS_DESCONEXAO and relatorio_ids:
+            # Recalcula só os resumos dos relatórios afetados, a partir das linhas que sobraram
+            await supabase_async.rpc('recalcular_resumo_desconexao', {"relatorio_ids": relatorio_ids}, timeout=60)
+        return {"message": f"{excluidos} registros selecionados foram excluídos."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        cache_stats.invalidar()
         
-@app.get("/stats/sac/kpis", tags=["Estatísticas SAC"])
-def get_sac_kpis():
+async def _carregar_sac_kpis():
     try:
-        response = supabase.rpc('get_sac_kpis').execute()
-        return response.data[0] if response.data else {"media_nota_monitoria": 0, "tempo_medio_atendimento_minutos": 0}
+        dados = await supabase_async.rpc('get_resumo_sac_kpis')
+        return dados[0] if dados else {"media_nota_monitoria": 0, "tempo_medio_atendimento_minutos": 0}
     except Exception as e:
         raise HTTPException(status_code=500, detail="Erro ao buscar KPIs do SAC.")
 
-@app.get("/stats/sac/performance-agente", tags=["Estatísticas SAC"])
-def get_performance_por_agente():
+async def _carregar_performance_por_agente():
     try:
-        response = supabase.rpc('get_performance_por_agente').execute()
-        return response.data
+        dados = await supabase_async.rpc('get_resumo_performance_por_agente')
+        return dados
     except Exception as e:
         raise HTTPException(status_code=500, detail="Erro ao buscar performance por agente.")
 
+@app.get("/stats/sac/kpis", tags=["Estatísticas SAC"])
+async def get_sac_kpis(request: Request):
+    return await responder_com_cache(request, "stats:sac:kpis", _carregar_sac_kpis)
+
+@app.get("/stats/sac/performance-agente", tags=["Estatísticas SAC"])
+async def get_performance_por_agente(request: Request):
+    return await responder_com_cache(request, "stats:sac:performance-agente", _carregar_performance_por_agente)
+
+async def _carregar_monitoria_por_agente():
+    try:
+        dados = await supabase_async.rpc('get_resumo_monitoria_por_agente')
+        return dados
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Erro ao buscar monitoria por agente.")
+
+@app.get("/stats/monitoria/agentes", tags=["Estatísticas Monitoria"])
+async def get_monitoria_por_agente(request: Request):
+    return await responder_com_cache(request, "stats:monitoria:agentes", _carregar_monitoria_por_agente)
+
+
+# --- Eventos em tempo real (substituem o polling de /relatorios/status e /stats) ---
+# Estatísticas reenviadas a todas as conexões quando um relatório do tipo é concluído ou cancelado
+STATS_POR_TIPO = {
+    "desconexao": {
+        "/stats/kpis": ("stats:kpis", _carregar_kpis),
+        "/stats/clients-by-city": ("stats:clients-by-city", _carregar_clients_by_city),
+        "/stats/offline-history": ("stats:offline-history", _carregar_offline_history),
+    },
+    "sac": {
+        "/stats/sac/kpis": ("stats:sac:kpis", _carregar_sac_kpis),
+        "/stats/sac/performance-agente": ("stats:sac:performance-agente", _carregar_performance_por_agente),
+    },
+    "monitoria": {
+        "/stats/monitoria/agentes": ("stats:monitoria:agentes", _carregar_monitoria_por_agente),
+    },
+}
+
+async def _publicar_stats(tipo: str):
+    # Passa pelo cache (já invalidado): a carga é reaproveitada pelas requisições /stats seguintes
+    stats = {}
+    for rota, (chave, carregar) in STATS_POR_TIPO[tipo].items():
+        try:
+            corpo, _ = await cache_stats.obter(chave, carregar)
+        except Exception as e:
+            logger.error(f"[Eventos] Não foi possível carregar {rota} para difusão: {e}")
+            return
+        stats[rota] = json.loads(corpo)
+    # O status final do relatório chega às conexões antes das estatísticas
+    await canal_eventos.sincronizar()
+    canal_eventos.publicar(EVENTO_STATS, {"tipo": tipo, "stats": stats})
+
+def _publicar_stats_ao_finalizar(relatorio_id: int, tipo: str, status: str):
+    if status in (jobs.COMPLETED, jobs.CANCELLED) and tipo in STATS_POR_TIPO and canal_eventos.conexoes:
+        canal_eventos.executar(_publicar_stats(tipo))
+
+# Registrado depois da invalidação do cache, para difundir os valores novos
+gerenciador_jobs.ao_finalizar.append(_publicar_stats_ao_finalizar)
+
+async def _estado_dos_relatorios(relatorio_ids: List[int]) -> List[bytes]:
+    mensagens = []
+    for relatorio_id in relatorio_ids:
+        job = await asyncio.to_thread(jobs.obter_job, relatorio_id)
+        if job is not None:
+            estado = estado_do_job(job)
+        else:
+            # Relatório anterior à fila local (ou já removido dela)
+            estado = await supabase_async.select(
+                "relatorios", "relatorio_id:id, tipo, status, progresso, registros_processados, detalhes_erro",
+                filtros={"id": eq(relatorio_id)}, unico=True,
+            )
+        if estado is not None:
+            mensagens.append(formatar_sse(EVENTO_RELATORIO, estado))
+    return mensagens
+
+@app.get("/eventos", tags=["Relatórios"])
+async def acompanhar_eventos(relatorio_id: Annotated[Optional[List[int]], Query()] = None):
+    """Stream Server-Sent Events com o ciclo de vida dos relatórios e as estatísticas atualizadas.
+
+    - `relatorio`: status, progresso e registros processados a cada mudança
+      (PENDING → PROCESSING → COMPLETED/FAILED/CANCELLED). Com `relatorio_id`
+      (pode repetir), só os relatórios pedidos, começando pelo estado atual de cada um.
+    - `stats`: payloads das rotas /stats do tipo do relatório, quando um relatório é concluído.
+    """
+    return StreamingResponse(
+        canal_eventos.assinar(relatorio_id, lambda: _estado_dos_relatorios(relatorio_id or [])),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/erp/find-client", response_model=ErpClientResponse, tags=["ERP"])
+async def find_erp_client(request: ErpRequest):
+    """Busca o cliente no ERP pelo nome (com cache local; ver backend/services/erp.py)."""
+    if cliente_erp is None:
+        raise HTTPException(status_code=503, detail="A integração com o ERP não está configurada.")
+    if not request.client_name.strip():
+        raise HTTPException(status_code=400, detail="Nome do cliente inválido.")
+    try:
+        cliente = await cliente_erp.buscar(request.client_name)
+    except erp.ErroErp as e:
+        logger.error(f"[ERP] Erro ao buscar '{request.client_name}': {e}")
+        raise HTTPException(status_code=502, detail="Não foi possível consultar o ERP no momento.")
+    if cliente is None:
+        raise HTTPException(status_code=404, detail=f"Cliente '{request.client_name}' não encontrado no ERP.")
+    return cliente
@@ -0,0 +1,255 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from . import metricas
+from .supabase_async import ErroPostgrest
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração da escrita em lotes (sobrescrevível via variáveis de ambiente) ---
+BULK_CHUNK_SIZE = int(os.getenv("BULK_INSERT_CHUNK_SIZE", "2000"))
+BULK_MAX_WORKERS = int(os.getenv("BULK_INSERT_MAX_WORKERS", "4"))
+BULK_MAX_RETRIES = int(os.getenv("BULK_INSERT_MAX_RETRIES", "3"))
+BULK_RETRY_BACKOFF_S = float(os.getenv("BULK_INSERT_RETRY_BACKOFF", "0.5"))
+
+# Falhas em que a requisição não chegou ao PostgREST: só nelas um insert simples pode ser repetido.
+# Depois de um timeout de leitura ou de um 5xx o lote pode ter sido gravado, e repeti-lo duplicaria as linhas.
+ERROS_ANTES_DO_ENVIO = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Intervalo mínimo entre duas atualizações de progresso na tabela `relatorios`
+PROGRESS_MIN_INTERVAL_S = 1.0
+
+
+class ProgressoRelatorio:
+    """Acumula o progresso de um relatório e o persiste na linha de `relatorios`.
+
+    O percentual vem das linhas do arquivo já processadas quando o total é
+    conhecido (ingestão em chunks) e, caso contrário, dos registros já
+    gravados em relação aos previstos. É thread-safe: os lotes terminam em
+    paralelo e cada um chama `avancar`. As gravações no banco são limitadas a
+    uma a cada `PROGRESS_MIN_INTERVAL_S`; `ao_gravar`, se informado, recebe
+    cada payload gravado (ex.: para espelhá-lo na fila local de jobs).
+    """
+
+    def __init__(self, supabase_client, relatorio_id: int, ao_gravar: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.supabase_client = supabase_client
+        self.relatorio_id = relatorio_id
+        self.ao_gravar = ao_gravar
+        self.registros_processados = 0
+        self.total_previsto = 0
+        self.linhas_lidas = 0
+        self.total_linhas: Optional[int] = None
+        self._lock = threading.Lock()
+        self._ultima_gravacao = 0.0
+
+    def prever(self, quantidade: int) -> None:
+        """Soma `quantidade` registros ao total esperado de gravações."""
+        with self._lock:
+            self.total_previsto += quantidade
+
+    def definir_total_linhas(self, total: Optional[int]) -> None:
+        """Informa quantas linhas o arquivo de origem tem (estimativa)."""
+        with self._lock:
+            self.total_linhas = total
+
+    @property
+    def percentual(self) -> int:
+        if self.total_linhas:
+            # Enquanto o relatório não termina, nunca reporta 100%
+            return min(99, int(100 * self.linhas_lidas / self.total_linhas))
+        if not self.total_previsto:
+            return 0
+        return min(100, int(100 * self.registros_processados / self.total_previsto))
+
+    def avancar(self, quantidade: int, forcar: bool = False) -> None:
+        """Registra `quantidade` registros gravados no banco."""
+        with self._lock:
+            self.registros_processados += quantidade
+        self._talvez_gravar(forcar)
+
+    def concluir_linhas(self, quantidade: int, forcar: bool = False) -> None:
+        """Registra `quantidade` linhas do arquivo de origem já processadas."""
+        with self._lock:
+            self.linhas_lidas += quantidade
+        self._talvez_gravar(forcar)
+
+    def _talvez_gravar(self, forcar: bool) -> None:
+        with self._lock:
+            agora = time.monotonic()
+            if not forcar and agora - self._ultima_gravacao < PROGRESS_MIN_INTERVAL_S:
+                return
+            self._ultima_gravacao = agora
+            payload = {"progresso": self.percentual, "registros_processados": self.registros_processados}
+        self._gravar(payload)
+
+    def _gravar(self, payload: Dict[str, Any]) -> None:
+        try:
+            self.supabase_client.table('relatorios').update(payload).eq('id', self.relatorio_id).execute()
+        except Exception as e:
+            # O progresso é informativo: uma falha aqui nunca deve derrubar o processamento.
+            logger.warning(f"[BulkWriter] Não foi possível atualizar o progresso do relatório {self.relatorio_id}: {e}")
+        if self.ao_gravar is not None:
+            try:
+                self.ao_gravar(payload)
+            except Exception as e:
+                logger.warning(f"[BulkWriter] Não foi possível repassar o progresso do relatório {self.relatorio_id}: {e}")
+
+
+Registros = Union[List[Dict[str, Any]], pd.DataFrame]
+
+
+def _datas_utc_iso(serie: pd.Series) -> pd.Series:
+    """Datas como texto ISO 8601 em UTC ("2024-01-01T00:00:00.000000Z"); datas sem fuso são tomadas como UTC e NaT vira None."""
+    if serie.dt.tz is not None:
+        serie = serie.dt.tz_convert("UTC").dt.tz_localize(None)
+    valores = serie.to_numpy(dtype="datetime64[us]")
+    texto = np.char.add(np.datetime_as_string(valores, unit="us"), "Z").astype(object)
+    texto[np.isnat(valores)] = None
+    return pd.Series(texto, index=serie.index, dtype=object)
+
+
+def serializar_registros(df: pd.DataFrame) -> bytes:
+    """Converte o DataFrame no corpo JSON (array de objetos) enviado ao PostgREST, usando o serializador em C do pandas.
+
+    NaN/NA viram `null` e todas as datas saem em UTC com o sufixo "Z" (as sem
+    fuso são tomadas como UTC, como na leitura), sem passar por dicts de
+    objetos do pandas nem por loops em Python. Colunas float32 passam pela
+    representação decimal mais curta de cada valor, para que -21.37 não vá ao
+    banco como -21.3700008392.
+    """
+    float32 = [coluna for coluna, tipo in df.dtypes.items() if tipo == "float32"]
+    if float32:
+        df = df.assign(**{coluna: df[coluna].astype(str).astype("float64") for coluna in float32})
+    # Datas são formatadas à parte: o to_json é ~10x mais lento nas com fuso e não marca as sem fuso como UTC
+    datas = [coluna for coluna, tipo in df.dtypes.items() if pd.api.types.is_datetime64_any_dtype(tipo)]
+    if datas:
+        df = df.assign(**{coluna: _datas_utc_iso(df[coluna]) for coluna in datas})
+    return df.to_json(orient="records", date_format="iso", date_unit="us", force_ascii=False).encode("utf-8")
+
+
+def _postar_json(supabase_client, tabela: str, corpo: bytes, on_conflict: Optional[str] = None) -> None:
+    """Envia um corpo JSON já serializado direto ao PostgREST, pela sessão HTTP do próprio cliente supabase-py.
+
+    Evita que o supabase-py reconstrua a lista de dicts e a serialize de novo.
+    """
+    headers = {"Content-Type": "application/json", "Prefer": "return=minimal"}
+    params = {}
+    if on_conflict:
+        headers["Prefer"] = "resolution=merge-duplicates,return=minimal"
+        params["on_conflict"] = on_conflict
+    resposta = supabase_client.postgrest.session.post(tabela, content=corpo, params=params, headers=headers)
+    if resposta.is_error:
+        raise ErroPostgrest(resposta.status_code, resposta.text)
+
+
+def _dividir_em_lotes(registros: Registros, tamanho: int) -> List[Registros]:
+    if isinstance(registros, pd.DataFrame):
+        return [registros.iloc[i:i + tamanho] for i in range(0, len(registros), tamanho)]
+    return [registros[i:i + tamanho] for i in range(0, len(registros), tamanho)]
+
+
+def _inserir_lote(
+    supabase_client, tabela: str, lote: Registros, indice: int, max_tentativas: int, on_conflict: Optional[str] = None,
+) -> int:
+    """Insere (ou faz upsert de) um lote, repetindo com backoff exponencial as falhas em que isso é seguro.
+
+    Um upsert (`on_conflict`) é idempotente e pode ser repetido após qualquer
+    falha; um insert simples, só quando a requisição não chegou a ser enviada.
+    """
+    quantidade = len(lote)
+    # Serializa só na hora de enviar: apenas os lotes em voo ficam materializados
+    with metricas.etapa("serializacao"):
+        if isinstance(lote, pd.DataFrame):
+            corpo = serializar_registros(lote)
+        else:
+            corpo = json.dumps(lote, ensure_ascii=False).encode("utf-8")
+    for tentativa in range(1, max_tentativas + 1):
+        try:
+            with metricas.etapa("envio_lotes"):
+                _postar_json(supabase_client, tabela, corpo, on_conflict)
+            metricas.contar("lotes")
+            metricas.contar("registros_gravados", quantidade)
+            return quantidade
+        except Exception as e:
+            metricas.contar("falhas_de_lote")
+            if tentativa == max_tentativas or not (on_conflict or isinstance(e, ERROS_ANTES_DO_ENVIO)):
+                raise Exception(f"Falha ao inserir o lote {indice} em '{tabela}' após {tentativa} tentativa(s): {e}") from e
+            espera = BULK_RETRY_BACKOFF_S * (2 ** (tentativa - 1))
+            logger.warning(
+                f"[BulkWriter] Lote {indice} em '{tabela}' falhou (tentativa {tentativa}/{max_tentativas}): {e}. "
+                f"Nova tentativa em {espera:.1f}s."
+            )
+            time.sleep(espera)
+    return 0
+
+
+def inserir_em_lotes(
+    supabase_client,
+    tabela: str,
+    registros: Registros,
+    progresso: Optional[ProgressoRelatorio] = None,
+    tamanho_lote: Optional[int] = None,
+    max_concorrencia: Optional[int] = None,
+    max_tentativas: Optional[int] = None,
+    on_conflict: Optional[str] = None,
+) -> int:
+    """Insere `registros` (lista de dicts ou DataFrame) em `tabela` dividindo-os em lotes enviados em paralelo.
+
+    Com `on_conflict` (ex.: "serial_onu"), os lotes são gravados como upsert
+    sobre essa chave única. Cada lote é repetido com backoff quando a falha permite (ver
+    `_inserir_lote`); se algum lote falhar de vez, a exceção é propagada. Retorna o total de registros inseridos.
+    """
+    if len(registros) == 0:
+        return 0
+
+    tamanho_lote = tamanho_lote or BULK_CHUNK_SIZE
+    max_concorrencia = max_concorrencia or BULK_MAX_WORKERS
+    max_tentativas = max_tentativas or BULK_MAX_RETRIES
+
+    lotes = _dividir_em_lotes(registros, tamanho_lote)
+    logger.info(f"[BulkWriter] Inserindo {len(registros)} registros em '{tabela}' ({len(lotes)} lotes de até {tamanho_lote}).")
+
+    with metricas.etapa("insercao"):
+        inseridos = _enviar_lotes(supabase_client, tabela, lotes, progresso, max_concorrencia, max_tentativas, on_conflict)
+
+    logger.info(f"[BulkWriter] {inseridos} registros inseridos em '{tabela}'.")
+    return inseridos
+
+
+def _enviar_lotes(
+    supabase_client, tabela: str, lotes: List[Registros], progresso: Optional[ProgressoRelatorio],
+    max_concorrencia: int, max_tentativas: int, on_conflict: Optional[str],
+) -> int:
+    inseridos = 0
+    if len(lotes) == 1 or max_concorrencia <= 1:
+        for indice, lote in enumerate(lotes):
+            inseridos += _inserir_lote(supabase_client, tabela, lote, indice, max_tentativas, on_conflict)
+            if progresso:
+                progresso.avancar(len(lote))
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_concorrencia, len(lotes))) as executor:
+            futures = {
+                executor.submit(_inserir_lote, supabase_client, tabela, lote, indice, max_tentativas, on_conflict): lote
+                for indice, lote in enumerate(lotes)
+            }
+            try:
+                for future in as_completed(futures):
+                    quantidade = future.result()
+                    inseridos += quantidade
+                    if progresso:
+                        progresso.avancar(quantidade)
+            except Exception:
+                # Evita que os lotes ainda na fila sejam enviados após uma falha definitiva
+                for future in futures:
+                    future.cancel()
+                raise
+    return inseridos
@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from fastapi.encoders import jsonable_encoder
+
+logger = logging.getLogger(__name__)
+
+STATS_CACHE_TTL_S = float(os.getenv("STATS_CACHE_TTL", "300"))
+
+Carregador = Callable[[], Union[Any, Awaitable[Any]]]
+
+
+class CacheDeRespostas:
+    """Cache em memória de respostas JSON com TTL, ETag e coalescência de misses.
+
+    Requisições simultâneas para a mesma chave expirada aguardam uma única
+    carga (single-flight). `invalidar` é thread-safe e pode ser chamado de fora
+    do event loop (ex.: pelo despachante de jobs). Uma carga que estava em
+    andamento durante a invalidação não é armazenada.
+    """
+
+    def __init__(self, ttl: float = STATS_CACHE_TTL_S):
+        self.ttl = ttl
+        self._entradas: Dict[str, Tuple[bytes, str, float]] = {}
+        self._em_andamento: Dict[str, asyncio.Future] = {}
+        self._geracao = 0
+        self._lock = threading.Lock()
+
+    def _ler(self, chave: str) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return None
+            corpo, etag, expira_em = entrada
+            if time.monotonic() >= expira_em:
+                del self._entradas[chave]
+                return None
+            return corpo, etag
+
+    async def obter(self, chave: str, carregar: Carregador) -> Tuple[bytes, str]:
+        """Retorna (corpo JSON, ETag) da chave, chamando `carregar` apenas em caso de miss."""
+        if self.ttl > 0:
+            em_cache = self._ler(chave)
+            if em_cache is not None:
+                return em_cache
+
+        pendente = self._em_andamento.get(chave)
+        if pendente is not None:
+            return await asyncio.shield(pendente)
+
+        future = asyncio.get_running_loop().create_future()
+        self._em_andamento[chave] = future
+        with self._lock:
+            geracao = self._geracao
+        try:
+            valor = carregar()
+            if inspect.isawaitable(valor):
+                valor = await valor
+            corpo = json.dumps(jsonable_encoder(valor), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            etag = '"' + hashlib.sha1(corpo).hexdigest() + '"'
+            with self._lock:
+                if self.ttl > 0 and geracao == self._geracao:
+                    self._entradas[chave] = (corpo, etag, time.monotonic() + self.ttl)
+            future.set_result((corpo, etag))
+            return corpo, etag
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita o aviso de "exception was never retrieved" quando não há outros aguardando
+            future.exception()
+            raise
+        finally:
+            self._em_andamento.pop(chave, None)
+
+    def invalidar(self, prefixo: str = "") -> None:
+        """Descarta as entradas cuja chave começa com `prefixo` (todas, por padrão)."""
+        with self._lock:
+            self._geracao += 1
+            for chave in [c for c in self._entradas if c.startswith(prefixo)]:
+                del self._entradas[chave]
+        logger.info(f"[Cache] Entradas invalidadas (prefixo='{prefixo or '*'}').")
+
+
+def etag_corresponde(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidatos = {valor.strip().removeprefix("W/") for valor in if_none_match.split(",")}
+    return "*" in candidatos or etag in candidatos
@@ -0,0 +1,161 @@
+import base64
+import csv
+import io
+import json
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from .supabase_async import PostgrestAsync, eq, in_, literal
+
+# --- Configuração da listagem de clientes offline (GET /clients) ---
+CLIENTES_LIMITE_MAXIMO = int(os.getenv("CLIENTES_LIMITE_MAXIMO", "1000"))
+# Linhas buscadas por requisição ao PostgREST durante a exportação (NDJSON/CSV)
+CLIENTES_PAGINA_EXPORTACAO = int(os.getenv("CLIENTES_PAGINA_EXPORTACAO", "1000"))
+
+# Colunas aceitas em `ordenar_por`; `id` desempata, então a ordem é total e o cursor é estável.
+# Ver os índices em docs/migrations/005_clientes_off_indices.sql.
+COLUNAS_ORDENACAO = (
+    "horas_offline", "data_desconexao", "nome_cliente", "serial_onu", "cidade", "olt_regiao", "cto",
+    "motivo_desconexao", "rx_onu", "rx_olt", "id",
+)
+
+# Mesmas colunas e cabeçalhos da exportação feita antes pelo frontend
+COLUNAS_CSV = [
+    ("nome_cliente", "Nome Cliente"), ("serial_onu", "Serial ONU"), ("olt_regiao", "OLT/Região"), ("cto", "CTO"),
+    ("cidade", "Cidade"), ("horas_offline", "Horas Offline"), ("data_desconexao", "Data Desconexão"),
+    ("motivo_desconexao", "Motivo"), ("rx_onu", "RX ONU"), ("rx_olt", "RX OLT"), ("distancia_m", "Distância (m)"),
+]
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(linha: Dict[str, Any], ordenar_por: str) -> str:
+    """Cursor opaco com a posição da última linha da página (valor da ordenação e id)."""
+    posicao = [linha.get(ordenar_por), linha["id"]]
+    return base64.urlsafe_b64encode(json.dumps(posicao, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> Tuple[Any, int]:
+    try:
+        valor, ultimo_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return valor, int(ultimo_id)
+    except (ValueError, TypeError) as e:
+        raise CursorInvalido("Cursor inválido.") from e
+
+
+def _condicao_apos_cursor(ordenar_por: str, descendente: bool, cursor: str) -> str:
+    """Condição de keyset: linhas depois da posição do cursor, na ordem `ordenar_por, id` (nulos por último)."""
+    valor, ultimo_id = decodificar_cursor(cursor)
+    op = "lt" if descendente else "gt"
+    if ordenar_por == "id":
+        return f"id.{op}.{ultimo_id}"
+    if valor is None:
+        return f"and({ordenar_por}.is.null,id.{op}.{ultimo_id})"
+    return (
+        f"or({ordenar_por}.{op}.{literal(valor)},"
+        f"and({ordenar_por}.eq.{literal(valor)},id.{op}.{ultimo_id}),{ordenar_por}.is.null)"
+    )
+
+
+class ConsultaClientes:
+    """Filtros e ordenação de uma listagem de `clientes_off`, traduzidos para parâmetros do PostgREST."""
+
+    def __init__(
+        self,
+        cidade: Optional[Sequence[str]] = None,
+        olt_regiao: Optional[Sequence[str]] = None,
+        cto: Optional[Sequence[str]] = None,
+        motivo_desconexao: Optional[Sequence[str]] = None,
+        horas_min: Optional[int] = None,
+        horas_max: Optional[int] = None,
+        busca: Optional[str] = None,
+        ordenar_por: str = "horas_offline",
+        direcao: str = "desc",
+    ):
+        if ordenar_por not in COLUNAS_ORDENACAO:
+            raise ValueError(f"Não é possível ordenar por '{ordenar_por}'. Opções: {', '.join(COLUNAS_ORDENACAO)}.")
+        self.ordenar_por = ordenar_por
+        self.descendente = direcao == "desc"
+
+        self.filtros: Dict[str, str] = {}
+        for coluna, valores in (
+            ("cidade", cidade), ("olt_regiao", olt_regiao), ("cto", cto), ("motivo_desconexao", motivo_desconexao),
+        ):
+            if valores:
+                self.filtros[coluna] = eq(valores[0]) if len(valores) == 1 else in_(valores)
+
+        self.condicoes: List[str] = []
+        if horas_min is not None:
+            self.condicoes.append(f"horas_offline.gte.{horas_min}")
+        if horas_max is not None:
+            self.condicoes.append(f"horas_offline.lte.{horas_max}")
+        if busca:
+            termo = literal(f"*{busca}*")
+            self.condicoes.append(f"or(nome_cliente.ilike.{termo},serial_onu.ilike.{termo})")
+
+    @property
+    def ordem(self) -> str:
+        direcao = "desc" if self.descendente else "asc"
+        return f"{self.ordenar_por}.{direcao}.nullslast,id.{direcao}"
+
+    def parametros(self, cursor: Optional[str] = None) -> Dict[str, str]:
+        condicoes = list(self.condicoes)
+        if cursor:
+            condicoes.append(_condicao_apos_cursor(self.ordenar_por, self.descendente, cursor))
+        parametros = dict(self.filtros)
+        if condicoes:
+            parametros["and"] = "(" + ",".join(condicoes) + ")"
+        return parametros
+
+    async def pagina(
+        self, cliente: PostgrestAsync, limite: int, cursor: Optional[str] = None, colunas: str = "*",
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Uma página da listagem e o cursor da próxima (None na última)."""
+        # Uma linha a mais indica se há próxima página sem precisar contar
+        linhas = await cliente.select(
+            'clientes_off', colunas, self.parametros(cursor), ordem=self.ordem, limite=limite + 1, timeout=30,
+        )
+        if len(linhas) <= limite:
+            return linhas, None
+        linhas = linhas[:limite]
+        return linhas, codificar_cursor(linhas[-1], self.ordenar_por)
+
+    async def contar(self, cliente: PostgrestAsync) -> int:
+        return await cliente.contar('clientes_off', self.parametros(), timeout=30)
+
+    async def linhas(self, cliente: PostgrestAsync, cursor: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Todas as linhas a partir do cursor, buscadas em páginas: a memória não cresce com o resultado."""
+        while True:
+            pagina, cursor = await self.pagina(cliente, CLIENTES_PAGINA_EXPORTACAO, cursor)
+            for linha in pagina:
+                yield linha
+            if cursor is None:
+                return
+
+
+async def exportar_ndjson(consulta: ConsultaClientes, cliente: PostgrestAsync, cursor: Optional[str] = None) -> AsyncIterator[bytes]:
+    async for linha in consulta.linhas(cliente, cursor):
+        yield (json.dumps(linha, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+async def exportar_csv(consulta: ConsultaClientes, cliente: PostgrestAsync, cursor: Optional[str] = None) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    # BOM: o Excel só reconhece CSV em UTF-8 com ele
+    escritor.writerow([cabecalho for _, cabecalho in COLUNAS_CSV])
+    yield ("﻿" + buffer.getvalue()).encode("utf-8")
+    pendentes = 0
+    async for linha in consulta.linhas(cliente, cursor):
+        if pendentes == 0:
+            buffer.seek(0)
+            buffer.truncate()
+        escritor.writerow(["" if linha.get(coluna) is None else linha[coluna] for coluna, _ in COLUNAS_CSV])
+        pendentes += 1
+        # Agrupa as linhas em blocos para não emitir um pedaço HTTP por linha
+        if pendentes == CLIENTES_PAGINA_EXPORTACAO:
+            yield buffer.getvalue().encode("utf-8")
+            pendentes = 0
+    if pendentes:
+        yield buffer.getvalue().encode("utf-8")
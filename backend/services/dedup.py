@@ -0,0 +1,204 @@
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+import pandas as pd
+
+from .ingestion import UPLOAD_SPOOL_DIR
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração da deduplicação de uploads ---
+# Mesmo arquivo SQLite da fila de jobs, por padrão (tabela própria)
+DEDUP_DB_PATH = os.getenv("DEDUP_DB_PATH") or os.getenv("JOBS_DB_PATH") or os.path.join(UPLOAD_SPOOL_DIR, "jobs.sqlite3")
+# Cópia colunar (Parquet) de cada upload, para reprocessar sem reler o Excel/CSV. Exige `pyarrow`.
+PARQUET_DISPONIVEL = importlib.util.find_spec("pyarrow") is not None
+UPLOAD_ARTEFATOS_PARQUET = os.getenv("UPLOAD_ARTEFATOS_PARQUET", "0").lower() in ("1", "true", "sim")
+ARTEFATOS_DIR = os.getenv("UPLOAD_ARTEFATOS_DIR") or os.path.join(UPLOAD_SPOOL_DIR, "artefatos")
+
+# Travas por faixa de hash: dois envios simultâneos do mesmo arquivo não criam dois relatórios
+_TRAVAS = [asyncio.Lock() for _ in range(64)]
+
+
+@contextmanager
+def _conectar():
+    os.makedirs(os.path.dirname(DEDUP_DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(DEDUP_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def inicializar_banco() -> None:
+    with _conectar() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS uploads (
+                sha256 TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                relatorio_id INTEGER NOT NULL,
+                nome_arquivo TEXT NOT NULL,
+                colunas TEXT,
+                artefato TEXT,
+                criado_em REAL NOT NULL,
+                PRIMARY KEY (sha256, tipo)
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_uploads_relatorio ON uploads (relatorio_id)")
+
+
+def trava(sha256: str) -> asyncio.Lock:
+    return _TRAVAS[int(sha256[:8], 16) % len(_TRAVAS)]
+
+
+def buscar(sha256: str, tipo: str) -> Optional[sqlite3.Row]:
+    with _conectar() as conn:
+        return conn.execute("SELECT * FROM uploads WHERE sha256 = ? AND tipo = ?", (sha256, tipo)).fetchone()
+
+
+def buscar_por_relatorio(relatorio_id: int) -> Optional[sqlite3.Row]:
+    with _conectar() as conn:
+        return conn.execute("SELECT * FROM uploads WHERE relatorio_id = ?", (relatorio_id,)).fetchone()
+
+
+def registrar(sha256: str, tipo: str, relatorio_id: int, nome_arquivo: str) -> None:
+    """Associa o conteúdo ao relatório. Uma entrada antiga (ex.: de um relatório que falhou) é
+    reapontada, preservando layout e artefato já conhecidos."""
+    with _conectar() as conn:
+        conn.execute(
+            "INSERT INTO uploads (sha256, tipo, relatorio_id, nome_arquivo, criado_em) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (sha256, tipo) DO UPDATE SET relatorio_id = excluded.relatorio_id, "
+            "nome_arquivo = excluded.nome_arquivo, criado_em = excluded.criado_em",
+            (sha256, tipo, relatorio_id, nome_arquivo, time.time()),
+        )
+
+
+def esquecer(tipo: Optional[str] = None, relatorio_ids: Optional[List[int]] = None) -> int:
+    """Remove entradas do índice (e seus artefatos), para que o mesmo arquivo volte a ser processado."""
+    condicoes, params = [], []
+    if tipo is not None:
+        condicoes.append("tipo = ?")
+        params.append(tipo)
+    if relatorio_ids is not None:
+        condicoes.append(f"relatorio_id IN ({','.join('?' * len(relatorio_ids))})")
+        params.extend(relatorio_ids)
+    where = " WHERE " + " AND ".join(condicoes) if condicoes else ""
+    with _conectar() as conn:
+        artefatos = [row["artefato"] for row in conn.execute(f"SELECT artefato FROM uploads{where}", params)]
+        removidas = conn.execute(f"DELETE FROM uploads{where}", params).rowcount
+    for artefato in filter(None, artefatos):
+        _remover_artefato(artefato)
+    return removidas
+
+
+def _remover_artefato(caminho: str) -> None:
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"[Dedup] Não foi possível remover o artefato {caminho}: {e}")
+
+
+def preparar_reprocessamento(relatorio_id: int) -> Optional[str]:
+    """Cria no spool uma cópia do artefato Parquet do relatório e retorna seu caminho (None se não houver).
+
+    O worker remove o arquivo que processa; por isso o artefato não é usado diretamente.
+    """
+    entrada = buscar_por_relatorio(relatorio_id)
+    if entrada is None or not entrada["artefato"] or not os.path.exists(entrada["artefato"]):
+        return None
+    fd, caminho = tempfile.mkstemp(prefix="reprocessar_", suffix=".parquet", dir=UPLOAD_SPOOL_DIR)
+    os.close(fd)
+    os.remove(caminho)
+    try:
+        os.link(entrada["artefato"], caminho)
+    except OSError:
+        shutil.copyfile(entrada["artefato"], caminho)
+    return caminho
+
+
+class CapturaDoUpload:
+    """Acompanha os chunks lidos de um upload no worker.
+
+    Registra o layout de colunas no índice e, se habilitado, grava os chunks
+    brutos (como texto, igual à leitura dos CSVs) num Parquet, que passa a ser
+    o artefato do upload.
+    """
+
+    def __init__(self, relatorio_id: int, gravar_artefato: bool = True):
+        self.relatorio_id = relatorio_id
+        self.colunas: Optional[List[str]] = None
+        self._entrada = buscar_por_relatorio(relatorio_id)
+        self._writer = None
+        self._destino = None
+        self._temporario = None
+        artefato_existente = self._entrada is not None and self._entrada["artefato"] and os.path.exists(self._entrada["artefato"])
+        if (
+            gravar_artefato and UPLOAD_ARTEFATOS_PARQUET and PARQUET_DISPONIVEL
+            and self._entrada is not None and not artefato_existente
+        ):
+            os.makedirs(ARTEFATOS_DIR, exist_ok=True)
+            self._destino = os.path.join(ARTEFATOS_DIR, f"{self._entrada['sha256']}_{self._entrada['tipo']}.parquet")
+            self._temporario = self._destino + ".tmp"
+
+    @property
+    def grava_artefato(self) -> bool:
+        return self._temporario is not None
+
+    def observar(self, chunk: pd.DataFrame) -> None:
+        if self.colunas is None:
+            self.colunas = [str(c) for c in chunk.columns]
+        if self._temporario is None:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Tudo como texto: o mesmo schema em todos os chunks, como na leitura dos CSVs
+        tabela = pa.table({
+            str(coluna): pa.array(chunk[coluna].astype(str).where(chunk[coluna].notna(), None), type=pa.string())
+            for coluna in chunk.columns
+        })
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._temporario, tabela.schema, compression="zstd")
+        self._writer.write_table(tabela)
+
+    def concluir(self) -> None:
+        # Falhas aqui não invalidam o relatório, que já foi gravado
+        try:
+            artefato = None
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+                os.replace(self._temporario, self._destino)
+                artefato = self._destino
+                logger.info(f"[Dedup] Artefato Parquet gravado para o relatório ID={self.relatorio_id}: {artefato}")
+            if self._entrada is None:
+                return
+            with _conectar() as conn:
+                conn.execute(
+                    "UPDATE uploads SET colunas = ?, artefato = COALESCE(?, artefato) WHERE relatorio_id = ?",
+                    (json.dumps(self.colunas, ensure_ascii=False) if self.colunas is not None else None, artefato, self.relatorio_id),
+                )
+        except Exception as e:
+            logger.warning(f"[Dedup] Não foi possível registrar o layout/artefato do relatório ID={self.relatorio_id}: {e}")
+            self.descartar()
+
+    def descartar(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._temporario:
+            _remover_artefato(self._temporario)
@@ -0,0 +1,331 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+import httpx
+import pandas as pd
+
+from . import metricas
+from .ingestion import UPLOAD_SPOOL_DIR
+from .processors.helpers import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração da integração com o ERP ---
+# Contrato esperado do ERP (caminhos configuráveis):
+#   GET  {ERP_API_URL}{ERP_CAMINHO_BUSCA}?nome=<nome>  -> [{"id": 123, "nome": "..."}]  (lista vazia: não encontrado)
+#   POST {ERP_API_URL}{ERP_CAMINHO_BUSCA_LOTE}  {"nomes": [...]}  -> {"<nome>": {"id": 123, "nome": "..."} | null}
+# A busca em lote é opcional: vazia, ou se o ERP responder 404/405/501, cada nome vira uma requisição.
+ERP_API_URL = os.getenv("ERP_API_URL", "")
+ERP_API_TOKEN = os.getenv("ERP_API_TOKEN")
+ERP_CAMINHO_BUSCA = os.getenv("ERP_CAMINHO_BUSCA", "/clientes")
+ERP_CAMINHO_BUSCA_LOTE = os.getenv("ERP_CAMINHO_BUSCA_LOTE", "/clientes/busca")
+ERP_TAMANHO_LOTE = int(os.getenv("ERP_TAMANHO_LOTE", "100"))
+ERP_HTTP_TIMEOUT_S = float(os.getenv("ERP_HTTP_TIMEOUT", "10"))
+ERP_MAX_CONEXOES = int(os.getenv("ERP_MAX_CONEXOES", "20"))
+# Requisições simultâneas e por segundo ao ERP (0 = sem limite de taxa)
+ERP_CONCORRENCIA = int(os.getenv("ERP_CONCORRENCIA", "8"))
+ERP_REQUISICOES_POR_SEGUNDO = float(os.getenv("ERP_REQUISICOES_POR_SEGUNDO", "20"))
+ERP_MAX_TENTATIVAS = int(os.getenv("ERP_MAX_TENTATIVAS", "3"))
+
+# Cache persistente nome -> client_id. Nomes não encontrados também ficam em cache, por menos tempo.
+ERP_CACHE_DB_PATH = os.getenv("ERP_CACHE_DB_PATH") or os.getenv("JOBS_DB_PATH") or os.path.join(UPLOAD_SPOOL_DIR, "jobs.sqlite3")
+ERP_CACHE_TTL_S = float(os.getenv("ERP_CACHE_TTL_S", str(7 * 24 * 3600)))
+ERP_CACHE_TTL_NEGATIVO_S = float(os.getenv("ERP_CACHE_TTL_NEGATIVO_S", str(6 * 3600)))
+
+# Preenche `clientes_off.erp_client_id` durante a ingestão de desconexão (ver docs/migrations/006_clientes_off_erp.sql)
+ERP_ENRIQUECER_DESCONEXAO = os.getenv("ERP_ENRIQUECER_DESCONEXAO", "0").lower() in ("1", "true", "sim")
+
+# Limite de variáveis por consulta do SQLite
+_LOTE_SQLITE = 500
+# Status que indicam que o ERP não oferece a busca em lote
+_SEM_BUSCA_EM_LOTE = (404, 405, 501)
+
+
+class ErroErp(Exception):
+    """Falha ao consultar o ERP (indisponível, sem autorização ou resposta inesperada)."""
+
+
+def chave_do_nome(nome: str) -> str:
+    """Chave de busca/cache: sem acentos, minúsculas e com espaços repetidos colapsados."""
+    return normalize_text(" ".join(str(nome).split()))
+
+
+# --- Cache (SQLite local, compartilhado pela API e pelos workers) ---
+@contextmanager
+def _conectar():
+    os.makedirs(os.path.dirname(ERP_CACHE_DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(ERP_CACHE_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def inicializar_banco() -> None:
+    with _conectar() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS erp_clientes (
+                chave TEXT PRIMARY KEY,
+                client_id INTEGER,
+                client_name TEXT,
+                expira_em REAL NOT NULL
+            )
+            """
+        )
+
+
+def ler_cache(chaves: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Entradas válidas do cache: chave -> cliente, ou None para nomes sabidamente inexistentes no ERP."""
+    chaves = list(chaves)
+    encontrados: Dict[str, Optional[Dict[str, Any]]] = {}
+    agora = time.time()
+    with _conectar() as conn:
+        for inicio in range(0, len(chaves), _LOTE_SQLITE):
+            parte = chaves[inicio:inicio + _LOTE_SQLITE]
+            linhas = conn.execute(
+                f"SELECT * FROM erp_clientes WHERE expira_em > ? AND chave IN ({','.join('?' * len(parte))})",
+                (agora, *parte),
+            ).fetchall()
+            for linha in linhas:
+                encontrados[linha["chave"]] = (
+                    None if linha["client_id"] is None
+                    else {"client_id": linha["client_id"], "client_name": linha["client_name"]}
+                )
+    return encontrados
+
+
+def gravar_cache(resultados: Dict[str, Optional[Dict[str, Any]]]) -> None:
+    agora = time.time()
+    with _conectar() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO erp_clientes (chave, client_id, client_name, expira_em) VALUES (?, ?, ?, ?)",
+            [
+                (chave, None, None, agora + ERP_CACHE_TTL_NEGATIVO_S) if cliente is None
+                else (chave, cliente["client_id"], cliente["client_name"], agora + ERP_CACHE_TTL_S)
+                for chave, cliente in resultados.items()
+            ],
+        )
+
+
+# --- Cliente HTTP ---
+class _LimiteDeTaxa:
+    """Espaça o início das requisições para no máximo `por_segundo` por segundo."""
+
+    def __init__(self, por_segundo: float):
+        self.intervalo = 1 / por_segundo if por_segundo > 0 else 0
+        self._proximo = 0.0
+        self._lock = asyncio.Lock()
+
+    async def aguardar(self) -> None:
+        if not self.intervalo:
+            return
+        async with self._lock:
+            agora = time.monotonic()
+            espera = self._proximo - agora
+            self._proximo = max(agora, self._proximo) + self.intervalo
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+def _cliente_da_resposta(dados: Any, chave: str) -> Optional[Dict[str, Any]]:
+    """Cliente de uma resposta do ERP; numa lista, prefere o nome idêntico ao buscado."""
+    if isinstance(dados, list):
+        if not dados:
+            return None
+        dados = next((d for d in dados if chave_do_nome(d.get("nome", "")) == chave), dados[0])
+    if not dados:
+        return None
+    return {"client_id": int(dados["id"]), "client_name": dados.get("nome") or ""}
+
+
+class ClienteErp:
+    """Busca clientes no ERP pelo nome, com cache persistente, concorrência e taxa limitadas.
+
+    Mantém um único `httpx.AsyncClient` (pool de conexões com keep-alive).
+    Deve ser criado e usado dentro do mesmo event loop. `transport` permite
+    apontar para um ERP falso em testes (ver também benchmarks/bench_erp.py).
+    """
+
+    def __init__(
+        self,
+        url: str = ERP_API_URL,
+        token: Optional[str] = ERP_API_TOKEN,
+        concorrencia: int = ERP_CONCORRENCIA,
+        requisicoes_por_segundo: float = ERP_REQUISICOES_POR_SEGUNDO,
+        tamanho_lote: int = ERP_TAMANHO_LOTE,
+        usar_cache: bool = True,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.tamanho_lote = tamanho_lote if ERP_CAMINHO_BUSCA_LOTE else 0
+        self.usar_cache = usar_cache
+        self._semaforo = asyncio.Semaphore(concorrencia)
+        self._limite = _LimiteDeTaxa(requisicoes_por_segundo)
+        self._client = httpx.AsyncClient(
+            base_url=url.rstrip("/"),
+            headers={"Authorization": f"Bearer {token}"} if token else {},
+            timeout=ERP_HTTP_TIMEOUT_S,
+            limits=httpx.Limits(max_connections=ERP_MAX_CONEXOES, max_keepalive_connections=ERP_MAX_CONEXOES),
+            transport=transport,
+        )
+
+    async def fechar(self) -> None:
+        await self._client.aclose()
+
+    async def _requisitar(self, metodo: str, caminho: str, **kwargs) -> httpx.Response:
+        for tentativa in range(1, ERP_MAX_TENTATIVAS + 1):
+            async with self._semaforo:
+                await self._limite.aguardar()
+                try:
+                    resposta = await self._client.request(metodo, caminho, **kwargs)
+                except httpx.TransportError as e:
+                    erro, espera = ErroErp(f"ERP indisponível: {e}"), 2 ** (tentativa - 1)
+                else:
+                    if resposta.status_code != 429 and resposta.status_code < 500:
+                        return resposta
+                    erro = ErroErp(f"ERP respondeu {resposta.status_code}.")
+                    retry_after = resposta.headers.get("retry-after", "")
+                    espera = float(retry_after) if retry_after.isdigit() else 2 ** (tentativa - 1)
+            if tentativa < ERP_MAX_TENTATIVAS:
+                logger.warning(f"[ERP] {erro} Tentativa {tentativa}/{ERP_MAX_TENTATIVAS}; nova tentativa em {espera:.0f}s.")
+                await asyncio.sleep(espera)
+        raise erro
+
+    async def _buscar_um(self, nome: str) -> Optional[Dict[str, Any]]:
+        resposta = await self._requisitar("GET", ERP_CAMINHO_BUSCA, params={"nome": nome})
+        if resposta.status_code == 404:
+            return None
+        if resposta.is_error:
+            raise ErroErp(f"ERP respondeu {resposta.status_code}: {resposta.text[:200]}")
+        return _cliente_da_resposta(resposta.json(), chave_do_nome(nome))
+
+    async def _buscar_lote(self, nomes: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        if self.tamanho_lote > 1 and len(nomes) > 1:
+            resposta = await self._requisitar("POST", ERP_CAMINHO_BUSCA_LOTE, json={"nomes": nomes})
+            if resposta.status_code in _SEM_BUSCA_EM_LOTE:
+                logger.info("[ERP] O ERP não oferece busca em lote; consultando nome a nome.")
+                self.tamanho_lote = 0
+            elif resposta.is_error:
+                raise ErroErp(f"ERP respondeu {resposta.status_code}: {resposta.text[:200]}")
+            else:
+                dados = resposta.json()
+                return {nome: _cliente_da_resposta(dados.get(nome), chave_do_nome(nome)) for nome in nomes}
+        clientes = await asyncio.gather(*(self._buscar_um(nome) for nome in nomes))
+        return dict(zip(nomes, clientes))
+
+    async def buscar_muitos(self, nomes: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Chave de cada nome (ver `chave_do_nome`) -> cliente, ou None se o ERP não o conhece.
+
+        Nomes repetidos geram uma única consulta, e os já em cache nenhuma. Se
+        parte das consultas falhar, os nomes afetados ficam fora do resultado
+        (e do cache); se todas falharem, levanta `ErroErp`.
+        """
+        # Um nome original por chave: é ele que vai para o ERP
+        por_chave = {}
+        for nome in nomes:
+            if isinstance(nome, str) and nome.strip():
+                por_chave.setdefault(chave_do_nome(nome), nome.strip())
+        resultados = await asyncio.to_thread(ler_cache, por_chave) if self.usar_cache else {}
+        metricas.contar("erp_cache_acertos", len(resultados))
+
+        pendentes = [nome for chave, nome in por_chave.items() if chave not in resultados]
+        if not pendentes:
+            return resultados
+        tamanho = max(self.tamanho_lote, 1)
+        lotes = [pendentes[i:i + tamanho] for i in range(0, len(pendentes), tamanho)]
+        respostas = await asyncio.gather(*(self._buscar_lote(lote) for lote in lotes), return_exceptions=True)
+
+        novos: Dict[str, Optional[Dict[str, Any]]] = {}
+        falhas = [r for r in respostas if isinstance(r, BaseException)]
+        for resposta in respostas:
+            if not isinstance(resposta, BaseException):
+                novos.update((chave_do_nome(nome), cliente) for nome, cliente in resposta.items())
+        metricas.contar("erp_consultas", len(novos))
+        if falhas:
+            if not novos:
+                raise falhas[0] if isinstance(falhas[0], ErroErp) else ErroErp(str(falhas[0]))
+            logger.warning(f"[ERP] {len(falhas)} de {len(lotes)} consultas falharam; os nomes afetados ficam sem client_id.")
+        if self.usar_cache and novos:
+            await asyncio.to_thread(gravar_cache, novos)
+        resultados.update(novos)
+        return resultados
+
+    async def buscar(self, nome: str) -> Optional[Dict[str, Any]]:
+        """O cliente com este nome, ou None se o ERP não o conhece. Levanta `ErroErp` se o ERP falhar."""
+        return (await self.buscar_muitos([nome])).get(chave_do_nome(nome))
+
+
+# --- Enriquecimento na ingestão (roda no worker do relatório) ---
+class EnriquecimentoErp:
+    """Um `ClienteErp` e um event loop para o relatório inteiro, reaproveitados a cada chunk.
+
+    Assim o pool de conexões, a concorrência e o limite de taxa valem para o
+    job todo, e não para cada chunk isoladamente. Deve ser fechado com `fechar`.
+    """
+
+    def __init__(self, **opcoes_cliente):
+        inicializar_banco()
+        self._runner = asyncio.Runner()
+        self._cliente = self._runner.run(self._criar_cliente(opcoes_cliente))
+
+    @staticmethod
+    async def _criar_cliente(opcoes_cliente: Dict[str, Any]) -> ClienteErp:
+        # Criado já dentro do loop em que será usado
+        return ClienteErp(**opcoes_cliente)
+
+    def buscar_muitos(self, nomes: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        return self._runner.run(self._cliente.buscar_muitos(nomes))
+
+    def fechar(self) -> None:
+        try:
+            self._runner.run(self._cliente.fechar())
+        finally:
+            self._runner.close()
+
+
+def obter_enriquecimento(contexto: Optional[dict]) -> Optional[EnriquecimentoErp]:
+    """Reaproveita o cliente do ERP do relatório entre chunks (guardado em `contexto` e fechado ao fim do job)."""
+    if contexto is None:
+        return None
+    if "erp" not in contexto:
+        contexto["erp"] = EnriquecimentoErp()
+        contexto.setdefault("ao_encerrar", []).append(contexto["erp"].fechar)
+    return contexto["erp"]
+
+
+def enriquecer_com_erp(
+    df: pd.DataFrame, coluna_nome: str = "nome_cliente", coluna_id: str = "erp_client_id",
+    sessao: Optional[EnriquecimentoErp] = None,
+) -> pd.DataFrame:
+    """Cópia de `df` com `coluna_id` preenchida pelo client_id do ERP (nulo se não encontrado ou se o ERP falhar).
+
+    Cada nome distinto é consultado uma vez; os já conhecidos vêm do cache.
+    Sem `sessao` (ver `obter_enriquecimento`), usa um cliente só para esta chamada.
+    """
+    nomes = df[coluna_nome].dropna().unique().tolist()
+    clientes = {}
+    if nomes:
+        propria = sessao is None
+        sessao = sessao or EnriquecimentoErp()
+        try:
+            with metricas.etapa("enriquecimento_erp"):
+                clientes = sessao.buscar_muitos(nomes)
+        except ErroErp as e:
+            # O ERP fora do ar não impede a ingestão; o botão "Abrir Atendimento" ainda busca sob demanda
+            logger.warning(f"[ERP] Enriquecimento ignorado: {e}")
+        finally:
+            if propria:
+                sessao.fechar()
+    por_nome = {}
+    for nome in nomes:
+        cliente = clientes.get(chave_do_nome(nome)) if isinstance(nome, str) else None
+        if cliente is not None:
+            por_nome[nome] = cliente["client_id"]
+    return df.assign(**{coluna_id: df[coluna_nome].map(por_nome).astype("Int64")})
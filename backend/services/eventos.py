@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, Dict, Iterable, List, Optional, Set
+
+from . import jobs
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração dos eventos em tempo real (GET /eventos, Server-Sent Events) ---
+# Intervalo entre duas leituras da fila local de jobs, enquanto houver alguém conectado
+EVENTOS_INTERVALO_S = float(os.getenv("EVENTOS_INTERVALO_S", "0.5"))
+# Comentário enviado periodicamente para manter a conexão aberta através de proxies
+EVENTOS_HEARTBEAT_S = float(os.getenv("EVENTOS_HEARTBEAT_S", "15"))
+# Eventos pendentes por conexão; um cliente lento perde os mais antigos, não trava os demais
+EVENTOS_FILA_MAXIMA = 100
+
+EVENTO_RELATORIO = "relatorio"
+EVENTO_STATS = "stats"
+
+DETALHE_CANCELADO = "Processamento cancelado pelo usuário."
+
+
+def estado_do_job(job) -> Dict[str, Any]:
+    """Payload de um evento `relatorio` a partir de uma linha da fila de jobs."""
+    detalhes_erro = job["erro"]
+    if job["status"] == jobs.CANCELLED and not detalhes_erro:
+        detalhes_erro = DETALHE_CANCELADO
+    return {
+        "relatorio_id": job["relatorio_id"],
+        "tipo": job["tipo"],
+        "status": job["status"],
+        "progresso": 100 if job["status"] == jobs.COMPLETED else job["progresso"],
+        "registros_processados": job["registros_processados"],
+        "detalhes_erro": detalhes_erro if job["status"] in (jobs.FAILED, jobs.CANCELLED) else None,
+    }
+
+
+def formatar_sse(evento: str, dados: Any) -> bytes:
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+class _Assinatura:
+    def __init__(self, relatorio_ids: Optional[Set[int]]):
+        self.relatorio_ids = relatorio_ids
+        self.fila: asyncio.Queue = asyncio.Queue(maxsize=EVENTOS_FILA_MAXIMA)
+
+    def interessa(self, evento: str, dados: Dict[str, Any]) -> bool:
+        return evento != EVENTO_RELATORIO or self.relatorio_ids is None or dados["relatorio_id"] in self.relatorio_ids
+
+    def entregar(self, mensagem: bytes) -> None:
+        if self.fila.full():
+            self.fila.get_nowait()
+        self.fila.put_nowait(mensagem)
+
+
+class CanalDeEventos:
+    """Difunde o ciclo de vida dos relatórios e as estatísticas atualizadas para as conexões abertas.
+
+    Uma única tarefa lê da fila local de jobs (SQLite) só as linhas alteradas
+    desde a última leitura, e só enquanto houver conexões, e repassa cada
+    mudança a todas elas. Assim o custo não cresce com o número de operadores
+    acompanhando o processamento, ao contrário do polling de
+    /relatorios/status e /stats, em que cada cliente gerava consultas ao
+    Supabase.
+    """
+
+    def __init__(self, intervalo: float = EVENTOS_INTERVALO_S):
+        self.intervalo = intervalo
+        self._assinaturas: Set[_Assinatura] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tarefa: Optional[asyncio.Task] = None
+        self._ha_assinantes = asyncio.Event()
+        self._ultima_leitura = time.time()
+        # Jobs já publicados com `atualizado_em` igual a `_ultima_leitura`: outro job atualizado
+        # no mesmo instante ainda precisa sair, mas esses não devem sair de novo
+        self._publicados_no_instante: Set[int] = set()
+
+    def iniciar(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._ha_assinantes = asyncio.Event()
+        self._ultima_leitura = time.time()
+        self._publicados_no_instante = set()
+        self._tarefa = asyncio.create_task(self._acompanhar_jobs())
+
+    async def parar(self) -> None:
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+
+    @property
+    def conexoes(self) -> int:
+        return len(self._assinaturas)
+
+    def publicar(self, evento: str, dados: Dict[str, Any]) -> None:
+        mensagem = formatar_sse(evento, dados)
+        for assinatura in self._assinaturas:
+            if assinatura.interessa(evento, dados):
+                assinatura.entregar(mensagem)
+
+    def executar(self, corrotina: Coroutine) -> None:
+        """Agenda `corrotina` no event loop da API; pode ser chamado de qualquer thread (ex.: despachante de jobs)."""
+        if self._loop is None or self._loop.is_closed():
+            corrotina.close()
+            return
+        asyncio.run_coroutine_threadsafe(corrotina, self._loop)
+
+    async def sincronizar(self) -> None:
+        """Publica as mudanças da fila de jobs desde a última leitura."""
+        try:
+            alterados = await asyncio.to_thread(jobs.listar_alterados_desde, self._ultima_leitura)
+        except Exception as e:
+            logger.error(f"[Eventos] Erro ao ler a fila de jobs: {e}", exc_info=True)
+            return
+        for job in alterados:
+            if job["atualizado_em"] < self._ultima_leitura:
+                continue
+            if job["atualizado_em"] > self._ultima_leitura:
+                self._ultima_leitura = job["atualizado_em"]
+                self._publicados_no_instante = set()
+            elif job["relatorio_id"] in self._publicados_no_instante:
+                continue
+            self._publicados_no_instante.add(job["relatorio_id"])
+            self.publicar(EVENTO_RELATORIO, estado_do_job(job))
+
+    async def _acompanhar_jobs(self) -> None:
+        while True:
+            await self._ha_assinantes.wait()
+            await self.sincronizar()
+            await asyncio.sleep(self.intervalo)
+
+    async def assinar(
+        self,
+        relatorio_ids: Optional[Iterable[int]] = None,
+        carregar_iniciais: Optional[Callable[[], Awaitable[List[bytes]]]] = None,
+    ) -> AsyncIterator[bytes]:
+        """Corpo de uma resposta SSE: o estado inicial, depois os eventos (só dos relatórios pedidos, se houver).
+
+        O estado inicial é carregado depois de a conexão passar a receber eventos,
+        para que nenhuma mudança entre as duas coisas se perca.
+        """
+        assinatura = _Assinatura(set(relatorio_ids) if relatorio_ids else None)
+        if not self._assinaturas:
+            # Mudanças anteriores à primeira conexão já estão no estado inicial de cada cliente
+            self._ultima_leitura = time.time()
+            self._publicados_no_instante = set()
+        self._assinaturas.add(assinatura)
+        self._ha_assinantes.set()
+        try:
+            # Reconexão automática do EventSource em 3s se a conexão cair
+            yield b"retry: 3000\n\n"
+            if carregar_iniciais is not None:
+                for mensagem in await carregar_iniciais():
+                    yield mensagem
+            while True:
+                try:
+                    yield await asyncio.wait_for(assinatura.fila.get(), timeout=EVENTOS_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+        finally:
+            self._assinaturas.discard(assinatura)
+            if not self._assinaturas:
+                self._ha_assinantes.clear()
@@ -0,0 +1,428 @@
+import codecs
+import csv
+import hashlib
+import importlib.util
+import logging
+import os
+import shutil
+import tempfile
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from . import metricas
+from .processors.helpers import converter_tipos, resolver_layout
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração da ingestão em streaming ---
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or tempfile.gettempdir()
+UPLOAD_READ_BLOCK_BYTES = 1024 * 1024
+INGESTION_CHUNK_ROWS = int(os.getenv("INGESTION_CHUNK_ROWS", "50000"))
+
+# Amostra usada para detectar separador e encoding dos CSVs
+CSV_SAMPLE_BYTES = 64 * 1024
+CSV_CANDIDATE_SEPARATORS = ",;\t|"
+
+EXTENSOES_SUPORTADAS = ('.xlsx', '.xls', '.csv')
+
+# Leitor das planilhas: "auto" usa o calamine (Rust, via `python-calamine`) quando
+# instalado e cai para o openpyxl/xlrd se ele não estiver disponível ou falhar ao abrir o arquivo.
+INGESTION_XLSX_ENGINE = os.getenv("INGESTION_XLSX_ENGINE", "auto").strip().lower()
+CALAMINE_DISPONIVEL = importlib.util.find_spec("python_calamine") is not None
+
+Aliases = Optional[Dict[str, List[str]]]
+Tipos = Optional[Dict[str, str]]
+# Filtro de linhas declarado pelo processador: recebe o chunk (já com os nomes
+# do DB) e devolve a máscara das linhas a manter, ou None para manter todas.
+FiltroLinhas = Optional[Callable[[pd.DataFrame], Optional[pd.Series]]]
+
+
+async def salvar_upload_em_disco(file) -> Tuple[str, str]:
+    """Grava o `UploadFile` em um arquivo temporário, bloco a bloco, e retorna (caminho, sha256 do conteúdo).
+
+    Evita manter o upload inteiro em memória; o hash é calculado durante a
+    cópia, sem reler o arquivo. Quem chama é responsável por remover o
+    arquivo (ver `remover_arquivo`).
+    """
+    sha256 = hashlib.sha256()
+    extensao = os.path.splitext(file.filename or "")[1].lower()
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    fd, caminho = tempfile.mkstemp(prefix="upload_", suffix=extensao, dir=UPLOAD_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as destino:
+            while True:
+                bloco = await file.read(UPLOAD_READ_BLOCK_BYTES)
+                if not bloco:
+                    break
+                destino.write(bloco)
+                sha256.update(bloco)
+    except Exception:
+        remover_arquivo(caminho)
+        raise
+    return caminho, sha256.hexdigest()
+
+
+def remover_arquivo(caminho: Optional[str]) -> None:
+    """Remove um arquivo do spool, ou o diretório inteiro de um envio em lote."""
+    if not caminho:
+        return
+    try:
+        if os.path.isdir(caminho):
+            shutil.rmtree(caminho)
+        else:
+            os.remove(caminho)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"[Ingestão] Não foi possível remover o arquivo temporário {caminho}: {e}")
+
+
+def _utf8_valido(caminho: str) -> bool:
+    """Confere o arquivo inteiro como UTF-8, bloco a bloco; blocos só com ASCII não chegam a ser decodificados."""
+    decodificador = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(caminho, "rb") as f:
+            while True:
+                bloco = f.read(UPLOAD_READ_BLOCK_BYTES)
+                if not bloco:
+                    break
+                # Sem bytes pendentes de um caractere cortado no bloco anterior, ASCII é sempre UTF-8 válido
+                if bloco.isascii() and not decodificador.getstate()[0]:
+                    continue
+                decodificador.decode(bloco)
+        decodificador.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def detectar_formato_csv(caminho: str) -> Tuple[str, str]:
+    """Detecta (separador, encoding) de um CSV.
+
+    O separador vem de uma amostra do início do arquivo; o UTF-8 é confirmado
+    no arquivo inteiro, já que um export latin-1 pode ter o primeiro acento
+    só depois da amostra.
+    """
+    with open(caminho, "rb") as f:
+        amostra_bytes = f.read(CSV_SAMPLE_BYTES)
+
+    encoding = "utf-8-sig"
+    try:
+        amostra = amostra_bytes.decode(encoding)
+    except UnicodeDecodeError as e:
+        # Um caractere multibyte pode ter sido cortado no fim da amostra
+        if e.start < len(amostra_bytes) - 4:
+            encoding = "latin-1"
+        amostra = amostra_bytes.decode(encoding, errors="ignore")
+    if encoding == "utf-8-sig" and not _utf8_valido(caminho):
+        encoding = "latin-1"
+
+    linhas = amostra.splitlines()
+    if len(amostra_bytes) == CSV_SAMPLE_BYTES and len(linhas) > 1:
+        linhas = linhas[:-1]  # Descarta a última linha, possivelmente incompleta
+    amostra = "\n".join(linhas)
+
+    try:
+        separador = csv.Sniffer().sniff(amostra, delimiters=CSV_CANDIDATE_SEPARATORS).delimiter
+    except csv.Error:
+        cabecalho = linhas[0] if linhas else ""
+        separador = max(CSV_CANDIDATE_SEPARATORS, key=cabecalho.count)
+        if not cabecalho.count(separador):
+            separador = ","
+
+    logger.info(f"[Ingestão] CSV detectado | separador={separador!r}, encoding={encoding}")
+    return separador, encoding
+
+
+def estimar_total_linhas(caminho: str) -> Optional[int]:
+    """Estima a quantidade de linhas de dados do arquivo (sem o cabeçalho), para o cálculo de progresso."""
+    if caminho.lower().endswith(".csv"):
+        total = 0
+        with open(caminho, "rb") as f:
+            while True:
+                bloco = f.read(UPLOAD_READ_BLOCK_BYTES)
+                if not bloco:
+                    break
+                total += bloco.count(b"\n")
+        return max(total - 1, 0)
+    if caminho.lower().endswith(".xlsx"):
+        from openpyxl import load_workbook
+
+        try:
+            wb = load_workbook(caminho, read_only=True)
+        except Exception as e:
+            # A leitura usa o calamine, que abre planilhas que o openpyxl recusa; o progresso fica sem total
+            logger.warning(f"[Ingestão] Não foi possível estimar as linhas de '{os.path.basename(caminho)}': {e}")
+            return None
+        try:
+            # A mesma planilha que a leitura importa: a primeira, e não a que estava ativa ao salvar
+            max_row = wb.worksheets[0].max_row
+        finally:
+            wb.close()
+        return max(max_row - 1, 0) if max_row else None
+    if caminho.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        with pq.ParquetFile(caminho) as arquivo:
+            return arquivo.metadata.num_rows
+    return None
+
+
+def _nomes_de_colunas(cabecalho: tuple) -> List[str]:
+    """Reproduz a nomeação de colunas do `pd.read_excel` (vazias e duplicadas)."""
+    nomes: List[str] = []
+    vistos = {}
+    for i, valor in enumerate(cabecalho):
+        nome = f"Unnamed: {i}" if valor is None else str(valor)
+        if nome in vistos:
+            vistos[nome] += 1
+            nome = f"{nome}.{vistos[nome]}"
+        else:
+            vistos[nome] = 0
+        nomes.append(nome)
+    return nomes
+
+
+def resolver_cabecalho(colunas: List[str], aliases: Aliases) -> Dict[int, str]:
+    """Posição no cabeçalho de cada coluna usada pelo processador -> nome da coluna no DB.
+
+    Resolvido só pela linha de cabeçalho, com a regra de `normalize_and_map_columns`
+    (primeiro alias encontrado); se o nome se repetir, vale a primeira ocorrência.
+    Vazio sem aliases ou se nenhuma coluna casar: o arquivo é lido inteiro e o
+    próprio processador acusa as colunas ausentes. O layout fica em cache
+    (ver `resolver_layout`): um export já visto não é resolvido de novo.
+    """
+    if not aliases:
+        return {}
+    return resolver_layout(colunas, aliases).posicoes
+
+
+def _celula_calamine(valor: Any) -> Any:
+    # Mesmos valores do openpyxl: célula vazia é None e números inteiros voltam a ser int
+    if valor == "":
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+
+def _linhas_calamine(caminho: str) -> Iterator[list]:
+    from python_calamine import CalamineWorkbook
+
+    planilha = CalamineWorkbook.from_path(caminho).get_sheet_by_index(0)
+    yield from planilha.iter_rows()
+
+
+def _linhas_openpyxl(caminho: str) -> Iterator[tuple]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        # Sempre a primeira planilha, como o calamine e o pd.read_excel (não a que estava ativa ao salvar)
+        yield from wb.worksheets[0].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _abrir_planilha(caminho: str, nome: str) -> Tuple[Optional[Iterator], Optional[tuple], Optional[Callable]]:
+    """Abre a planilha com o melhor leitor disponível. Retorna (linhas restantes, cabeçalho, conversor de célula)."""
+    if INGESTION_XLSX_ENGINE in ("auto", "calamine") and CALAMINE_DISPONIVEL:
+        try:
+            linhas = _linhas_calamine(caminho)
+            cabecalho = next(linhas, None)
+            logger.info("[Ingestão] Planilha lida com o calamine.")
+            return linhas, cabecalho and tuple(_celula_calamine(v) for v in cabecalho), _celula_calamine
+        except Exception as e:
+            if INGESTION_XLSX_ENGINE == "calamine":
+                raise
+            logger.warning(f"[Ingestão] calamine não conseguiu ler a planilha ({e}); usando o leitor padrão.")
+    if not nome.endswith(".xlsx"):
+        return None, None, None
+    linhas = _linhas_openpyxl(caminho)
+    return linhas, next(linhas, None), None
+
+
+def _ler_planilha_em_chunks(caminho: str, nome: str, chunksize: int, aliases: Aliases = None) -> Iterator[pd.DataFrame]:
+    linhas, cabecalho, converter = _abrir_planilha(caminho, nome)
+    if linhas is None:
+        # .xls sem o calamine: o formato binário antigo não tem leitura em streaming; lê de uma vez e fatia.
+        df = pd.read_excel(caminho)
+        mapa = resolver_cabecalho([str(c) for c in df.columns], aliases)
+        if mapa:
+            df = df.iloc[:, list(mapa)]
+            df.columns = list(mapa.values())
+        yield from (df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize))
+        return
+    if cabecalho is None:
+        return
+    colunas = _nomes_de_colunas(cabecalho)
+    largura = len(colunas)
+    mapa = resolver_cabecalho(colunas, aliases)
+    indices = list(mapa) if mapa else None
+    if mapa:
+        colunas = list(mapa.values())
+        logger.info(f"[Ingestão] Lendo {len(mapa)} de {largura} colunas da planilha.")
+
+    buffer = []
+    for linha in linhas:
+        if indices is not None:
+            linha = [linha[i] if i < len(linha) else None for i in indices]
+        elif len(linha) != largura:
+            linha = (tuple(linha) + (None,) * largura)[:largura]
+        if converter is not None:
+            linha = [converter(v) for v in linha]
+        if all(v is None for v in linha):
+            continue
+        buffer.append(linha)
+        if len(buffer) >= chunksize:
+            yield pd.DataFrame(buffer, columns=colunas)
+            buffer = []
+    if buffer:
+        yield pd.DataFrame(buffer, columns=colunas)
+
+
+def _ler_csv_em_chunks(caminho: str, chunksize: int, aliases: Aliases = None, tipos: Tipos = None) -> Iterator[pd.DataFrame]:
+    separador, encoding = detectar_formato_csv(caminho)
+    opcoes = dict(sep=separador, encoding=encoding, engine="c")
+    mapa: Dict[int, str] = {}
+    if aliases:
+        cabecalho = list(pd.read_csv(caminho, nrows=0, **opcoes).columns)
+        layout = resolver_layout(cabecalho, aliases, tipos)
+        mapa = layout.posicoes
+    # dtype=str mantém o mesmo schema em todos os chunks (a inferência por
+    # chunk poderia, p.ex., transformar uma coluna de status vazia em float).
+    dtype, usecols = str, None
+    if mapa:
+        usecols = list(mapa)
+        # Colunas categóricas saem direto do parser, sem um objeto str por célula
+        dtype = {cabecalho[i]: "category" if layout.tipos.get(i) == "category" else str for i in mapa}
+        logger.info(f"[Ingestão] Lendo {len(mapa)} de {len(cabecalho)} colunas do CSV.")
+    leitor = pd.read_csv(caminho, dtype=dtype, usecols=usecols, chunksize=chunksize, **opcoes)
+    with leitor:
+        for chunk in leitor:
+            if mapa:
+                # usecols devolve as colunas na ordem do arquivo, a mesma do mapa
+                chunk.columns = list(mapa.values())
+            yield chunk
+
+
+def _ler_parquet_em_chunks(caminho: str, chunksize: int, aliases: Aliases = None) -> Iterator[pd.DataFrame]:
+    import pyarrow.parquet as pq
+
+    with pq.ParquetFile(caminho) as arquivo:
+        nomes = arquivo.schema_arrow.names
+        renomear = {nomes[i]: coluna for i, coluna in resolver_cabecalho(nomes, aliases).items()}
+        for lote in arquivo.iter_batches(batch_size=chunksize, columns=list(renomear) or None):
+            yield lote.to_pandas().rename(columns=renomear)
+
+
+def _filtrar_linhas(chunk: pd.DataFrame, filtro: FiltroLinhas) -> pd.DataFrame:
+    linhas_lidas = len(chunk)
+    with metricas.etapa("filtro_linhas"):
+        mascara = filtro(chunk)
+        if mascara is not None:
+            chunk = chunk[mascara.to_numpy(dtype=bool)]
+    metricas.contar("linhas_descartadas", linhas_lidas - len(chunk))
+    # O progresso e as métricas contam as linhas do arquivo, não as que sobraram
+    chunk.attrs["linhas_lidas"] = linhas_lidas
+    return chunk
+
+
+def ler_arquivo_em_chunks(
+    caminho: str, nome_arquivo: str, chunksize: Optional[int] = None, aliases: Aliases = None, tipos: Tipos = None,
+    filtro: FiltroLinhas = None,
+) -> Iterator[pd.DataFrame]:
+    """Lê o arquivo em DataFrames de até `chunksize` linhas, mantendo o uso de memória constante.
+
+    Com `aliases` (mapa de colunas do processador), o cabeçalho é resolvido
+    antes da leitura: só as colunas reconhecidas são lidas, já com o nome da
+    coluna no DB. Em cada chunk, o `filtro` descarta as linhas que o
+    processador não usa antes da conversão para os `tipos` declarados; o
+    total lido fica em `chunk.attrs["linhas_lidas"]`.
+    """
+    chunksize = chunksize or INGESTION_CHUNK_ROWS
+    nome = nome_arquivo.lower()
+    if nome.endswith(".csv"):
+        chunks = _ler_csv_em_chunks(caminho, chunksize, aliases, tipos)
+    elif nome.endswith((".xlsx", ".xls")):
+        chunks = _ler_planilha_em_chunks(caminho, nome, chunksize, aliases)
+    elif nome.endswith(".parquet"):
+        # Artefato colunar de um upload anterior (ver services/dedup.py)
+        chunks = _ler_parquet_em_chunks(caminho, chunksize, aliases)
+    else:
+        raise ValueError("Formato de arquivo inválido ou corrompido.")
+    if not aliases:
+        return chunks
+    if filtro:
+        chunks = (_filtrar_linhas(chunk, filtro) for chunk in chunks)
+    if tipos:
+        chunks = (converter_tipos(chunk, tipos) for chunk in chunks)
+    return chunks
+
+
+def encerrar_contexto(contexto: dict) -> None:
+    """Executa as funções de `contexto["ao_encerrar"]` (ex.: fechar o cliente do ERP do relatório)."""
+    for encerrar in contexto.pop("ao_encerrar", []):
+        try:
+            encerrar()
+        except Exception as e:
+            logger.warning(f"[Ingestão] Falha ao liberar um recurso do relatório: {e}")
+
+
+def processar_em_chunks(
+    caminho: str, nome_arquivo: str, processor_func, relatorio_id: int, supabase_client,
+    progresso=None, antes_do_chunk: Optional[Callable[[], None]] = None, finalizador=None,
+    ao_ler_chunk: Optional[Callable[[pd.DataFrame], None]] = None, aliases: Aliases = None, tipos: Tipos = None,
+    filtro_linhas: Optional[Callable[[pd.DataFrame, dict], Optional[pd.Series]]] = None,
+) -> int:
+    """Passa cada chunk do arquivo pelo processador, que grava incrementalmente. Retorna o total de linhas lidas.
+
+    `antes_do_chunk` é chamado antes de cada chunk e pode levantar uma exceção
+    para interromper o processamento (ex.: cancelamento). `ao_ler_chunk`
+    recebe cada chunk bruto, antes do processador. O mesmo dict `contexto` é
+    repassado a todos os chunks, ao `filtro_linhas` e, ao fim, ao `finalizador`;
+    as funções que o processador deixar em `contexto["ao_encerrar"]` rodam ao
+    término, mesmo após falha ou cancelamento (ver `encerrar_contexto`).
+    `aliases`, `tipos` e `filtro_linhas` limitam a leitura às colunas e linhas
+    usadas pelo processador (ver `ler_arquivo_em_chunks`); chunks que o filtro
+    esvazia ainda passam pelo processador.
+    """
+    contexto = {}
+    filtro = (lambda chunk: filtro_linhas(chunk, contexto)) if filtro_linhas else None
+    if progresso:
+        progresso.definir_total_linhas(estimar_total_linhas(caminho))
+
+    try:
+        total_linhas = 0
+        chunks = ler_arquivo_em_chunks(caminho, nome_arquivo, aliases=aliases, tipos=tipos, filtro=filtro)
+        indice = 0
+        while True:
+            with metricas.etapa("leitura"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            if antes_do_chunk:
+                antes_do_chunk()
+            if indice == 0:
+                logger.info(f"[Ingestão] Colunas detectadas no arquivo: {chunk.columns.tolist()}")
+            if ao_ler_chunk:
+                with metricas.etapa("captura_upload"):
+                    ao_ler_chunk(chunk)
+            with metricas.etapa("processamento"):
+                processor_func(df=chunk, relatorio_id=relatorio_id, supabase_client=supabase_client, progresso=progresso, contexto=contexto)
+            linhas_lidas = chunk.attrs.get("linhas_lidas", len(chunk))
+            total_linhas += linhas_lidas
+            metricas.contar("linhas_lidas", linhas_lidas)
+            metricas.contar("chunks")
+            if progresso:
+                progresso.concluir_linhas(linhas_lidas)
+            indice += 1
+
+        if finalizador:
+            with metricas.etapa("finalizacao"):
+                finalizador(relatorio_id=relatorio_id, supabase_client=supabase_client, contexto=contexto)
+    finally:
+        encerrar_contexto(contexto)
+    logger.info(f"[Ingestão] {total_linhas} linhas processadas para o relatório ID: {relatorio_id}")
+    return total_linhas
@@ -0,0 +1,544 @@
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from .ingestion import UPLOAD_SPOOL_DIR, processar_em_chunks, remover_arquivo
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração da fila de processamento ---
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH") or os.path.join(UPLOAD_SPOOL_DIR, "jobs.sqlite3")
+JOBS_MAX_WORKERS = int(os.getenv("JOBS_MAX_WORKERS") or os.cpu_count() or 1)
+# Ex.: "desconexao=2,sac=1". Tipos não listados ficam limitados apenas por JOBS_MAX_WORKERS.
+JOBS_CONCORRENCIA_POR_TIPO = os.getenv("JOBS_CONCORRENCIA_POR_TIPO", "")
+JOBS_MAX_TENTATIVAS = int(os.getenv("JOBS_MAX_TENTATIVAS", "3"))
+JOBS_POLL_INTERVAL_S = 1.0
+
+# Estados de um job (os mesmos usados na coluna `status` de `relatorios`)
+PENDING = "PENDING"
+PROCESSING = "PROCESSING"
+COMPLETED = "COMPLETED"
+FAILED = "FAILED"
+CANCELLED = "CANCELLED"
+
+
+class JobCancelado(Exception):
+    """Levantada dentro do worker quando o cancelamento do relatório foi solicitado."""
+
+
+def _parse_limites(texto: str) -> Dict[str, int]:
+    limites = {}
+    for item in filter(None, (parte.strip() for parte in texto.split(","))):
+        tipo, _, valor = item.partition("=")
+        try:
+            limites[tipo.strip()] = max(1, int(valor))
+        except ValueError:
+            logger.warning(f"[Jobs] Limite de concorrência inválido ignorado: '{item}'")
+    return limites
+
+
+# --- Persistência da fila (SQLite local) ---
+@contextmanager
+def _conectar():
+    os.makedirs(os.path.dirname(JOBS_DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def inicializar_banco() -> None:
+    with _conectar() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                relatorio_id INTEGER PRIMARY KEY,
+                tipo TEXT NOT NULL,
+                caminho TEXT NOT NULL,
+                nome_arquivo TEXT NOT NULL,
+                status TEXT NOT NULL,
+                cancelar INTEGER NOT NULL DEFAULT 0,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                erro TEXT,
+                criado_em REAL NOT NULL,
+                atualizado_em REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, criado_em)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_atualizado ON jobs (atualizado_em)")
+        # Totais de /metrics, somados a cada relatório concluído (ver metricas.contribuicoes). Ficam fora
+        # de `jobs`: reprocessar um relatório regrava a linha dele, o que faria os contadores regredirem
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS metricas_acumuladas (
+                metrica TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                rotulo TEXT NOT NULL DEFAULT '',
+                valor REAL NOT NULL,
+                PRIMARY KEY (metrica, tipo, rotulo)
+            )
+            """
+        )
+        # Colunas adicionadas depois da primeira versão da fila
+        existentes = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for coluna, definicao in (
+            ("metricas", "TEXT"), ("perfilar", "INTEGER NOT NULL DEFAULT 0"),
+            ("progresso", "INTEGER"), ("registros_processados", "INTEGER"),
+        ):
+            if coluna not in existentes:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {coluna} {definicao}")
+
+
+def enfileirar(relatorio_id: int, caminho: str, nome_arquivo: str, tipo: str, perfilar: bool = False) -> None:
+    """Adiciona o relatório à fila. Com `perfilar`, o worker grava um perfil cProfile do processamento."""
+    agora = time.time()
+    with _conectar() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO jobs (relatorio_id, tipo, caminho, nome_arquivo, status, perfilar, criado_em, atualizado_em) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (relatorio_id, tipo, caminho, nome_arquivo, PENDING, int(perfilar), agora, agora),
+        )
+    logger.info(f"[Jobs] Relatório ID={relatorio_id} enfileirado | Tipo={tipo}")
+
+
+def obter_job(relatorio_id: int) -> Optional[sqlite3.Row]:
+    with _conectar() as conn:
+        return conn.execute("SELECT * FROM jobs WHERE relatorio_id = ?", (relatorio_id,)).fetchone()
+
+
+def _atualizar_status(relatorio_id: int, status: str, erro: Optional[str] = None) -> None:
+    # Sem `erro`, preserva o detalhe já registrado pelo worker
+    with _conectar() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, erro = COALESCE(?, erro), atualizado_em = ? WHERE relatorio_id = ?",
+            (status, erro, time.time(), relatorio_id),
+        )
+
+
+def salvar_progresso(relatorio_id: int, payload: Dict) -> None:
+    """Espelha na fila local o progresso gravado em `relatorios`, para os eventos em tempo real (/eventos)."""
+    with _conectar() as conn:
+        conn.execute(
+            "UPDATE jobs SET progresso = COALESCE(?, progresso), registros_processados = COALESCE(?, registros_processados), "
+            "erro = COALESCE(?, erro), atualizado_em = ? "
+            "WHERE relatorio_id = ?",
+            (payload.get("progresso"), payload.get("registros_processados"), payload.get("detalhes_erro"), time.time(), relatorio_id),
+        )
+
+
+def listar_alterados_desde(instante: float) -> List[sqlite3.Row]:
+    """Jobs cujo status ou progresso mudou a partir de `instante`, inclusive (ordem de atualização)."""
+    with _conectar() as conn:
+        return conn.execute(
+            "SELECT relatorio_id, tipo, status, progresso, registros_processados, erro, atualizado_em "
+            "FROM jobs WHERE atualizado_em >= ? ORDER BY atualizado_em, relatorio_id",
+            (instante,),
+        ).fetchall()
+
+
+def salvar_metricas(relatorio_id: int, resumo: Dict) -> None:
+    """Grava as métricas do relatório no job e as soma aos totais de /metrics."""
+    from .metricas import GAUGES, contribuicoes
+
+    with _conectar() as conn:
+        conn.execute("UPDATE jobs SET metricas = ? WHERE relatorio_id = ?", (json.dumps(resumo), relatorio_id))
+        job = conn.execute("SELECT tipo FROM jobs WHERE relatorio_id = ?", (relatorio_id,)).fetchone()
+        if job is None:
+            return
+        for metrica, rotulo, valor in contribuicoes(resumo):
+            atualizacao = "excluded.valor" if metrica in GAUGES else "valor + excluded.valor"
+            conn.execute(
+                "INSERT INTO metricas_acumuladas (metrica, tipo, rotulo, valor) VALUES (?, ?, ?, ?) "
+                f"ON CONFLICT (metrica, tipo, rotulo) DO UPDATE SET valor = {atualizacao}",
+                (metrica, job["tipo"], rotulo, valor),
+            )
+
+
+def contar_por_status() -> Dict[tuple, int]:
+    """Quantidade de jobs na fila por (tipo, status)."""
+    with _conectar() as conn:
+        linhas = conn.execute("SELECT tipo, status, COUNT(*) AS total FROM jobs GROUP BY tipo, status").fetchall()
+    return {(linha["tipo"], linha["status"]): linha["total"] for linha in linhas}
+
+
+def listar_metricas_acumuladas() -> List[tuple]:
+    """Linhas (métrica, tipo, rótulo, valor) dos totais de /metrics."""
+    with _conectar() as conn:
+        return [tuple(linha) for linha in conn.execute("SELECT metrica, tipo, rotulo, valor FROM metricas_acumuladas")]
+
+
+def _reservar(relatorio_id: int) -> bool:
+    """Passa o job de PENDING para PROCESSING; falha se ele foi cancelado nesse meio tempo."""
+    with _conectar() as conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = ?, atualizado_em = ? WHERE relatorio_id = ? AND status = ?",
+            (PROCESSING, time.time(), relatorio_id, PENDING),
+        )
+        return cursor.rowcount == 1
+
+
+def cancelamento_solicitado(relatorio_id: int) -> bool:
+    job = obter_job(relatorio_id)
+    return bool(job and job["cancelar"])
+
+
+# --- Execução (roda dentro dos processos do pool) ---
+def remover_registros_do_relatorio(supabase_client, tipo: str, relatorio_id: int) -> None:
+    """Apaga os registros e resumos já gravados para o relatório (cancelamento ou nova tentativa).
+
+    Nos tipos incrementais as linhas já gravadas ficam: cada upsert reflete um
+    snapshot mais novo que o estado anterior, e uma nova tentativa as regrava
+    sem duplicar.
+    """
+    from .processors import TABELAS_DESTINO, TIPOS_INCREMENTAIS
+    from .processors.resumos import remover_resumos
+
+    tabela = TABELAS_DESTINO.get(tipo)
+    if tabela and tipo in TIPOS_INCREMENTAIS:
+        logger.info(f"[Worker] Relatório ID: {relatorio_id} é incremental; mudanças já aplicadas em '{tabela}' são mantidas.")
+    elif tabela:
+        supabase_client.table(tabela).delete().eq('relatorio_id', relatorio_id).execute()
+    remover_resumos(supabase_client, relatorio_id)
+
+
+def _inicializar_worker() -> None:
+    # Processos criados com "spawn" não herdam a configuração de logging da API
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+
+def processar_relatorio(relatorio_id: int, caminho_arquivo: str, filename: str, report_type: str) -> str:
+    """Processa um relatório de ponta a ponta e atualiza seu status no Supabase. Retorna o status final.
+
+    Tempos por etapa, contadores e pico de memória são gravados com o
+    relatório (coluna `metricas`), na fila local e somados aos totais de /metrics.
+    """
+    from . import metricas
+
+    job = obter_job(relatorio_id)
+    # Jobs devolvidos à fila por `recuperar` já podem ter gravado parte dos registros
+    retomado = bool(job and job["tentativas"])
+    with metricas.coletar(relatorio_id, report_type) as coleta:
+        with metricas.perfilar(relatorio_id, bool(job and job["perfilar"])):
+            status = _executar_relatorio(relatorio_id, caminho_arquivo, filename, report_type, coleta, retomado)
+    resumo = coleta.resumo()
+    salvar_metricas(relatorio_id, resumo)
+    logger.info(
+        f"[Worker] Relatório ID={relatorio_id}: {resumo['duracao_s']}s, {resumo['linhas_por_segundo']} linhas/s, "
+        f"pico de memória {resumo['pico_memoria_mb']} MB | etapas: "
+        + ", ".join(f"{nome}={dados['segundos']:.2f}s" for nome, dados in resumo["etapas"].items())
+    )
+    return status
+
+
+def _executar_relatorio(
+    relatorio_id: int, caminho_arquivo: str, filename: str, report_type: str, coleta, retomado: bool = False,
+) -> str:
+    from .bulk_writer import ProgressoRelatorio
+    from .dedup import CapturaDoUpload
+    from .processors import ALIASES_COLUNAS, FILTROS_LINHAS, FINALIZADORES, PROCESSORS, TIPOS_COLUNAS
+    from .supabase_client import supabase
+
+    logger.info(f"[Worker] Iniciando processamento | ID={relatorio_id}, Tipo={report_type}, Arquivo={filename}")
+
+    captura = None
+    try:
+        supabase.table('relatorios').update({"status": PROCESSING}).eq('id', relatorio_id).execute()
+
+        processor_func = PROCESSORS.get(report_type)
+        logger.info(f"[Worker] Processor selecionado: {processor_func.__name__ if processor_func else 'Nenhum encontrado'}")
+
+        if not processor_func:
+            raise ValueError(f"Tipo de relatório desconhecido: '{report_type}'")
+
+        if retomado:
+            # Recomeça do zero: sem isso, as linhas da tentativa interrompida ficariam duplicadas
+            logger.info(f"[Worker] Relatório ID: {relatorio_id} retomado; removendo registros da tentativa anterior.")
+            remover_registros_do_relatorio(supabase, report_type, relatorio_id)
+
+        def verificar_cancelamento():
+            if cancelamento_solicitado(relatorio_id):
+                raise JobCancelado()
+
+        progresso = ProgressoRelatorio(supabase, relatorio_id, ao_gravar=lambda payload: salvar_progresso(relatorio_id, payload))
+        if os.path.isdir(caminho_arquivo):
+            # Envio em lote: um diretório com vários arquivos, consolidados num único relatório
+            from .lotes import processar_lote
+
+            processar_lote(
+                caminho_arquivo, relatorio_id, report_type, supabase,
+                progresso=progresso, antes_do_chunk=verificar_cancelamento, finalizador=FINALIZADORES.get(report_type),
+            )
+        else:
+            # Reprocessamentos já leem o artefato Parquet; não há o que regravar
+            captura = CapturaDoUpload(relatorio_id, gravar_artefato=not filename.lower().endswith(".parquet"))
+            processar_em_chunks(
+                caminho_arquivo, filename, processor_func, relatorio_id, supabase,
+                progresso=progresso, antes_do_chunk=verificar_cancelamento,
+                finalizador=FINALIZADORES.get(report_type), ao_ler_chunk=captura.observar,
+                # O artefato guarda todas as linhas e colunas, como texto (um processador futuro pode precisar delas)
+                aliases=None if captura.grava_artefato else ALIASES_COLUNAS.get(report_type),
+                tipos=None if captura.grava_artefato else TIPOS_COLUNAS.get(report_type),
+                filtro_linhas=None if captura.grava_artefato else FILTROS_LINHAS.get(report_type),
+            )
+            captura.concluir()
+            captura = None
+
+        supabase.table('relatorios').update({
+            "status": COMPLETED,
+            "progresso": 100,
+            "registros_processados": progresso.registros_processados,
+            "metricas": coleta.resumo(),
+        }).eq('id', relatorio_id).execute()
+        salvar_progresso(relatorio_id, {"progresso": 100, "registros_processados": progresso.registros_processados})
+        logger.info(f"[Worker] Processamento do relatório ID: {relatorio_id} concluído com sucesso.")
+        return COMPLETED
+
+    except JobCancelado:
+        logger.info(f"[Worker] Relatório ID: {relatorio_id} cancelado; removendo registros parciais.")
+        remover_registros_do_relatorio(supabase, report_type, relatorio_id)
+        supabase.table('relatorios').update(
+            {"status": CANCELLED, "detalhes_erro": "Processamento cancelado pelo usuário.", "metricas": coleta.resumo()}
+        ).eq('id', relatorio_id).execute()
+        return CANCELLED
+
+    except Exception as e:
+        error_detail = f"Erro ao processar o arquivo: {str(e)}"
+        logger.error(error_detail, exc_info=True)
+        supabase.table('relatorios').update(
+            {"status": FAILED, "detalhes_erro": error_detail, "metricas": coleta.resumo()}
+        ).eq('id', relatorio_id).execute()
+        salvar_progresso(relatorio_id, {"detalhes_erro": error_detail})
+        return FAILED
+
+    finally:
+        if captura is not None:
+            captura.descartar()
+        remover_arquivo(caminho_arquivo)
+
+
+# --- Despacho (roda no processo da API) ---
+class GerenciadorDeJobs:
+    """Consome a fila persistente e distribui os relatórios num pool de processos.
+
+    Respeita o limite global de workers e o limite por tipo de relatório. Na
+    inicialização, recupera jobs interrompidos por um reinício do servidor.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = JOBS_MAX_WORKERS,
+        limites_por_tipo: Optional[Dict[str, int]] = None,
+        executar: Callable[[int, str, str, str], str] = processar_relatorio,
+    ):
+        self.max_workers = max_workers
+        self.limites_por_tipo = limites_por_tipo if limites_por_tipo is not None else _parse_limites(JOBS_CONCORRENCIA_POR_TIPO)
+        self.executar = executar
+        self.ao_finalizar: List[Callable[[int, str, str], None]] = []
+        self._em_execucao: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._supabase_client = None
+        self._thread: Optional[threading.Thread] = None
+
+    def iniciar(self, supabase_client=None) -> None:
+        inicializar_banco()
+        self._supabase_client = supabase_client
+        self.recuperar(supabase_client)
+        self._pool = self._criar_pool()
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name="jobs-dispatcher", daemon=True)
+        self._thread.start()
+        logger.info(f"[Jobs] Gerenciador iniciado | workers={self.max_workers}, limites={self.limites_por_tipo or 'nenhum'}")
+
+    def _criar_pool(self) -> ProcessPoolExecutor:
+        # "spawn" evita herdar threads e conexões abertas do processo da API
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_inicializar_worker,
+        )
+
+    def parar(self) -> None:
+        self._parar.set()
+        self._acordar.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self._pool:
+            # Jobs em andamento serão retomados por `recuperar` na próxima inicialização
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        logger.info("[Jobs] Gerenciador encerrado.")
+
+    def notificar(self) -> None:
+        """Acorda o despachante imediatamente (ex.: logo após um novo upload)."""
+        self._acordar.set()
+
+    def recuperar(self, supabase_client=None) -> None:
+        """Devolve à fila os jobs que estavam em execução quando o servidor parou.
+
+        Relatórios PENDING/PROCESSING no Supabase sem job local (o arquivo se
+        perdeu) são marcados como FAILED para não ficarem pendurados.
+        """
+        with _conectar() as conn:
+            interrompidos = conn.execute("SELECT relatorio_id, tentativas, caminho FROM jobs WHERE status = ?", (PROCESSING,)).fetchall()
+            for job in interrompidos:
+                tentativas = job["tentativas"] + 1
+                if tentativas >= JOBS_MAX_TENTATIVAS or not os.path.exists(job["caminho"]):
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, tentativas = ?, erro = ?, atualizado_em = ? WHERE relatorio_id = ?",
+                        (FAILED, tentativas, "Processamento interrompido repetidamente.", time.time(), job["relatorio_id"]),
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, tentativas = ?, atualizado_em = ? WHERE relatorio_id = ?",
+                        (PENDING, tentativas, time.time(), job["relatorio_id"]),
+                    )
+            conhecidos = {
+                row["relatorio_id"]: row["status"]
+                for row in conn.execute("SELECT relatorio_id, status FROM jobs")
+            }
+        if interrompidos:
+            logger.warning(f"[Jobs] {len(interrompidos)} job(s) interrompido(s) recuperado(s).")
+
+        if supabase_client is None:
+            return
+        try:
+            res = supabase_client.table('relatorios').select("id, status").in_('status', [PENDING, PROCESSING]).execute()
+        except Exception as e:
+            logger.error(f"[Jobs] Não foi possível consultar relatórios pendentes no Supabase: {e}")
+            return
+        for relatorio in res.data or []:
+            status_local = conhecidos.get(relatorio["id"])
+            if status_local in (PENDING, PROCESSING):
+                continue
+            detalhe = "Processamento interrompido; envie o arquivo novamente." if status_local is None else None
+            payload = {"status": status_local if status_local in (FAILED, CANCELLED) else FAILED}
+            payload["detalhes_erro"] = detalhe or "Processamento interrompido."
+            supabase_client.table('relatorios').update(payload).eq('id', relatorio["id"]).execute()
+            logger.warning(f"[Jobs] Relatório ID={relatorio['id']} sem job ativo marcado como {payload['status']}.")
+
+    def cancelar(self, relatorio_id: int, supabase_client=None) -> Optional[str]:
+        """Cancela um job. Retorna o status resultante ou None se o job não existir.
+
+        Jobs pendentes são cancelados na hora; jobs em execução são interrompidos
+        pelo worker antes do próximo chunk.
+        """
+        with _conectar() as conn:
+            job = conn.execute("SELECT * FROM jobs WHERE relatorio_id = ?", (relatorio_id,)).fetchone()
+            if job is None:
+                return None
+            if job["status"] == PENDING:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, cancelar = 1, atualizado_em = ? WHERE relatorio_id = ?",
+                    (CANCELLED, time.time(), relatorio_id),
+                )
+            elif job["status"] == PROCESSING:
+                conn.execute("UPDATE jobs SET cancelar = 1, atualizado_em = ? WHERE relatorio_id = ?", (time.time(), relatorio_id))
+                return PROCESSING
+            else:
+                return job["status"]
+
+        remover_arquivo(job["caminho"])
+        if supabase_client is not None:
+            supabase_client.table('relatorios').update(
+                {"status": CANCELLED, "detalhes_erro": "Processamento cancelado pelo usuário."}
+            ).eq('id', relatorio_id).execute()
+        self._notificar_fim(relatorio_id, job["tipo"], CANCELLED)
+        return CANCELLED
+
+    def _pode_executar(self, tipo: str) -> bool:
+        if len(self._em_execucao) >= self.max_workers:
+            return False
+        limite = self.limites_por_tipo.get(tipo)
+        return limite is None or sum(1 for t in self._em_execucao.values() if t == tipo) < limite
+
+    def _despachar(self) -> None:
+        with _conectar() as conn:
+            pendentes = conn.execute(
+                "SELECT relatorio_id, tipo, caminho, nome_arquivo FROM jobs WHERE status = ? ORDER BY criado_em",
+                (PENDING,),
+            ).fetchall()
+        for job in pendentes:
+            with self._lock:
+                if len(self._em_execucao) >= self.max_workers:
+                    return
+                if not self._pode_executar(job["tipo"]):
+                    continue
+                if not _reservar(job["relatorio_id"]):
+                    continue
+                self._em_execucao[job["relatorio_id"]] = job["tipo"]
+            args = (job["relatorio_id"], job["caminho"], job["nome_arquivo"], job["tipo"])
+            try:
+                try:
+                    future = self._pool.submit(self.executar, *args)
+                except BrokenProcessPool:
+                    logger.warning("[Jobs] Pool de processos quebrado (worker encerrado abruptamente); recriando.")
+                    self._pool = self._criar_pool()
+                    future = self._pool.submit(self.executar, *args)
+            except Exception as e:
+                # Sem isso o job ficaria PROCESSING para sempre, ocupando uma vaga do limite por tipo
+                logger.error(f"[Jobs] Não foi possível enviar o relatório ID={job['relatorio_id']} ao pool: {e}")
+                remover_arquivo(job["caminho"])
+                future = Future()
+                future.set_exception(e)
+            future.add_done_callback(
+                lambda f, relatorio_id=job["relatorio_id"], tipo=job["tipo"]: self._ao_concluir(relatorio_id, tipo, f)
+            )
+
+    def _ao_concluir(self, relatorio_id: int, tipo: str, future: Future) -> None:
+        with self._lock:
+            self._em_execucao.pop(relatorio_id, None)
+        if future.cancelled():
+            # O pool foi encerrado antes de o job começar: fica PROCESSING e será recuperado
+            return
+        try:
+            status = future.result()
+            erro = None
+        except Exception as e:
+            # Falha do próprio processo (ex.: worker morto por falta de memória)
+            status, erro = FAILED, str(e) or type(e).__name__
+            logger.error(f"[Jobs] Worker falhou no relatório ID={relatorio_id}: {erro}")
+            if self._supabase_client is not None:
+                try:
+                    self._supabase_client.table('relatorios').update(
+                        {"status": FAILED, "detalhes_erro": f"Erro ao processar o arquivo: {erro}"}
+                    ).eq('id', relatorio_id).execute()
+                except Exception as e_update:
+                    logger.error(f"[Jobs] Não foi possível marcar o relatório ID={relatorio_id} como FAILED: {e_update}")
+        _atualizar_status(relatorio_id, status, erro)
+        self._notificar_fim(relatorio_id, tipo, status)
+        self._acordar.set()
+
+    def _notificar_fim(self, relatorio_id: int, tipo: str, status: str) -> None:
+        for callback in self.ao_finalizar:
+            try:
+                callback(relatorio_id, tipo, status)
+            except Exception as e:
+                logger.error(f"[Jobs] Erro no callback de finalização do relatório ID={relatorio_id}: {e}", exc_info=True)
+
+    def _loop(self) -> None:
+        while not self._parar.is_set():
+            try:
+                self._despachar()
+            except Exception as e:
+                logger.error(f"[Jobs] Erro no despachante: {e}", exc_info=True)
+            self._acordar.wait(JOBS_POLL_INTERVAL_S)
+            self._acordar.clear()
@@ -0,0 +1,325 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from . import metricas
+from .ingestion import (
+    EXTENSOES_SUPORTADAS, UPLOAD_READ_BLOCK_BYTES, UPLOAD_SPOOL_DIR,
+    encerrar_contexto, estimar_total_linhas, ler_arquivo_em_chunks, remover_arquivo, salvar_upload_em_disco,
+)
+from .jobs import (
+    COMPLETED, FAILED, CANCELLED, JOBS_DB_PATH, PENDING, PROCESSING, JobCancelado, cancelamento_solicitado,
+)
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração do envio em lote (POST /upload/lote: vários arquivos e/ou .zip num único relatório) ---
+# Processos que leem e preparam os arquivos do lote em paralelo (por padrão, um por núcleo).
+# O lote roda dentro de um worker do pool de jobs: com vários lotes simultâneos, o total de
+# processos chega a JOBS_MAX_WORKERS x LOTE_MAX_WORKERS; se isso pesar na máquina, limite o
+# tipo em JOBS_CONCORRENCIA_POR_TIPO (ex.: "desconexao=2") ou reduza este valor.
+LOTE_MAX_WORKERS = int(os.getenv("LOTE_MAX_WORKERS") or os.cpu_count() or 1)
+LOTE_MAX_ARQUIVOS = int(os.getenv("LOTE_MAX_ARQUIVOS", "500"))
+# Limite do conteúdo descompactado de cada .zip (proteção contra "zip bombs")
+LOTE_MAX_BYTES_ZIP = int(os.getenv("LOTE_MAX_BYTES_ZIP", str(4 * 1024 ** 3)))
+
+# Status próprio dos arquivos do lote, além dos status dos jobs
+IGNORADO = "SKIPPED"
+
+
+# --- Status por arquivo (mesmo SQLite da fila de jobs, tabela própria) ---
+@contextmanager
+def _conectar():
+    os.makedirs(os.path.dirname(JOBS_DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def inicializar_banco() -> None:
+    with _conectar() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS arquivos_lote (
+                relatorio_id INTEGER NOT NULL,
+                indice INTEGER NOT NULL,
+                nome_arquivo TEXT NOT NULL,
+                caminho TEXT,
+                sha256 TEXT,
+                status TEXT NOT NULL,
+                linhas_lidas INTEGER,
+                registros INTEGER,
+                detalhe TEXT,
+                atualizado_em REAL NOT NULL,
+                PRIMARY KEY (relatorio_id, indice)
+            )
+            """
+        )
+
+
+def registrar_arquivos(relatorio_id: int, arquivos: List[Dict]) -> None:
+    agora = time.time()
+    with _conectar() as conn:
+        conn.execute("DELETE FROM arquivos_lote WHERE relatorio_id = ?", (relatorio_id,))
+        conn.executemany(
+            "INSERT INTO arquivos_lote (relatorio_id, indice, nome_arquivo, caminho, sha256, status, detalhe, atualizado_em) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (relatorio_id, indice, a["nome_arquivo"], a.get("caminho"), a.get("sha256"), a["status"], a.get("detalhe"), agora)
+                for indice, a in enumerate(arquivos)
+            ],
+        )
+
+
+def listar_arquivos(relatorio_id: int) -> List[Dict]:
+    with _conectar() as conn:
+        linhas = conn.execute(
+            "SELECT * FROM arquivos_lote WHERE relatorio_id = ? ORDER BY indice", (relatorio_id,)
+        ).fetchall()
+    return [dict(linha) for linha in linhas]
+
+
+def _atualizar_arquivo(relatorio_id: int, indice: int, **campos) -> None:
+    atribuicoes = ", ".join(f"{coluna} = ?" for coluna in campos)
+    with _conectar() as conn:
+        conn.execute(
+            f"UPDATE arquivos_lote SET {atribuicoes}, atualizado_em = ? WHERE relatorio_id = ? AND indice = ?",
+            (*campos.values(), time.time(), relatorio_id, indice),
+        )
+
+
+def _encerrar_arquivos(relatorio_id: int, status: str, detalhe: str) -> None:
+    """Marca os arquivos ainda em andamento quando o lote inteiro falha ou é cancelado."""
+    with _conectar() as conn:
+        conn.execute(
+            "UPDATE arquivos_lote SET status = ?, detalhe = COALESCE(detalhe, ?), atualizado_em = ? "
+            "WHERE relatorio_id = ? AND status IN (?, ?)",
+            (status, detalhe, time.time(), relatorio_id, PENDING, PROCESSING),
+        )
+
+
+# --- Recebimento (roda no processo da API) ---
+def _extrair_zip(caminho_zip: str, nome_zip: str, diretorio: str) -> List[Dict]:
+    """Extrai as entradas suportadas do .zip para `diretorio`, bloco a bloco, calculando o sha256 de cada uma."""
+    try:
+        with zipfile.ZipFile(caminho_zip) as zf:
+            entradas = [info for info in zf.infolist() if not info.is_dir()]
+            if sum(info.file_size for info in entradas) > LOTE_MAX_BYTES_ZIP:
+                raise ValueError(f"O conteúdo descompactado de '{nome_zip}' excede o limite permitido.")
+            arquivos = []
+            for info in entradas:
+                # O caminho interno só identifica o arquivo; o nome gravado em disco é sempre gerado aqui
+                nome = f"{nome_zip}/{info.filename}"
+                extensao = os.path.splitext(info.filename)[1].lower()
+                partes = info.filename.split("/")
+                if extensao not in EXTENSOES_SUPORTADAS or "__MACOSX" in partes or partes[-1].startswith("."):
+                    arquivos.append({"nome_arquivo": nome, "status": IGNORADO, "detalhe": "Formato não suportado."})
+                    continue
+                fd, destino = tempfile.mkstemp(prefix="arquivo_", suffix=extensao, dir=diretorio)
+                sha256 = hashlib.sha256()
+                with zf.open(info) as origem, os.fdopen(fd, "wb") as saida:
+                    while True:
+                        bloco = origem.read(UPLOAD_READ_BLOCK_BYTES)
+                        if not bloco:
+                            break
+                        saida.write(bloco)
+                        sha256.update(bloco)
+                arquivos.append({"nome_arquivo": nome, "caminho": destino, "sha256": sha256.hexdigest(), "status": PENDING})
+            return arquivos
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"'{nome_zip}' não é um arquivo .zip válido: {e}") from e
+
+
+async def salvar_lote_em_disco(uploads) -> Tuple[str, List[Dict]]:
+    """Grava os arquivos enviados (e o conteúdo dos .zip) num diretório do spool e retorna (diretório, arquivos).
+
+    Cada arquivo vem com nome, caminho, sha256 e status: PENDING, ou
+    SKIPPED com o motivo em `detalhe` (formato não suportado ou conteúdo
+    repetido dentro do próprio lote). Quem chama remove o diretório em caso de
+    erro (ver `remover_arquivo`).
+    """
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    diretorio = tempfile.mkdtemp(prefix="lote_", dir=UPLOAD_SPOOL_DIR)
+    arquivos: List[Dict] = []
+    try:
+        for upload in uploads:
+            nome = os.path.basename(upload.filename or "")
+            extensao = os.path.splitext(nome)[1].lower()
+            if extensao not in EXTENSOES_SUPORTADAS + (".zip",):
+                arquivos.append({"nome_arquivo": nome, "status": IGNORADO, "detalhe": "Formato não suportado."})
+                continue
+            caminho, sha256 = await salvar_upload_em_disco(upload)
+            if extensao == ".zip":
+                try:
+                    arquivos.extend(await asyncio.to_thread(_extrair_zip, caminho, nome, diretorio))
+                finally:
+                    remover_arquivo(caminho)
+            else:
+                destino = os.path.join(diretorio, os.path.basename(caminho))
+                os.replace(caminho, destino)
+                arquivos.append({"nome_arquivo": nome, "caminho": destino, "sha256": sha256, "status": PENDING})
+            if len(arquivos) > LOTE_MAX_ARQUIVOS:
+                raise ValueError(f"O lote excede o limite de {LOTE_MAX_ARQUIVOS} arquivos.")
+    except Exception:
+        remover_arquivo(diretorio)
+        raise
+
+    vistos: Dict[str, str] = {}
+    for arquivo in arquivos:
+        if arquivo["status"] != PENDING:
+            continue
+        if arquivo["sha256"] in vistos:
+            remover_arquivo(arquivo.pop("caminho"))
+            arquivo.update(status=IGNORADO, detalhe=f"Conteúdo idêntico a '{vistos[arquivo['sha256']]}'.")
+        else:
+            vistos[arquivo["sha256"]] = arquivo["nome_arquivo"]
+    return diretorio, arquivos
+
+
+def hash_do_lote(arquivos: List[Dict]) -> str:
+    """Identifica o conteúdo do lote (independe da ordem e do nome dos arquivos), para a deduplicação de uploads."""
+    hashes = sorted(a["sha256"] for a in arquivos if a["status"] == PENDING)
+    return hashlib.sha256("\n".join(hashes).encode()).hexdigest()
+
+
+# --- Processamento (roda no worker do relatório) ---
+def _preparar_arquivo(caminho: str, nome_arquivo: str, tipo: str, relatorio_id: int) -> Tuple[pd.DataFrame, int, Set[str]]:
+    """Lê um arquivo do lote em chunks e devolve (linhas preparadas, linhas lidas, escopo do snapshot).
+
+    Roda num processo do pool do lote; nada é gravado aqui.
+    """
+    from .processors import ALIASES_COLUNAS, FILTROS_LINHAS, LOTES, TIPOS_COLUNAS
+
+    preparar = LOTES[tipo][0]
+    contexto: Dict = {}
+    filtro_linhas = FILTROS_LINHAS.get(tipo)
+    filtro = (lambda chunk: filtro_linhas(chunk, contexto)) if filtro_linhas else None
+    partes, escopo, linhas_lidas = [], set(), 0
+    for chunk in ler_arquivo_em_chunks(
+        caminho, nome_arquivo, aliases=ALIASES_COLUNAS.get(tipo), tipos=TIPOS_COLUNAS.get(tipo), filtro=filtro,
+    ):
+        if cancelamento_solicitado(relatorio_id):
+            raise JobCancelado()
+        # OLTs vistas pelo filtro, inclusive as de linhas já descartadas (ver filtrar_linhas_desconexao)
+        escopo.update(contexto.pop("olts_no_arquivo", ()))
+        partes.append(preparar(chunk, relatorio_id, escopo))
+        linhas_lidas += chunk.attrs.get("linhas_lidas", len(chunk))
+    if not partes:
+        raise ValueError("O arquivo não tem linhas de dados.")
+    return pd.concat(partes, ignore_index=True), linhas_lidas, escopo
+
+
+def _deduplicar(df: pd.DataFrame, chave: str) -> pd.DataFrame:
+    """Uma linha por `chave`, ficando a do último arquivo do lote; linhas sem a chave são mantidas."""
+    sem_chave = df[chave].isna()
+    return pd.concat([df[~sem_chave].drop_duplicates(chave, keep="last"), df[sem_chave]], ignore_index=True)
+
+
+def processar_lote(
+    diretorio: str, relatorio_id: int, tipo: str, supabase_client, progresso=None, antes_do_chunk=None, finalizador=None,
+) -> int:
+    """Processa os arquivos de um lote como um único relatório. Retorna o total de linhas lidas.
+
+    Os arquivos são lidos e preparados em paralelo (um processo por arquivo,
+    até `LOTE_MAX_WORKERS`). Os resultados são consolidados, deduplicados pela
+    chave do tipo (ex.: `serial_onu`, valendo o último arquivo enviado) e
+    gravados uma única vez pelo caminho normal do processador. Um arquivo que
+    falha não derruba o lote; o status de cada um fica em `arquivos_lote`.
+    """
+    from .processors import LOTES
+
+    _, gravar, chave = LOTES[tipo]
+    arquivos = [a for a in listar_arquivos(relatorio_id) if a["status"] in (PENDING, PROCESSING)]
+    if not arquivos:
+        raise ValueError("O lote não tem arquivos válidos para processar.")
+    logger.info(f"[Lote] Relatório ID={relatorio_id}: {len(arquivos)} arquivo(s) para processar.")
+
+    try:
+        if progresso:
+            estimativas = [estimar_total_linhas(a["caminho"]) for a in arquivos]
+            progresso.definir_total_linhas(None if None in estimativas else sum(estimativas))
+
+        preparados: Dict[int, Tuple[pd.DataFrame, int, Set[str]]] = {}
+        with metricas.etapa("preparacao_lote"):
+            workers = min(LOTE_MAX_WORKERS, len(arquivos))
+            if workers > 1:
+                # "spawn", como no pool de jobs: o worker do relatório já tem threads e conexões abertas
+                executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                # Um único arquivo (ou um único núcleo): não compensa subir outro processo
+                executor = ThreadPoolExecutor(max_workers=1)
+            with executor as pool:
+                futuros = {}
+                for arquivo in arquivos:
+                    futuros[pool.submit(_preparar_arquivo, arquivo["caminho"], arquivo["nome_arquivo"], tipo, relatorio_id)] = arquivo
+                    _atualizar_arquivo(relatorio_id, arquivo["indice"], status=PROCESSING)
+                for futuro in as_completed(futuros):
+                    arquivo = futuros[futuro]
+                    try:
+                        preparados[arquivo["indice"]] = df, linhas_lidas, _ = futuro.result()
+                    except JobCancelado:
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        raise
+                    except Exception as e:
+                        logger.warning(f"[Lote] Relatório ID={relatorio_id}: falha em '{arquivo['nome_arquivo']}': {e}")
+                        _atualizar_arquivo(relatorio_id, arquivo["indice"], status=FAILED, detalhe=str(e) or type(e).__name__)
+                        continue
+                    _atualizar_arquivo(relatorio_id, arquivo["indice"], linhas_lidas=linhas_lidas, registros=len(df))
+                    metricas.contar("linhas_lidas", linhas_lidas)
+                    if progresso:
+                        progresso.concluir_linhas(linhas_lidas)
+                    if antes_do_chunk:
+                        antes_do_chunk()
+
+        if not preparados:
+            raise ValueError("Nenhum arquivo do lote pôde ser processado.")
+
+        with metricas.etapa("consolidacao_lote"):
+            # Ordem de envio: em duplicatas, vale a linha do último arquivo
+            indices = sorted(preparados)
+            df = pd.concat([preparados[i][0] for i in indices], ignore_index=True)
+            escopo = set().union(*(preparados[i][2] for i in indices))
+            total = len(df)
+            df = _deduplicar(df, chave)
+        metricas.contar("linhas_duplicadas_lote", total - len(df))
+        metricas.contar("linhas_offline", len(df))
+        logger.info(f"[Lote] Relatório ID={relatorio_id}: {total} registros consolidados, {total - len(df)} duplicados removidos.")
+
+        if antes_do_chunk:
+            antes_do_chunk()
+        contexto: Dict = {}
+        try:
+            with metricas.etapa("processamento"):
+                gravar(df, relatorio_id, supabase_client, progresso, contexto, escopo)
+            if finalizador:
+                with metricas.etapa("finalizacao"):
+                    finalizador(relatorio_id=relatorio_id, supabase_client=supabase_client, contexto=contexto)
+        finally:
+            encerrar_contexto(contexto)
+    except JobCancelado:
+        _encerrar_arquivos(relatorio_id, CANCELLED, "Processamento cancelado pelo usuário.")
+        raise
+    except Exception as e:
+        _encerrar_arquivos(relatorio_id, FAILED, str(e))
+        raise
+
+    for indice in preparados:
+        _atualizar_arquivo(relatorio_id, indice, status=COMPLETED)
+    total_linhas = sum(linhas_lidas for _, linhas_lidas, _ in preparados.values())
+    logger.info(f"[Lote] {total_linhas} linhas de {len(preparados)} arquivo(s) processadas para o relatório ID: {relatorio_id}")
+    return total_linhas
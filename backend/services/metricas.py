@@ -0,0 +1,279 @@
+import cProfile
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração da instrumentação ---
+METRICAS_INTERVALO_MEMORIA_S = float(os.getenv("METRICAS_INTERVALO_MEMORIA", "0.2"))
+PERFIS_DIR = os.getenv("PERFIS_DIR") or os.path.join(os.getenv("UPLOAD_SPOOL_DIR") or tempfile.gettempdir(), "perfis")
+
+# Faixas (em segundos) do histograma de duração exposto em /metrics
+DURACAO_BUCKETS_S = (1, 5, 15, 30, 60, 120, 300, 600, 1800)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_PAGINA_BYTES = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def memoria_residente_bytes() -> Optional[int]:
+    """RSS atual do processo (Linux); fora dele, o pico do processo desde o início."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGINA_BYTES
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KiB no Linux e em bytes no macOS
+    return maxrss if os.uname().sysname == "Darwin" else maxrss * 1024
+
+
+class MetricasRelatorio:
+    """Tempos por etapa, contadores e pico de memória do processamento de um relatório.
+
+    Os workers do pool são reaproveitados entre relatórios, por isso o pico de
+    memória vem de uma thread que amostra o RSS enquanto o relatório roda (e
+    não do `ru_maxrss` do processo). Etapas executadas em threads paralelas
+    (ex.: serialização dos lotes) somam o tempo de cada thread.
+    """
+
+    def __init__(self, relatorio_id: int, tipo: str):
+        self.relatorio_id = relatorio_id
+        self.tipo = tipo
+        self.segundos: Dict[str, float] = defaultdict(float)
+        self.chamadas: Dict[str, int] = defaultdict(int)
+        self.contadores: Dict[str, int] = defaultdict(int)
+        self.memoria_inicial = memoria_residente_bytes()
+        self.pico_memoria = self.memoria_inicial
+        self._inicio = time.perf_counter()
+        self._fim: Optional[float] = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._amostrador = threading.Thread(target=self._amostrar_memoria, name="metricas-memoria", daemon=True)
+        self._amostrador.start()
+
+    def _amostrar_memoria(self) -> None:
+        while not self._parar.wait(METRICAS_INTERVALO_MEMORIA_S):
+            self._registrar_memoria()
+
+    def _registrar_memoria(self) -> None:
+        atual = memoria_residente_bytes()
+        if atual is not None and (self.pico_memoria is None or atual > self.pico_memoria):
+            self.pico_memoria = atual
+
+    @contextmanager
+    def medir(self, etapa: str) -> Iterator[None]:
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            decorrido = time.perf_counter() - inicio
+            with self._lock:
+                self.segundos[etapa] += decorrido
+                self.chamadas[etapa] += 1
+
+    def contar(self, nome: str, quantidade: int = 1) -> None:
+        with self._lock:
+            self.contadores[nome] += quantidade
+
+    def encerrar(self) -> None:
+        if self._fim is None:
+            self._fim = time.perf_counter()
+            self._parar.set()
+            self._amostrador.join(timeout=1)
+            self._registrar_memoria()
+
+    @property
+    def duracao(self) -> float:
+        return (self._fim or time.perf_counter()) - self._inicio
+
+    def resumo(self) -> Dict[str, Any]:
+        """Resumo serializável em JSON (gravado em `relatorios.metricas` e na fila local)."""
+        duracao = self.duracao
+        linhas = self.contadores.get("linhas_lidas", 0)
+        mb = lambda valor: round(valor / 2 ** 20, 1) if valor is not None else None  # noqa: E731
+        with self._lock:
+            return {
+                "duracao_s": round(duracao, 3),
+                "linhas_por_segundo": round(linhas / duracao, 1) if duracao > 0 else None,
+                "memoria_inicial_mb": mb(self.memoria_inicial),
+                "pico_memoria_mb": mb(self.pico_memoria),
+                "etapas": {
+                    etapa: {"segundos": round(segundos, 4), "chamadas": self.chamadas[etapa]}
+                    for etapa, segundos in sorted(self.segundos.items(), key=lambda item: -item[1])
+                },
+                "contadores": dict(self.contadores),
+            }
+
+
+# Cada processo do pool roda um relatório por vez: as etapas registradas em
+# qualquer thread do processo pertencem ao relatório ativo.
+_ativo: Optional[MetricasRelatorio] = None
+
+
+@contextmanager
+def coletar(relatorio_id: int, tipo: str) -> Iterator[MetricasRelatorio]:
+    global _ativo
+    metricas = MetricasRelatorio(relatorio_id, tipo)
+    _ativo = metricas
+    try:
+        yield metricas
+    finally:
+        metricas.encerrar()
+        _ativo = None
+
+
+@contextmanager
+def etapa(nome: str) -> Iterator[None]:
+    """Mede a duração de uma etapa do relatório ativo (sem efeito fora de `coletar`)."""
+    metricas = _ativo
+    if metricas is None:
+        yield
+        return
+    with metricas.medir(nome):
+        yield
+
+
+def contar(nome: str, quantidade: int = 1) -> None:
+    metricas = _ativo
+    if metricas is not None:
+        metricas.contar(nome, quantidade)
+
+
+# --- Perfil (cProfile) sob demanda ---
+def caminho_perfil(relatorio_id: int) -> str:
+    return os.path.join(PERFIS_DIR, f"relatorio_{relatorio_id}.prof")
+
+
+@contextmanager
+def perfilar(relatorio_id: int, ativo: bool) -> Iterator[None]:
+    """Grava um perfil cProfile (formato pstats) do processamento, se `ativo`.
+
+    Cobre a thread do worker; o envio dos lotes em threads paralelas aparece
+    como espera nessa thread (o tempo delas está nas etapas de `metricas`).
+    """
+    if not ativo:
+        yield
+        return
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield
+    finally:
+        perfil.disable()
+        try:
+            os.makedirs(PERFIS_DIR, exist_ok=True)
+            perfil.dump_stats(caminho_perfil(relatorio_id))
+            logger.info(f"[Métricas] Perfil do relatório ID={relatorio_id} gravado em {caminho_perfil(relatorio_id)}")
+        except OSError as e:
+            logger.warning(f"[Métricas] Não foi possível gravar o perfil do relatório ID={relatorio_id}: {e}")
+
+
+# --- Exposição no formato de texto do Prometheus ---
+def _rotulos(**rotulos: str) -> str:
+    escapar = lambda valor: str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")  # noqa: E731
+    return "{" + ",".join(f'{nome}="{escapar(valor)}"' for nome, valor in rotulos.items()) + "}"
+
+
+# Métricas somadas a cada relatório concluído (contadores) -> rótulo extra de cada linha, além de `tipo`
+_ROTULO_EXTRA = {
+    "relatorios_duracao_segundos_bucket": "le",
+    "relatorios_etapa_segundos_total": "etapa",
+}
+# Métricas que guardam só o valor do último relatório (gauges)
+GAUGES = ("relatorios_linhas_por_segundo", "relatorios_pico_memoria_mb")
+
+
+def contribuicoes(resumo: Dict[str, Any]) -> List[Tuple[str, str, float]]:
+    """Parcelas de um relatório concluído nas métricas acumuladas de /metrics: (métrica, rótulo, valor).
+
+    Nos contadores o valor é somado ao total já registrado; nos `GAUGES`, substitui o anterior.
+    """
+    duracao = resumo.get("duracao_s") or 0.0
+    parcelas = [("relatorios_duracao_segundos_bucket", str(limite), float(duracao <= limite)) for limite in DURACAO_BUCKETS_S]
+    parcelas += [
+        ("relatorios_duracao_segundos_bucket", "+Inf", 1.0),
+        ("relatorios_duracao_segundos_sum", "", duracao),
+        ("relatorios_duracao_segundos_count", "", 1.0),
+    ]
+    parcelas += [
+        ("relatorios_etapa_segundos_total", nome, dados.get("segundos", 0.0))
+        for nome, dados in (resumo.get("etapas") or {}).items()
+    ]
+    contadores = resumo.get("contadores") or {}
+    parcelas += [
+        ("relatorios_linhas_lidas_total", "", contadores.get("linhas_lidas", 0)),
+        ("relatorios_registros_gravados_total", "", contadores.get("registros_gravados", 0)),
+    ]
+    for metrica, chave in zip(GAUGES, ("linhas_por_segundo", "pico_memoria_mb")):
+        if resumo.get(chave) is not None:
+            parcelas.append((metrica, "", resumo[chave]))
+    return parcelas
+
+
+def _valor(valor: float) -> str:
+    return str(int(valor)) if float(valor).is_integer() else str(round(valor, 4))
+
+
+def exportar_prometheus(por_status: Dict[Tuple[str, str], int], acumuladas: Iterable[Tuple[str, str, str, float]]) -> str:
+    """Métricas no formato de exposição do Prometheus.
+
+    `por_status` conta os jobs da fila por (tipo, status). `acumuladas` são as
+    linhas (métrica, tipo, rótulo, valor) somadas por `contribuicoes` a cada
+    relatório concluído: só crescem, então os contadores não regridem quando um
+    relatório é reprocessado, e a coleta não depende do tamanho da fila.
+    """
+    series: Dict[str, list] = defaultdict(list)
+    for metrica, tipo, rotulo, valor in acumuladas:
+        rotulos = {"tipo": tipo}
+        if metrica in _ROTULO_EXTRA:
+            rotulos[_ROTULO_EXTRA[metrica]] = rotulo
+        series[metrica].append((rotulos, valor))
+
+    linhas_saida = [
+        "# HELP relatorios_jobs Relatórios na fila local, por tipo e status.",
+        "# TYPE relatorios_jobs gauge",
+    ]
+    linhas_saida += [f"relatorios_jobs{_rotulos(tipo=t, status=s)} {n}" for (t, s), n in sorted(por_status.items())]
+
+    linhas_saida += [
+        "# HELP relatorios_duracao_segundos Duração do processamento dos relatórios.",
+        "# TYPE relatorios_duracao_segundos histogram",
+    ]
+    limites = [str(limite) for limite in DURACAO_BUCKETS_S] + ["+Inf"]
+    buckets = {(r["tipo"], r["le"]): v for r, v in series["relatorios_duracao_segundos_bucket"]}
+    somas = {r["tipo"]: v for r, v in series["relatorios_duracao_segundos_sum"]}
+    quantidades = {r["tipo"]: v for r, v in series["relatorios_duracao_segundos_count"]}
+    for tipo in sorted(quantidades):
+        for limite in limites:
+            linhas_saida.append(
+                f"relatorios_duracao_segundos_bucket{_rotulos(tipo=tipo, le=limite)} {_valor(buckets.get((tipo, limite), 0))}"
+            )
+        linhas_saida.append(f"relatorios_duracao_segundos_sum{_rotulos(tipo=tipo)} {somas.get(tipo, 0.0):.3f}")
+        linhas_saida.append(f"relatorios_duracao_segundos_count{_rotulos(tipo=tipo)} {_valor(quantidades[tipo])}")
+
+    for nome, ajuda, tipo_metrica in (
+        ("relatorios_etapa_segundos_total", "Tempo acumulado por etapa do pipeline.", "counter"),
+        ("relatorios_linhas_lidas_total", "Linhas lidas dos arquivos enviados.", "counter"),
+        ("relatorios_registros_gravados_total", "Registros gravados no banco.", "counter"),
+        ("relatorios_linhas_por_segundo", "Vazão do último relatório processado.", "gauge"),
+        ("relatorios_pico_memoria_mb", "Pico de memória (RSS) do último relatório processado.", "gauge"),
+    ):
+        linhas_saida += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo_metrica}"]
+        linhas_saida += [
+            f"{nome}{_rotulos(**rotulos)} {_valor(valor)}"
+            for rotulos, valor in sorted(series[nome], key=lambda serie: tuple(serie[0].values()))
+        ]
+
+    return "\n".join(linhas_saida) + "\n"
@@ -4,3 +4,61 @@
 from . import desconexao_processor
 from . import monitoria_processor
 from . import sac_processor
+
+from typing import Dict, List, Tuple
+
+from .helpers import normalizar_aliases
+
+# Mapeamento dos tipos de relatório para suas funções de processamento
+PROCESSORS: Dict[str, callable] = {
+    "desconexao": desconexao_processor.processar_relatorio_desconexao,
+    "monitoria": monitoria_processor.processar_relatorio_monitoria,
+    "sac": sac_processor.processar_relatorio_sac,
+}
+
+# Aliases de colunas de cada tipo: a leitura do arquivo carrega só as colunas que casam com eles
+ALIASES_COLUNAS: Dict[str, Dict[str, List[str]]] = {
+    "desconexao": desconexao_processor.DISCONNECTION_COLUMN_ALIASES,
+    "sac": sac_processor.SAC_COLUMN_ALIASES,
+    "monitoria": monitoria_processor.MONITORIA_COLUMN_ALIASES,
+}
+# Os aliases são normalizados uma única vez, aqui; cada upload só consulta o cache de layouts
+for _aliases in ALIASES_COLUNAS.values():
+    normalizar_aliases(_aliases)
+
+# Tipos das colunas de cada tipo de relatório, aplicados já na leitura (ver ingestion.ler_arquivo_em_chunks)
+TIPOS_COLUNAS: Dict[str, Dict[str, str]] = {
+    "desconexao": desconexao_processor.DISCONNECTION_COLUMN_TYPES,
+    "monitoria": monitoria_processor.MONITORIA_COLUMN_TYPES,
+}
+
+# Filtros de linhas aplicados pela ingestão a cada chunk, antes de qualquer conversão
+FILTROS_LINHAS: Dict[str, callable] = {
+    "desconexao": desconexao_processor.filtrar_linhas_desconexao,
+}
+
+# Funções executadas após o último chunk de um relatório (estado acumulado em `contexto`)
+FINALIZADORES: Dict[str, callable] = {
+    "desconexao": desconexao_processor.finalizar_relatorio_desconexao,
+    "sac": sac_processor.finalizar_relatorio_sac,
+    "monitoria": monitoria_processor.finalizar_relatorio_monitoria,
+}
+
+# Tabela onde cada processador grava seus registros (usada para limpar relatórios cancelados ou retomados)
+TABELAS_DESTINO: Dict[str, str] = {
+    "desconexao": "clientes_off",
+    "sac": "sac_performance",
+    "monitoria": "monitoria",
+}
+
+# Tipos cuja tabela de destino guarda o estado atual (upsert por chave) e não o histórico de cada relatório.
+# Apagar as linhas pelo `relatorio_id` removeria também o que veio de relatórios anteriores.
+TIPOS_INCREMENTAIS = {"desconexao"} if desconexao_processor.MODO_INGESTAO == "incremental" else set()
+
+# Tipos aceitos no envio em lote (POST /upload/lote): (preparar, gravar, chave de deduplicação).
+# Os arquivos são preparados em paralelo e consolidados numa única gravação (ver services/lotes.py).
+LOTES: Dict[str, Tuple[callable, callable, str]] = {
+    "desconexao": (
+        desconexao_processor.preparar_desconexao, desconexao_processor.gravar_desconexao, "serial_onu",
+    ),
+}
@@ -0,0 +1,183 @@
+import logging
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from ..bulk_writer import inserir_em_lotes
+from .. import metricas
+
+logger = logging.getLogger(__name__)
+
+# Faixas de `horas_offline`: uma ONU só é regravada quando muda de faixa
+HORAS_OFFLINE_FAIXAS = [0, 24, 48, 72, 168]
+
+# Colunas do estado atual lidas de `clientes_off` para o diff
+COLUNAS_ESTADO = ["serial_onu", "olt_regiao", "motivo_desconexao", "horas_offline", "rx_onu"]
+
+PAGINA_ESTADO = 1000
+LOTE_RECUPERACAO = 200
+
+# Tipos de evento gravados em `eventos_onu`
+EVENTO_NOVA_QUEDA = "NOVA_QUEDA"
+EVENTO_ALTERACAO = "ALTERACAO"
+EVENTO_RECUPERADA = "RECUPERADA"
+# Um evento de cada tipo por ONU e relatório: lotes repetidos após um timeout (ou a nova
+# tentativa de um job) regravam o mesmo evento em vez de duplicá-lo
+CHAVE_EVENTOS = "relatorio_id,serial_onu,evento"
+
+
+def faixa_horas_offline(horas: pd.Series) -> pd.Series:
+    """Índice da faixa de cada valor de `horas_offline` (-1 para ausentes)."""
+    valores = pd.to_numeric(horas, errors="coerce").to_numpy(dtype=float)
+    faixas = np.searchsorted(HORAS_OFFLINE_FAIXAS, valores, side="right") - 1
+    return pd.Series(np.where(np.isnan(valores), -1, faixas), index=horas.index)
+
+
+def _normalizar_motivo(motivo: pd.Series) -> pd.Series:
+    return motivo.astype(object).where(motivo.notna(), "").astype(str).str.strip().str.upper()
+
+
+class IngestaoIncremental:
+    """Aplica um snapshot de desconexão como diff sobre o estado atual de `clientes_off`.
+
+    Nesse modo `clientes_off` guarda uma linha por `serial_onu` (o estado mais
+    recente). A cada chunk, só as ONUs novas ou alteradas (motivo, faixa de
+    `horas_offline` ou `rx_onu`) são gravadas via upsert; ao final, ONUs que
+    estavam offline em OLTs presentes no snapshot e não apareceram mais são
+    removidas como recuperadas. Cada transição gera um evento em `eventos_onu`.
+    """
+
+    def __init__(self, supabase_client, relatorio_id: int, progresso=None):
+        self.supabase_client = supabase_client
+        self.relatorio_id = relatorio_id
+        self.progresso = progresso
+        self.ocorrido_em = datetime.now(timezone.utc).isoformat()
+        with metricas.etapa("carga_estado_incremental"):
+            self.estado = self._carregar_estado()
+        self.seriais_vistos: Set[str] = set()
+        self.olts_vistas: Set[str] = set()
+        self.contagem = {EVENTO_NOVA_QUEDA: 0, EVENTO_ALTERACAO: 0, EVENTO_RECUPERADA: 0, "inalteradas": 0}
+
+    def _carregar_estado(self) -> pd.DataFrame:
+        paginas = []
+        inicio = 0
+        while True:
+            res = (
+                self.supabase_client.table('clientes_off')
+                .select(",".join(COLUNAS_ESTADO))
+                .order('serial_onu')
+                .range(inicio, inicio + PAGINA_ESTADO - 1)
+                .execute()
+            )
+            dados = res.data or []
+            if dados:
+                paginas.append(pd.DataFrame(dados))
+            if len(dados) < PAGINA_ESTADO:
+                break
+            inicio += PAGINA_ESTADO
+
+        if not paginas:
+            estado = pd.DataFrame(columns=COLUNAS_ESTADO)
+        else:
+            estado = pd.concat(paginas, ignore_index=True)
+        estado = estado.dropna(subset=["serial_onu"]).drop_duplicates("serial_onu", keep="last")
+        logger.info(f"[Incremental] Estado carregado: {len(estado)} ONUs offline conhecidas.")
+        return estado.set_index("serial_onu")
+
+    def registrar_olts(self, olts: Iterable) -> None:
+        """Marca OLTs presentes no snapshot (inclusive as que só têm ONUs online)."""
+        self.olts_vistas.update(str(olt) for olt in olts if isinstance(olt, str))
+
+    def aplicar(self, df_offline: pd.DataFrame) -> int:
+        """Grava as ONUs novas ou alteradas do chunk. Retorna quantas foram gravadas."""
+        sem_serial = df_offline["serial_onu"].isna()
+        if sem_serial.any():
+            logger.warning(f"[Incremental] {int(sem_serial.sum())} ONUs offline sem serial ignoradas.")
+        df = df_offline[~sem_serial].drop_duplicates("serial_onu", keep="last")
+        if df.empty:
+            return 0
+        self.registrar_olts(df["olt_regiao"].dropna().unique())
+        self.seriais_vistos.update(df["serial_onu"].astype(str))
+
+        if "data_desconexao" in df.columns:
+            # Continuam offline, mas sem data não há horas_offline confiável: o estado gravado fica como está
+            sem_data = df["data_desconexao"].isna()
+            if sem_data.any():
+                logger.warning(f"[Incremental] {int(sem_data.sum())} ONUs offline com data inválida mantidas sem regravar.")
+                self.contagem["inalteradas"] += int(sem_data.sum())
+                df = df[~sem_data]
+                if df.empty:
+                    return 0
+
+        anterior = self.estado.reindex(df["serial_onu"])
+        anterior.index = df.index
+        nova = ~df["serial_onu"].isin(self.estado.index)
+
+        # float64 antes de arredondar: rx_onu pode chegar como float32 (ver DISCONNECTION_COLUMN_TYPES)
+        rx_novo = pd.to_numeric(df["rx_onu"], errors="coerce").astype(float).round(2)
+        rx_antigo = pd.to_numeric(anterior["rx_onu"], errors="coerce").astype(float).round(2)
+        rx_mudou = ~((rx_novo == rx_antigo) | (rx_novo.isna() & rx_antigo.isna()))
+        alterada = ~nova & (
+            (_normalizar_motivo(df["motivo_desconexao"]) != _normalizar_motivo(anterior["motivo_desconexao"]))
+            | (faixa_horas_offline(df["horas_offline"]) != faixa_horas_offline(anterior["horas_offline"]))
+            | rx_mudou
+        )
+
+        gravar = df[nova | alterada]
+        self.contagem[EVENTO_NOVA_QUEDA] += int(nova.sum())
+        self.contagem[EVENTO_ALTERACAO] += int(alterada.sum())
+        self.contagem["inalteradas"] += int(len(df) - len(gravar))
+        if gravar.empty:
+            return 0
+
+        if self.progresso:
+            self.progresso.prever(len(gravar))
+        inserir_em_lotes(self.supabase_client, 'clientes_off', gravar, progresso=self.progresso, on_conflict='serial_onu')
+
+        eventos = gravar[["serial_onu", "olt_regiao", "motivo_desconexao", "horas_offline", "rx_onu"]].assign(
+            evento=np.where(nova[gravar.index], EVENTO_NOVA_QUEDA, EVENTO_ALTERACAO),
+            relatorio_id=self.relatorio_id,
+            ocorrido_em=self.ocorrido_em,
+        )
+        inserir_em_lotes(self.supabase_client, 'eventos_onu', eventos, on_conflict=CHAVE_EVENTOS)
+
+        # Mantém o estado em memória coerente para os próximos chunks
+        atualizados = gravar.set_index("serial_onu")[[c for c in COLUNAS_ESTADO if c != "serial_onu"]]
+        self.estado = pd.concat([self.estado[~self.estado.index.isin(atualizados.index)], atualizados])
+        return len(gravar)
+
+    def finalizar(self) -> None:
+        """Remove de `clientes_off` as ONUs recuperadas e registra os eventos correspondentes."""
+        no_escopo = self.estado["olt_regiao"].isin(self.olts_vistas)
+        recuperadas = self.estado[no_escopo & ~self.estado.index.isin(self.seriais_vistos)]
+
+        if not recuperadas.empty:
+            seriais = recuperadas.index.tolist()
+            for i in range(0, len(seriais), LOTE_RECUPERACAO):
+                lote = seriais[i:i + LOTE_RECUPERACAO]
+                self.supabase_client.table('clientes_off').delete().in_('serial_onu', lote).execute()
+            eventos = recuperadas.reset_index()[["serial_onu", "olt_regiao", "motivo_desconexao", "horas_offline", "rx_onu"]].assign(
+                evento=EVENTO_RECUPERADA,
+                relatorio_id=self.relatorio_id,
+                ocorrido_em=self.ocorrido_em,
+            )
+            inserir_em_lotes(self.supabase_client, 'eventos_onu', eventos, on_conflict=CHAVE_EVENTOS)
+            self.estado = self.estado.drop(recuperadas.index)
+        self.contagem[EVENTO_RECUPERADA] += len(recuperadas)
+
+        logger.info(
+            f"[Incremental] Relatório ID={self.relatorio_id}: {self.contagem[EVENTO_NOVA_QUEDA]} novas quedas, "
+            f"{self.contagem[EVENTO_ALTERACAO]} alteradas, {self.contagem[EVENTO_RECUPERADA]} recuperadas, "
+            f"{self.contagem['inalteradas']} sem mudança."
+        )
+
+
+def obter_sessao(contexto: Optional[dict], supabase_client, relatorio_id: int, progresso=None) -> IngestaoIncremental:
+    """Reaproveita a sessão incremental do relatório entre chunks (guardada em `contexto`)."""
+    if contexto is None:
+        return IngestaoIncremental(supabase_client, relatorio_id, progresso)
+    if "incremental" not in contexto:
+        contexto["incremental"] = IngestaoIncremental(supabase_client, relatorio_id, progresso)
+    return contexto["incremental"]
@@ -1,11 +1,21 @@
 import pandas as pd
 import numpy as np
+import os
+import re
 from datetime import datetime, timezone
 import logging
+from typing import Iterable, Optional, Set
 from .helpers import normalize_and_map_columns
+from ..bulk_writer import inserir_em_lotes
+from .. import metricas
+from . import desconexao_incremental, resumos
 
 logger = logging.getLogger(__name__)
 
+# "completa": insere todas as ONUs offline de cada relatório em `clientes_off` (histórico por relatório).
+# "incremental": mantém uma linha por `serial_onu` e grava só as mudanças (ver desconexao_incremental).
+MODO_INGESTAO = os.getenv("DESCONEXAO_MODO_INGESTAO", "completa").strip().lower()
+
 # Mapeamento de colunas para o relatório de Desconexão
 DISCONNECTION_COLUMN_ALIASES = {
     "nome_cliente": ["cliente"],
@@ -21,6 +31,25 @@ DISCONNECTION_COLUMN_ALIASES = {
     "distancia_m": ["distancia_entre_olt_e_onu_m"]
 }
 
+# Tipos aplicados já na leitura do arquivo (ver ingestion.ler_arquivo_em_chunks); as demais colunas chegam como texto
+DISCONNECTION_COLUMN_TYPES = {
+    "olt_regiao": "category",
+    "status_conexao": "category",
+    "modelo_onu": "category",
+    "rx_onu": "float32",
+    "rx_olt": "float32",
+    "data_desconexao": "datetime",
+}
+
+OFFLINE_STATUSES = ["LOSS", "SEM ENERGIA"]
+
+# Colunas gravadas em `clientes_off` (além de `relatorio_id`)
+COLUNAS_CLIENTES_OFF = [
+    "nome_cliente", "serial_onu", "olt_regiao", "data_desconexao",
+    "horas_offline", "cidade", "motivo_desconexao", "cto", "slot_pon_onu",
+    "modelo_onu", "rx_onu", "rx_olt", "distancia_m"
+]
+
 # --- MAPEAMENTO DE OLT PARA CIDADE ---
 OLT_CIDADE_MAP = {
     # Londrina
@@ -94,41 +123,97 @@ OLT_CIDADE_MAP = {
 }
 
 
+# --- ÍNDICE PRÉ-COMPILADO DAS OLTs ---
+# Uma única regex com todas as chaves (as mais longas primeiro) encontra, em cada
+# posição do texto, a maior chave que começa ali; o lookahead permite enxergar
+# correspondências sobrepostas. Como qualquer outra chave que case na mesma
+# posição é prefixo da mais longa, guardamos para cada chave a menor prioridade
+# (ordem no OLT_CIDADE_MAP) entre seus prefixos, preservando a regra original
+# de "primeira chave do mapa contida no texto".
+_OLT_PRIORIDADE = {key: i for i, key in enumerate(OLT_CIDADE_MAP)}
+_OLT_MELHOR_PREFIXO = {
+    key: min((outra for outra in OLT_CIDADE_MAP if key.startswith(outra)), key=_OLT_PRIORIDADE.__getitem__)
+    for key in OLT_CIDADE_MAP
+}
+_OLT_PATTERN = re.compile(
+    "(?=(" + "|".join(re.escape(key) for key in sorted(OLT_CIDADE_MAP, key=len, reverse=True)) + "))"
+)
+
+
 def get_cidade_from_olt(olt_regiao: str) -> str:
     if not isinstance(olt_regiao, str):
         return 'Outra'
     # Procura por uma correspondência parcial para abranger mais casos
-    for key, city in OLT_CIDADE_MAP.items():
-        if key in olt_regiao:
-            return city
-    return 'Outra'
+    candidatas = [_OLT_MELHOR_PREFIXO[m.group(1)] for m in _OLT_PATTERN.finditer(olt_regiao)]
+    if not candidatas:
+        return 'Outra'
+    return OLT_CIDADE_MAP[min(candidatas, key=_OLT_PRIORIDADE.__getitem__)]
 
-def processar_relatorio_desconexao(df: pd.DataFrame, relatorio_id: int, supabase_client) -> None:
-    logger.info(f"Processando relatório de DESCONEXÃO para o ID: {relatorio_id}")
-    
-    df_renamed = normalize_and_map_columns(df, DISCONNECTION_COLUMN_ALIASES)
+
+def mapear_cidades(olts: pd.Series) -> pd.Series:
+    """Resolve a cidade de uma coluna inteira de OLTs, avaliando cada valor distinto uma única vez."""
+    cidades_por_olt = {olt: get_cidade_from_olt(olt) for olt in olts.dropna().unique()}
+    # astype antes do fillna: numa coluna categórica (ver DISCONNECTION_COLUMN_TYPES) 'Outra' não é categoria
+    return olts.map(cidades_por_olt).astype(object).fillna('Outra')
+
+def status_offline(status: pd.Series) -> pd.Series:
+    """Máscara das ONUs com status offline (LOSS / Sem Energia), sem diferenciar caixa e espaços."""
+    if isinstance(status.dtype, pd.CategoricalDtype):
+        # Avalia cada categoria uma vez; o código -1 (ausente) cai no False final
+        offline = status.cat.categories.astype(str).str.strip().str.upper().isin(OFFLINE_STATUSES)
+        return pd.Series(np.append(offline, False)[status.cat.codes.to_numpy()], index=status.index)
+    return status.str.strip().str.upper().isin(OFFLINE_STATUSES)
+
+
+def filtrar_linhas_desconexao(df: pd.DataFrame, contexto: dict) -> pd.Series:
+    """Filtro aplicado pela ingestão a cada chunk, antes da conversão de tipos: mantém só as ONUs offline.
+
+    No modo incremental, as OLTs do chunk são anotadas em `contexto` antes do
+    filtro: uma OLT só com ONUs online ainda delimita as ONUs recuperadas.
+    """
+    if "status_conexao" not in df.columns:
+        return None
+    if MODO_INGESTAO == "incremental" and "olt_regiao" in df.columns:
+        contexto.setdefault("olts_no_arquivo", set()).update(df["olt_regiao"].dropna().unique())
+    return status_offline(df["status_conexao"])
+
+
+def preparar_desconexao(df: pd.DataFrame, relatorio_id: int, olts: Optional[Set[str]] = None) -> pd.DataFrame:
+    """Converte um chunk do OLT Cloud nas linhas de `clientes_off` (só ONUs offline), sem gravar nada.
+
+    Se `olts` for informado, recebe as OLTs de todas as linhas do chunk, inclusive as online.
+    """
+    with metricas.etapa("normalizacao"):
+        df_renamed = normalize_and_map_columns(df, DISCONNECTION_COLUMN_ALIASES)
     
     # Validação com mensagem de erro específica
     if "status_conexao" not in df_renamed.columns or "data_desconexao" not in df_renamed.columns:
         raise ValueError("[Processador de Desconexão] O arquivo deve conter colunas para 'Status' e data (ex: 'Última Alteração').")
+    if MODO_INGESTAO == "incremental" and "serial_onu" not in df_renamed.columns:
+        raise ValueError("[Processador de Desconexão] O modo incremental exige a coluna 'SN ONU'.")
+    if olts is not None and "olt_regiao" in df_renamed.columns:
+        olts.update(df_renamed["olt_regiao"].dropna().unique())
 
     df_renamed['motivo_desconexao'] = df_renamed['status_conexao']
-    offline_statuses = ["LOSS", "SEM ENERGIA"]
-    df_offline = df_renamed[df_renamed["status_conexao"].str.strip().str.upper().isin(offline_statuses)].copy()
-    
-    if df_offline.empty:
-        logger.info("Nenhum cliente com status 'LOSS' ou 'Sem Energia' foi encontrado.")
-        return
+    with metricas.etapa("filtro_offline"):
+        # Sem custo quando a ingestão já aplicou `filtrar_linhas_desconexao`
+        df_offline = df_renamed[status_offline(df_renamed["status_conexao"])]
 
-    df_offline["data_desconexao"] = pd.to_datetime(df_offline["data_desconexao"], errors='coerce')
-    df_offline.dropna(subset=["data_desconexao"], inplace=True)
-    
-    agora_utc = datetime.now(timezone.utc)
-    df_offline["data_desconexao"] = df_offline["data_desconexao"].apply(
-        lambda x: x.tz_localize('UTC') if x.tzinfo is None else x.tz_convert('UTC')
-    )
-    df_offline["horas_offline"] = ((agora_utc - df_offline["data_desconexao"]).dt.total_seconds() / 3600).astype(int)
-    df_offline["cidade"] = df_offline["olt_regiao"].apply(get_cidade_from_olt)
+    with metricas.etapa("conversao_datas"):
+        # utc=True localiza datas sem fuso como UTC e converte as demais, na coluna inteira
+        # (sem custo quando a leitura já entregou a coluna convertida)
+        df_offline["data_desconexao"] = pd.to_datetime(df_offline["data_desconexao"], errors='coerce', utc=True)
+        if MODO_INGESTAO != "incremental":
+            df_offline.dropna(subset=["data_desconexao"], inplace=True)
+        # No incremental a linha sem data continua: a ONU segue offline no snapshot e não pode ser
+        # dada como recuperada (IngestaoIncremental.aplicar a marca como vista sem regravá-la)
+        sem_data = df_offline["data_desconexao"].isna()
+
+        agora_utc = pd.Timestamp(datetime.now(timezone.utc))
+        horas = (agora_utc - df_offline["data_desconexao"]).dt.total_seconds() / 3600
+        df_offline["horas_offline"] = np.trunc(horas).astype("Int64") if sem_data.any() else horas.astype(int)
+    with metricas.etapa("mapeamento_cidades"):
+        df_offline["cidade"] = mapear_cidades(df_offline["olt_regiao"]) if "olt_regiao" in df_offline.columns else "Outra"
 
     numeric_cols = ['rx_onu', 'rx_olt', 'distancia_m']
     for col in numeric_cols:
@@ -137,29 +222,71 @@ def processar_relatorio_desconexao(df: pd.DataFrame, relatorio_id: int, supabase
             if col == 'distancia_m':
                 df_offline[col] = df_offline[col].astype('Int64')
 
-    colunas_db = [
-        "nome_cliente", "serial_onu", "olt_regiao", "data_desconexao", 
-        "horas_offline", "cidade", "motivo_desconexao", "cto", "slot_pon_onu", 
-        "modelo_onu", "rx_onu", "rx_olt", "distancia_m"
-    ]
-    
-    for col in colunas_db:
+    for col in COLUNAS_CLIENTES_OFF:
         if col not in df_offline.columns:
             df_offline[col] = None
 
     df_offline["relatorio_id"] = relatorio_id
-    
-    df_final = df_offline[colunas_db + ["relatorio_id"]].copy()
-    df_final = df_final.where(pd.notna(df_final), None)
-    dados_para_inserir = df_final.to_dict("records")
+    return df_offline[COLUNAS_CLIENTES_OFF + ["relatorio_id"]]
+
+
+def gravar_desconexao(
+    df_final: pd.DataFrame, relatorio_id: int, supabase_client, progresso=None, contexto=None, olts: Iterable[str] = (),
+) -> None:
+    """Grava as linhas preparadas por `preparar_desconexao` (histórico por relatório ou diff incremental).
+
+    `olts` são as OLTs presentes no snapshot, inclusive as que só tinham ONUs
+    online; no modo incremental elas delimitam as ONUs recuperadas.
+    """
+    from ..erp import ERP_ENRIQUECER_DESCONEXAO, enriquecer_com_erp, obter_enriquecimento
+
+    if ERP_ENRIQUECER_DESCONEXAO and not df_final.empty:
+        df_final = enriquecer_com_erp(df_final, sessao=obter_enriquecimento(contexto))
+
+    if MODO_INGESTAO == "incremental":
+        sessao_incremental = desconexao_incremental.obter_sessao(contexto, supabase_client, relatorio_id, progresso)
+        sessao_incremental.registrar_olts(olts)
+        if df_final.empty:
+            logger.info("Nenhum cliente com status 'LOSS' ou 'Sem Energia' foi encontrado.")
+        else:
+            gravados = sessao_incremental.aplicar(df_final)
+            logger.info(f"{gravados} de {len(df_final)} clientes offline novos ou alterados gravados no DB.")
+        if contexto is None:
+            sessao_incremental.finalizar()
+        return
+
+    if df_final.empty:
+        logger.info("Nenhum cliente com status 'LOSS' ou 'Sem Energia' foi encontrado.")
+    else:
+        logger.info(f"Inserindo {len(df_final)} registros de clientes offline no DB.")
+        if progresso:
+            progresso.prever(len(df_final))
+        try:
+            inserir_em_lotes(supabase_client, 'clientes_off', df_final, progresso=progresso)
+        except Exception as e:
+            raise Exception(f"Falha ao salvar clientes no banco de dados: {e}") from e
+    # No modo incremental `clientes_off` já é o estado atual (uma linha por ONU): não há o que resumir
+    resumo = resumos.obter_resumo(contexto, relatorio_id, "desconexao")
+    resumo.acumular_desconexao(df_final)
+    if contexto is None:
+        resumo.gravar(supabase_client)
+
+
+def processar_relatorio_desconexao(df: pd.DataFrame, relatorio_id: int, supabase_client, progresso=None, contexto=None) -> None:
+    logger.info(f"Processando relatório de DESCONEXÃO para o ID: {relatorio_id}")
 
-    for record in dados_para_inserir:
-        if record.get("data_desconexao"):
-            record["data_desconexao"] = record["data_desconexao"].isoformat()
+    # OLTs vistas pelo filtro da ingestão (inclusive as de linhas já descartadas) e as do próprio chunk
+    olts = set((contexto or {}).pop("olts_no_arquivo", ()))
+    df_final = preparar_desconexao(df, relatorio_id, olts if MODO_INGESTAO == "incremental" else None)
+    metricas.contar("linhas_offline", len(df_final))
+    gravar_desconexao(df_final, relatorio_id, supabase_client, progresso, contexto, olts)
 
-    if dados_para_inserir:
-        logger.info(f"Inserindo {len(dados_para_inserir)} registros de clientes offline no DB.")
-        insert_res = supabase_client.table('clientes_off').insert(dados_para_inserir).execute()
-        if hasattr(insert_res, 'error') and insert_res.error:
-            raise Exception(f"Falha ao salvar clientes no banco de dados: {insert_res.error}")
 
+def finalizar_relatorio_desconexao(relatorio_id: int, supabase_client, contexto: dict) -> None:
+    """Executado após o último chunk: grava o resumo do relatório ou, no modo incremental, registra as ONUs recuperadas."""
+    sessao_incremental = contexto.get("incremental")
+    if sessao_incremental:
+        sessao_incremental.finalizar()
+    elif MODO_INGESTAO != "incremental":
+        # Relatórios sem ONUs offline também têm resumo (zerado)
+        resumos.obter_resumo(contexto, relatorio_id, "desconexao").gravar(supabase_client)
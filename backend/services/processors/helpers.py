@@ -1,27 +1,119 @@
+import threading
 import unicodedata
-from typing import Dict, List
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import pandas as pd
+
+# Trocas aplicadas por `normalize_text` depois de remover acentos, minúsculas e espaços nas pontas
+_TROCAS_NORMALIZACAO = str.maketrans({" ": "_", "-": "_", "(": None, ")": None})
+
+# Layouts de cabeçalho já resolvidos (ver `resolver_layout`); os exports costumam ter poucos layouts distintos
+LAYOUTS_MAXIMO = 256
 
 def normalize_text(text: str) -> str:
     """Função para limpar e padronizar texto."""
     if not isinstance(text, str):
         return ""
+    return _normalizar(text)
+
+@lru_cache(maxsize=4096)
+def _normalizar(text: str) -> str:
     nfkd_form = unicodedata.normalize('NFKD', text)
     ascii_text = nfkd_form.encode('ASCII', 'ignore').decode('utf-8')
-    return ascii_text.lower().strip().replace(' ', '_').replace('-', '_').replace('(', '').replace(')', '')
+    return ascii_text.lower().strip().translate(_TROCAS_NORMALIZACAO)
 
-def normalize_and_map_columns(df, column_aliases: Dict[str, List[str]]):
-    """Normaliza as colunas do DataFrame e as renomeia com base em um dicionário de aliases."""
-    
-    df.columns = [normalize_text(col) for col in df.columns]
-    
+# id do dict de aliases -> (o próprio dict, nomes normalizados aceitos para cada coluna do DB)
+_ALIASES_NORMALIZADOS: Dict[int, Tuple[Dict[str, List[str]], Dict[str, Tuple[str, ...]]]] = {}
+
+def normalizar_aliases(column_aliases: Dict[str, List[str]]) -> Dict[str, Tuple[str, ...]]:
+    """Nomes normalizados aceitos para cada coluna do DB (ela própria primeiro, depois os aliases, em ordem).
+
+    Calculado uma vez por mapa de aliases; os processadores registrados são
+    normalizados já na importação (ver processors/__init__.py).
+    """
+    registro = _ALIASES_NORMALIZADOS.get(id(column_aliases))
+    if registro is None or registro[0] is not column_aliases:
+        candidatos = {
+            db_col: tuple(dict.fromkeys(normalize_text(alias) for alias in [db_col] + aliases))
+            for db_col, aliases in column_aliases.items()
+        }
+        registro = _ALIASES_NORMALIZADOS[id(column_aliases)] = (column_aliases, candidatos)
+    return registro[1]
+
+def resolver_aliases(normalized_columns: List[str], column_aliases: Dict[str, List[str]]) -> Dict[str, str]:
+    """Mapeia nomes de coluna já normalizados para as colunas do DB, usando o primeiro alias encontrado."""
+    presentes = set(normalized_columns)
     rename_map = {}
-    for db_col, aliases in column_aliases.items():
-        # Adiciona o próprio nome da coluna de DB como um possível alias
-        possible_names = [normalize_text(alias) for alias in [db_col] + aliases]
+    for db_col, possible_names in normalizar_aliases(column_aliases).items():
         for name in possible_names:
-            if name in df.columns:
+            if name in presentes:
                 rename_map[name] = db_col
                 break # Pára no primeiro alias encontrado
-    
-    df.rename(columns=rename_map, inplace=True)
+    return rename_map
+
+class LayoutDeColunas(NamedTuple):
+    """Resolução de um cabeçalho bruto para um mapa de aliases (e tipos) de processador."""
+    # Nomes finais das colunas, na ordem do cabeçalho: normalizados e, se casarem com um alias, já o nome no DB
+    nomes: Tuple[str, ...]
+    # Nome normalizado -> coluna do DB (regra de `normalize_and_map_columns`)
+    rename_map: Dict[str, str]
+    # Posição no cabeçalho -> coluna do DB; se o nome se repetir, vale a primeira ocorrência
+    posicoes: Dict[int, str]
+    # Plano de conversão: posição no cabeçalho -> tipo declarado da coluna (ver `converter_tipos`)
+    tipos: Dict[int, str]
+
+_LAYOUTS: Dict[tuple, LayoutDeColunas] = {}
+_LAYOUTS_LOCK = threading.Lock()
+
+def resolver_layout(
+    cabecalho: Sequence, column_aliases: Dict[str, List[str]], column_types: Optional[Dict[str, str]] = None,
+) -> LayoutDeColunas:
+    """Layout do cabeçalho, memoizado pela tupla de nomes brutos: o mesmo export não é resolvido duas vezes."""
+    tipos = column_types or {}
+    chave = (id(normalizar_aliases(column_aliases)), tuple(sorted(tipos.items())), tuple(cabecalho))
+    layout = _LAYOUTS.get(chave)
+    if layout is not None:
+        return layout
+
+    normalizadas = [normalize_text(coluna) for coluna in cabecalho]
+    rename_map = resolver_aliases(normalizadas, column_aliases)
+    posicoes: Dict[int, str] = {}
+    for i, nome in enumerate(normalizadas):
+        if nome in rename_map and rename_map[nome] not in posicoes.values():
+            posicoes[i] = rename_map[nome]
+    layout = LayoutDeColunas(
+        nomes=tuple(rename_map.get(nome, nome) for nome in normalizadas),
+        rename_map=rename_map,
+        posicoes=posicoes,
+        tipos={i: tipos[coluna] for i, coluna in posicoes.items() if coluna in tipos},
+    )
+    with _LAYOUTS_LOCK:
+        if len(_LAYOUTS) >= LAYOUTS_MAXIMO:
+            _LAYOUTS.pop(next(iter(_LAYOUTS)))
+        _LAYOUTS[chave] = layout
+    return layout
+
+def normalize_and_map_columns(df, column_aliases: Dict[str, List[str]]):
+    """Normaliza as colunas do DataFrame e as renomeia com base em um dicionário de aliases.
+
+    Retorna um novo DataFrame (sem copiar os dados); o DataFrame recebido não é alterado.
+    """
+    layout = resolver_layout(tuple(df.columns), column_aliases)
+    return df.set_axis(list(layout.nomes), axis=1)
+
+def converter_tipos(df, column_types: Dict[str, str]):
+    """Converte as colunas presentes no DataFrame para os tipos declarados pelo processador.
+
+    Valores inválidos viram NaN/NaT; "datetime" interpreta datas sem fuso como UTC.
+    """
+    for col, tipo in column_types.items():
+        if col not in df.columns:
+            continue
+        if tipo == "datetime":
+            df[col] = pd.to_datetime(df[col], errors='coerce', utc=True)
+        elif tipo.startswith("float"):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(tipo)
+        else:
+            df[col] = df[col].astype(tipo)
     return df
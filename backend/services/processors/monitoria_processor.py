@@ -1,13 +1,138 @@
 import pandas as pd
+import numpy as np
 import logging
+from .helpers import normalize_and_map_columns
+from ..bulk_writer import inserir_em_lotes
+from .. import metricas
+from . import resumos
 
 logger = logging.getLogger(__name__)
 
-def processar_relatorio_monitoria(df: pd.DataFrame, relatorio_id: int, supabase_client) -> None:
-    logger.info(f"[Monitoria Processor] Iniciando | Relatório ID={relatorio_id}")
-    logger.info(f"[Monitoria Processor] Colunas recebidas: {df.columns.tolist()}")
+# Mapeamento de colunas para a planilha de Monitoria de Qualidade (uma linha por avaliação)
+MONITORIA_COLUMN_ALIASES = {
+    "agente": ["atendente", "nome", "colaborador", "operador", "agente avaliado"],
+    "data_monitoria": ["data", "data da monitoria", "data avaliacao", "data da avaliacao"],
+    "avaliador": ["monitor", "avaliador", "supervisor", "responsavel"],
+    "protocolo": ["protocolo", "id atendimento", "atendimento"],
+    "canal": ["canal", "tipo de atendimento"],
+    "nota": ["nota", "nota final", "nota monitoria", "resultado"],
+    "pontos_obtidos": ["pontos obtidos", "pontuacao obtida", "pontuacao"],
+    "pontos_possiveis": ["pontos possiveis", "pontuacao maxima", "pontuacao possivel"],
+    "falha_critica": ["falha critica", "erro critico", "nc critica"],
+}
 
-    # Ainda não implementado
-    logger.warning("[Monitoria Processor] Processamento não implementado - apenas logando colunas.")
-    
-    pass
+# Tipos aplicados já na leitura (ver ingestion.ler_arquivo_em_chunks). Notas e pontos ficam
+# como texto até `calcular_notas`, que aceita vírgula decimal e percentuais.
+MONITORIA_COLUMN_TYPES = {
+    "agente": "category",
+    "canal": "category",
+    "data_monitoria": "datetime",
+}
+
+# Escala da nota gravada (a mesma da nota de monitoria do SAC)
+NOTA_MAXIMA = 10.0
+
+# Valores de `falha_critica` que zeram a nota da avaliação
+VALORES_VERDADEIROS = ["SIM", "S", "X", "1", "TRUE", "VERDADEIRO"]
+
+# Colunas gravadas em `monitoria` (além de `relatorio_id`)
+COLUNAS_MONITORIA = [
+    "agente", "data_monitoria", "avaliador", "protocolo", "canal", "nota", "falha_critica",
+]
+
+
+def _numero(serie: pd.Series) -> pd.Series:
+    """Converte notas e pontos para float, aceitando vírgula decimal ("8,5") e "%"."""
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype("float64")
+    texto = serie.astype("string").str.strip().str.rstrip("%").str.replace(",", ".", regex=False)
+    return pd.to_numeric(texto, errors="coerce").astype("float64")
+
+
+def marcar_falhas_criticas(serie: pd.Series) -> pd.Series:
+    """True nas avaliações com falha crítica ("Sim", "X", 1...); ausentes contam como False."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Avalia cada categoria uma vez; o código -1 (ausente) cai no False final
+        marcadas = serie.cat.categories.astype(str).str.strip().str.upper().isin(VALORES_VERDADEIROS)
+        return pd.Series(np.append(marcadas, False)[serie.cat.codes.to_numpy()], index=serie.index)
+    return serie.astype("string").str.strip().str.upper().isin(VALORES_VERDADEIROS).fillna(False).astype(bool)
+
+
+def calcular_notas(df: pd.DataFrame) -> pd.Series:
+    """Nota de 0 a 10 de cada avaliação.
+
+    Usa a nota da planilha; sem ela, a razão entre pontos obtidos e possíveis.
+    Notas em percentual (acima de 10) são trazidas para a escala 0-10 e uma
+    falha crítica zera a avaliação.
+    """
+    nota = _numero(df["nota"]) if "nota" in df.columns else pd.Series(np.nan, index=df.index)
+    if "pontos_obtidos" in df.columns and "pontos_possiveis" in df.columns:
+        possiveis = _numero(df["pontos_possiveis"])
+        pela_pontuacao = NOTA_MAXIMA * _numero(df["pontos_obtidos"]) / possiveis.where(possiveis > 0)
+        nota = nota.fillna(pela_pontuacao)
+    nota = nota.where(nota <= NOTA_MAXIMA, nota / 10)
+    if "falha_critica" in df.columns:
+        nota = nota.mask(marcar_falhas_criticas(df["falha_critica"]) & nota.notna(), 0.0)
+    return nota.clip(0, NOTA_MAXIMA).round(2)
+
+
+def processar_relatorio_monitoria(df: pd.DataFrame, relatorio_id: int, supabase_client, progresso=None, contexto=None) -> None:
+    logger.info(f"Processando relatório de MONITORIA para o ID: {relatorio_id}")
+
+    with metricas.etapa("normalizacao"):
+        df_renamed = normalize_and_map_columns(df, MONITORIA_COLUMN_ALIASES)
+
+    if "agente" not in df_renamed.columns:
+        raise ValueError("[Processador de Monitoria] O arquivo deve conter uma coluna para 'Atendente' (ou 'Agente').")
+    if "nota" not in df_renamed.columns and not {"pontos_obtidos", "pontos_possiveis"} <= set(df_renamed.columns):
+        raise ValueError(
+            "[Processador de Monitoria] O arquivo deve conter a coluna 'Nota' ou as colunas 'Pontos Obtidos' e 'Pontos Possíveis'."
+        )
+
+    with metricas.etapa("pontuacao"):
+        notas = calcular_notas(df_renamed)
+        falhas = (
+            marcar_falhas_criticas(df_renamed["falha_critica"]) if "falha_critica" in df_renamed.columns
+            else pd.Series(False, index=df_renamed.index)
+        )
+
+    # Sem agente ou sem nota a avaliação não entra no ranking; linhas em branco da planilha caem aqui
+    agentes = df_renamed["agente"].astype("string").str.strip()
+    validas = agentes.notna() & (agentes != "") & notas.notna()
+    descartadas = int((~validas).sum())
+    if descartadas:
+        metricas.contar("linhas_descartadas", descartadas)
+
+    df_final = pd.DataFrame({
+        "agente": agentes[validas],
+        "data_monitoria": (
+            pd.to_datetime(df_renamed.loc[validas, "data_monitoria"], errors="coerce", utc=True)
+            if "data_monitoria" in df_renamed.columns else None
+        ),
+        "nota": notas[validas],
+        "falha_critica": falhas[validas],
+    })
+    for col in ("avaliador", "protocolo", "canal"):
+        df_final[col] = df_renamed.loc[validas, col].astype("string").str.strip() if col in df_renamed.columns else None
+    df_final = df_final[COLUNAS_MONITORIA]
+    df_final["relatorio_id"] = relatorio_id
+
+    if not df_final.empty:
+        logger.info(f"Inserindo {len(df_final)} avaliações de monitoria no DB.")
+        if progresso:
+            progresso.prever(len(df_final))
+        try:
+            inserir_em_lotes(supabase_client, 'monitoria', df_final, progresso=progresso)
+        except Exception as e:
+            raise Exception(f"Falha ao salvar avaliações de monitoria no banco: {e}") from e
+        resumo = resumos.obter_resumo(contexto, relatorio_id, "monitoria")
+        resumo.acumular_monitoria(df_final)
+        if contexto is None:
+            resumo.gravar(supabase_client)
+    else:
+        logger.warning(f"Nenhuma avaliação válida encontrada para o relatório de Monitoria ID: {relatorio_id}")
+
+
+def finalizar_relatorio_monitoria(relatorio_id: int, supabase_client, contexto: dict) -> None:
+    """Executado após o último chunk: grava o resumo por agente e dia do relatório."""
+    resumos.obter_resumo(contexto, relatorio_id, "monitoria").gravar(supabase_client)
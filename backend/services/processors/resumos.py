@@ -0,0 +1,200 @@
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..bulk_writer import inserir_em_lotes
+from .. import metricas
+from .desconexao_incremental import HORAS_OFFLINE_FAIXAS
+
+logger = logging.getLogger(__name__)
+
+# Tabelas de resumo (uma ou poucas linhas por relatório) lidas pelas rotas /stats;
+# ver docs/migrations/004_resumos_relatorios.sql, que também define o recálculo em SQL.
+TABELAS_RESUMO = ("resumo_desconexao", "resumo_sac_agente", "resumo_monitoria_agente", "resumo_relatorios")
+
+# Dimensão gravada em `resumo_desconexao` -> coluna de `clientes_off`
+DIMENSOES_DESCONEXAO = {
+    "cidade": "cidade",
+    "olt_regiao": "olt_regiao",
+    "motivo": "motivo_desconexao",
+}
+
+# A CTO é quase única por ONU: o resumo guarda só as RESUMO_CTO_TOP_N CTOs com mais ONUs
+# offline de cada relatório e soma as demais numa linha "outros", para não crescer com as linhas
+RESUMO_CTO_TOP_N = int(os.getenv("RESUMO_CTO_TOP_N", "50"))
+CTO_OUTROS = "outros"
+
+# Casos abertos até 24h antes do processamento também são contados por hora, para o KPI de novos casos
+JANELA_HORAS_RECENTES = pd.Timedelta(hours=24)
+
+_ROTULOS_FAIXAS = [
+    f"{inicio}-{fim}" for inicio, fim in zip(HORAS_OFFLINE_FAIXAS, HORAS_OFFLINE_FAIXAS[1:])
+] + [f"{HORAS_OFFLINE_FAIXAS[-1]}+"]
+
+
+def rotular_faixas_horas(horas: pd.Series) -> pd.Series:
+    """Rótulo da faixa de `horas_offline` de cada linha (ex.: "24-48", "168+"); negativas contam na primeira."""
+    valores = pd.to_numeric(horas, errors="coerce").to_numpy(dtype=float)
+    faixas = np.clip(np.searchsorted(HORAS_OFFLINE_FAIXAS, valores, side="right") - 1, 0, None)
+    rotulos = np.asarray(_ROTULOS_FAIXAS, dtype=object)[faixas]
+    return pd.Series(np.where(np.isnan(valores), None, rotulos), index=horas.index)
+
+
+def _contar(valores: pd.Series) -> Dict[str, int]:
+    contagem = valores.dropna().astype(str).value_counts()
+    return {valor: int(total) for valor, total in contagem.items() if total}
+
+
+class ResumoRelatorio:
+    """Agregados de um relatório, acumulados chunk a chunk durante a ingestão.
+
+    As rotas de estatísticas leem só esses resumos, então o custo delas cresce
+    com o número de relatórios e não com as linhas já ingeridas. Gravar de novo
+    o resumo do mesmo relatório (ex.: reprocessamento) substitui o anterior.
+    """
+
+    def __init__(self, relatorio_id: int, tipo: str):
+        self.relatorio_id = relatorio_id
+        self.tipo = tipo
+        self.gerado_em = pd.Timestamp.now(tz="UTC")
+        self.registros = 0
+        self.caso_mais_antigo: Optional[pd.Timestamp] = None
+        self.contagens: Dict[Tuple[str, str], int] = defaultdict(int)
+        # Todas as CTOs do relatório; só as principais chegam ao resumo (ver `_contagens_cto`)
+        self.ctos: Dict[str, int] = defaultdict(int)
+        # agente -> [registros, soma das notas, soma dos tempos]
+        self.agentes: Dict[str, list] = defaultdict(lambda: [0, 0.0, 0.0])
+        # Agregados parciais de monitoria por agente e dia, um por chunk (somados em `gravar`)
+        self.monitoria: List[pd.DataFrame] = []
+
+    def _somar(self, dimensao: str, valores: pd.Series) -> None:
+        for valor, total in _contar(valores).items():
+            self.contagens[(dimensao, valor)] += total
+
+    def acumular_desconexao(self, df: pd.DataFrame) -> None:
+        """Soma as ONUs offline do chunk (já no formato de `clientes_off`)."""
+        if df.empty:
+            return
+        with metricas.etapa("resumo"):
+            self.registros += len(df)
+            for dimensao, coluna in DIMENSOES_DESCONEXAO.items():
+                valores = df[coluna]
+                if dimensao == "motivo":
+                    valores = valores.astype(object).where(valores.notna()).str.strip().str.upper()
+                self._somar(dimensao, valores)
+            self._somar("faixa_horas_offline", rotular_faixas_horas(df["horas_offline"]))
+            for cto, total in _contar(df["cto"]).items():
+                self.ctos[cto] += total
+
+            datas = pd.to_datetime(df["data_desconexao"], errors="coerce", utc=True).dropna()
+            if datas.empty:
+                return
+            self._somar("data", datas.dt.strftime("%Y-%m-%d"))
+            recentes = datas[datas >= self.gerado_em - JANELA_HORAS_RECENTES]
+            self._somar("hora", recentes.dt.floor("h").dt.strftime("%Y-%m-%dT%H:00:00+00:00"))
+            mais_antigo = datas.min()
+            if self.caso_mais_antigo is None or mais_antigo < self.caso_mais_antigo:
+                self.caso_mais_antigo = mais_antigo
+
+    def acumular_sac(self, df: pd.DataFrame) -> None:
+        """Soma notas e tempos por agente do chunk (já no formato de `sac_performance`)."""
+        if df.empty:
+            return
+        with metricas.etapa("resumo"):
+            self.registros += len(df)
+            validos = df[df["agente"].notna()]
+            por_agente = validos.groupby(validos["agente"].astype(str), sort=False).agg(
+                registros=("agente", "size"),
+                soma_nota=("nota_monitoria", "sum"),
+                soma_tempo=("tempo_medio_atendimento_minutos", "sum"),
+            )
+            for agente, linha in por_agente.iterrows():
+                acumulado = self.agentes[agente]
+                acumulado[0] += int(linha["registros"])
+                acumulado[1] += float(linha["soma_nota"])
+                acumulado[2] += float(linha["soma_tempo"])
+
+    def acumular_monitoria(self, df: pd.DataFrame) -> None:
+        """Soma avaliações, notas e falhas críticas por agente e dia do chunk (já no formato de `monitoria`)."""
+        if df.empty:
+            return
+        with metricas.etapa("resumo"):
+            self.registros += len(df)
+            # Agrupa pelo dia (normalize) e só formata as chaves em `_agregar_monitoria`;
+            # avaliações sem data ficam num grupo próprio (data nula)
+            datas = pd.to_datetime(df["data_monitoria"], errors="coerce", utc=True).dt.normalize()
+            chaves = [df["agente"].astype(str), datas.rename("data")]
+            self.monitoria.append(
+                df.groupby(chaves, sort=False, dropna=False, observed=True).agg(
+                    avaliacoes=("nota", "size"),
+                    soma_nota=("nota", "sum"),
+                    falhas_criticas=("falha_critica", "sum"),
+                )
+            )
+
+    def _contagens_cto(self) -> Dict[str, int]:
+        """As RESUMO_CTO_TOP_N CTOs com mais ONUs offline (empates pelo nome) e o restante somado em "outros"."""
+        ordenadas = sorted(self.ctos.items(), key=lambda item: (-item[1], item[0]))
+        contagens = dict(ordenadas[:RESUMO_CTO_TOP_N])
+        resto = sum(total for _, total in ordenadas[RESUMO_CTO_TOP_N:])
+        if resto:
+            contagens[CTO_OUTROS] = contagens.get(CTO_OUTROS, 0) + resto
+        return contagens
+
+    def _agregar_monitoria(self) -> List[Dict]:
+        if not self.monitoria:
+            return []
+        total = pd.concat(self.monitoria).groupby(level=[0, 1], sort=False, dropna=False).sum().reset_index()
+        total["data"] = total["data"].dt.strftime("%Y-%m-%d")
+        total["relatorio_id"] = self.relatorio_id
+        total = total.astype({"avaliacoes": "int64", "falhas_criticas": "int64"})
+        return total.astype(object).where(total.notna(), None).to_dict("records")
+
+    def gravar(self, supabase_client) -> None:
+        """Substitui o resumo do relatório nas tabelas de resumo."""
+        with metricas.etapa("gravacao_resumo"):
+            remover_resumos(supabase_client, self.relatorio_id)
+            contagens = {**self.contagens, **{("cto", cto): total for cto, total in self._contagens_cto().items()}}
+            if contagens:
+                inserir_em_lotes(supabase_client, "resumo_desconexao", [
+                    {"relatorio_id": self.relatorio_id, "dimensao": dimensao, "valor": valor, "total": total}
+                    for (dimensao, valor), total in contagens.items()
+                ])
+            if self.agentes:
+                inserir_em_lotes(supabase_client, "resumo_sac_agente", [
+                    {"relatorio_id": self.relatorio_id, "agente": agente, "registros": registros,
+                     "soma_nota": soma_nota, "soma_tempo": soma_tempo}
+                    for agente, (registros, soma_nota, soma_tempo) in self.agentes.items()
+                ])
+            monitoria = self._agregar_monitoria()
+            if monitoria:
+                inserir_em_lotes(supabase_client, "resumo_monitoria_agente", monitoria)
+            supabase_client.table("resumo_relatorios").insert({
+                "relatorio_id": self.relatorio_id,
+                "tipo": self.tipo,
+                "registros": self.registros,
+                "caso_mais_antigo": self.caso_mais_antigo.isoformat() if self.caso_mais_antigo is not None else None,
+                "gerado_em": self.gerado_em.isoformat(),
+            }).execute()
+        logger.info(
+            f"[Resumo] Relatório ID={self.relatorio_id}: {self.registros} registros resumidos em "
+            f"{len(contagens) + len(self.agentes) + len(monitoria)} linhas."
+        )
+
+
+def remover_resumos(supabase_client, relatorio_id: int) -> None:
+    for tabela in TABELAS_RESUMO:
+        supabase_client.table(tabela).delete().eq("relatorio_id", relatorio_id).execute()
+
+
+def obter_resumo(contexto: Optional[dict], relatorio_id: int, tipo: str) -> ResumoRelatorio:
+    """Reaproveita o resumo do relatório entre chunks (guardado em `contexto`)."""
+    if contexto is None:
+        return ResumoRelatorio(relatorio_id, tipo)
+    if "resumo" not in contexto:
+        contexto["resumo"] = ResumoRelatorio(relatorio_id, tipo)
+    return contexto["resumo"]
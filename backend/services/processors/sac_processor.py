@@ -1,6 +1,9 @@
 import pandas as pd
 import logging
 from .helpers import normalize_and_map_columns
+from ..bulk_writer import inserir_em_lotes
+from .. import metricas
+from . import resumos
 
 logger = logging.getLogger(__name__)
 
@@ -15,26 +18,27 @@ SAC_COLUMN_ALIASES = {
     "tempo_medio_atendimento_minutos": ["tempo medio", "tempo_medio"]
 }
 
-def time_str_to_minutes(time_str):
-    """Converte uma string de tempo (ex: HH:MM:SS ou MM:SS) para um total de minutos."""
-    if pd.isna(time_str) or not isinstance(time_str, str):
-        return 0
-    try:
-        parts = list(map(int, time_str.split(':')))
-        if len(parts) == 3:
-            h, m, s = parts
-            return h * 60 + m
-        elif len(parts) == 2:
-            m, s = parts
-            return m
-        return 0
-    except (ValueError, IndexError):
-        return 0
-
-def processar_relatorio_sac(df: pd.DataFrame, relatorio_id: int, supabase_client) -> None:
+# HH:MM:SS ou MM:SS, com as mesmas tolerâncias do int() (sinal e espaços em volta de cada parte)
+_TEMPO_PATTERN = r'^\s*([+-]?\d+)\s*:\s*([+-]?\d+)\s*(?::\s*([+-]?\d+)\s*)?$'
+
+def time_str_to_minutes(serie: pd.Series) -> pd.Series:
+    """Converte uma coluna de tempos (ex: HH:MM:SS ou MM:SS) para o total de minutos.
+
+    Valores ausentes, não textuais ou em formato inválido resultam em 0.
+    """
+    if serie.dtype != object and not pd.api.types.is_string_dtype(serie):
+        return pd.Series(0, index=serie.index, dtype="int64")
+    # Em colunas object, o acessor .str devolve NaN para valores que não são texto
+    partes = serie.astype(object).str.extract(_TEMPO_PATTERN).apply(pd.to_numeric)
+    tem_horas = partes[2].notna()
+    minutos = partes[0].where(~tem_horas, partes[0] * 60 + partes[1])
+    return minutos.fillna(0).astype("int64")
+
+def processar_relatorio_sac(df: pd.DataFrame, relatorio_id: int, supabase_client, progresso=None, contexto=None) -> None:
     logger.info(f"Processando relatório de PERFORMANCE SAC para o ID: {relatorio_id}")
 
-    df_renamed = normalize_and_map_columns(df, SAC_COLUMN_ALIASES)
+    with metricas.etapa("normalizacao"):
+        df_renamed = normalize_and_map_columns(df, SAC_COLUMN_ALIASES)
 
     required_cols = ["agente", "nota_monitoria"]
     if not all(col in df_renamed.columns for col in required_cols):
@@ -53,14 +57,15 @@ def processar_relatorio_sac(df: pd.DataFrame, relatorio_id: int, supabase_client
     for col in numeric_cols:
         df_renamed[col] = pd.to_numeric(df_renamed[col], errors='coerce').fillna(0)
 
-    df_renamed['tempo_medio_atendimento_minutos'] = df_renamed['tempo_medio_atendimento_minutos'].apply(time_str_to_minutes)
+    with metricas.etapa("conversao_tempo"):
+        df_renamed['tempo_medio_atendimento_minutos'] = time_str_to_minutes(df_renamed['tempo_medio_atendimento_minutos'])
 
     colunas_db = [
         "agente", "data_atendimento", "nota_monitoria", 
         "tempo_medio_atendimento_minutos", "atendimentos", 
         "cliente_atendido", "encerrado"
     ]
-    df_final = df_renamed.copy()
+    df_final = df_renamed
     
     # Adiciona colunas que possam faltar
     for col in colunas_db:
@@ -70,20 +75,23 @@ def processar_relatorio_sac(df: pd.DataFrame, relatorio_id: int, supabase_client
     df_final = df_final[colunas_db]
     df_final['relatorio_id'] = relatorio_id
     
-    df_final = df_final.where(pd.notna(df_final), None)
-    dados_para_inserir = df_final.to_dict("records")
-
-    for record in dados_para_inserir:
-        if pd.notna(record.get("data_atendimento")):
-            record["data_atendimento"] = record["data_atendimento"].isoformat()
-        else:
-            record["data_atendimento"] = None
-
-    if dados_para_inserir:
-        logger.info(f"Inserindo {len(dados_para_inserir)} registros de performance do SAC no DB.")
-        insert_res = supabase_client.table('sac_performance').insert(dados_para_inserir).execute()
-        if hasattr(insert_res, 'error') and insert_res.error:
-            raise Exception(f"Falha ao salvar dados do SAC no banco: {insert_res.error}")
+    if not df_final.empty:
+        logger.info(f"Inserindo {len(df_final)} registros de performance do SAC no DB.")
+        if progresso:
+            progresso.prever(len(df_final))
+        try:
+            inserir_em_lotes(supabase_client, 'sac_performance', df_final, progresso=progresso)
+        except Exception as e:
+            raise Exception(f"Falha ao salvar dados do SAC no banco: {e}") from e
+        resumo = resumos.obter_resumo(contexto, relatorio_id, "sac")
+        resumo.acumular_sac(df_final)
+        if contexto is None:
+            resumo.gravar(supabase_client)
     else:
         logger.warning(f"Nenhum registro válido encontrado para o relatório de SAC ID: {relatorio_id}")
 
+
+def finalizar_relatorio_sac(relatorio_id: int, supabase_client, contexto: dict) -> None:
+    """Executado após o último chunk: grava o resumo por agente do relatório."""
+    resumos.obter_resumo(contexto, relatorio_id, "sac").gravar(supabase_client)
+
@@ -0,0 +1,147 @@
+import importlib.util
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração do pool de conexões com o PostgREST do Supabase ---
+SUPABASE_HTTP_TIMEOUT_S = float(os.getenv("SUPABASE_HTTP_TIMEOUT", "10"))
+SUPABASE_HTTP_MAX_CONNECTIONS = int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "100"))
+SUPABASE_HTTP_KEEPALIVE = int(os.getenv("SUPABASE_HTTP_KEEPALIVE", "20"))
+# HTTP/2 multiplexa as requisições numa única conexão; exige o pacote `h2`
+HTTP2_DISPONIVEL = importlib.util.find_spec("h2") is not None
+
+Filtros = Optional[Dict[str, str]]
+
+
+class ErroPostgrest(Exception):
+    """Resposta de erro do PostgREST (status HTTP fora da faixa 2xx)."""
+
+    def __init__(self, status_code: int, mensagem: str):
+        super().__init__(f"[{status_code}] {mensagem}")
+        self.status_code = status_code
+        self.mensagem = mensagem
+
+
+def literal(valor: Any) -> str:
+    """Valor pronto para listas e condições lógicas do PostgREST (textos entre aspas, com escape)."""
+    if isinstance(valor, str):
+        return '"' + valor.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return str(valor)
+
+
+def eq(valor: Any) -> str:
+    return f"eq.{valor}"
+
+
+def neq(valor: Any) -> str:
+    return f"neq.{valor}"
+
+
+def in_(valores: Iterable[Any]) -> str:
+    return "in.(" + ",".join(literal(v) for v in valores) + ")"
+
+
+class PostgrestAsync:
+    """Cliente assíncrono e enxuto para a API REST do Supabase.
+
+    Mantém um único `httpx.AsyncClient` (pool de conexões com keep-alive e
+    HTTP/2 quando disponível) compartilhado por todas as rotas. Cada chamada
+    aceita um `timeout` próprio. Os filtros seguem a sintaxe do PostgREST, ex.:
+    `{"id": eq(10)}`.
+    """
+
+    def __init__(self, url: str, key: str, timeout: float = SUPABASE_HTTP_TIMEOUT_S):
+        self.base_url = url.rstrip("/") + "/rest/v1"
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"apikey": key, "Authorization": f"Bearer {key}"},
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=SUPABASE_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=SUPABASE_HTTP_KEEPALIVE,
+            ),
+            http2=HTTP2_DISPONIVEL,
+        )
+
+    async def fechar(self) -> None:
+        await self._client.aclose()
+
+    async def _requisitar(self, metodo: str, caminho: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        resposta = await self._client.request(metodo, caminho, **kwargs)
+        if resposta.is_error:
+            try:
+                corpo = resposta.json()
+                mensagem = corpo.get("message") or str(corpo)
+            except ValueError:
+                mensagem = resposta.text
+            raise ErroPostgrest(resposta.status_code, mensagem)
+        return resposta
+
+    async def rpc(self, funcao: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        resposta = await self._requisitar("POST", f"/rpc/{funcao}", json=params or {}, timeout=timeout)
+        return resposta.json() if resposta.content else None
+
+    async def select(
+        self,
+        tabela: str,
+        colunas: str = "*",
+        filtros: Filtros = None,
+        ordem: Optional[str] = None,
+        limite: Optional[int] = None,
+        unico: bool = False,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Consulta `tabela`. Com `unico=True` retorna um dict, ou None se não houver linha."""
+        # O PostgREST não aceita espaços na lista de colunas
+        params: Dict[str, Any] = {"select": "".join(colunas.split()), **(filtros or {})}
+        if ordem:
+            params["order"] = ordem
+        if limite is not None:
+            params["limit"] = limite
+        if unico:
+            params["limit"] = 1
+        resposta = await self._requisitar("GET", f"/{tabela}", params=params, timeout=timeout)
+        dados = resposta.json()
+        if unico:
+            return dados[0] if dados else None
+        return dados
+
+    async def contar(self, tabela: str, filtros: Filtros = None, timeout: Optional[float] = None) -> int:
+        """Total de linhas que atendem aos filtros, sem trafegar as linhas."""
+        resposta = await self._requisitar(
+            "HEAD", f"/{tabela}", params=filtros, headers={"Prefer": "count=exact"}, timeout=timeout,
+        )
+        return _total_do_content_range(resposta)
+
+    async def insert(self, tabela: str, registros: Any, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        resposta = await self._requisitar(
+            "POST", f"/{tabela}", json=registros,
+            headers={"Prefer": "return=representation"}, timeout=timeout,
+        )
+        return resposta.json()
+
+    async def update(self, tabela: str, valores: Dict[str, Any], filtros: Filtros, timeout: Optional[float] = None) -> None:
+        await self._requisitar(
+            "PATCH", f"/{tabela}", params=filtros, json=valores,
+            headers={"Prefer": "return=minimal"}, timeout=timeout,
+        )
+
+    async def delete(self, tabela: str, filtros: Filtros, timeout: Optional[float] = None) -> int:
+        """Exclui as linhas filtradas e retorna quantas foram removidas (sem trafegar as linhas)."""
+        resposta = await self._requisitar(
+            "DELETE", f"/{tabela}", params=filtros,
+            headers={"Prefer": "return=minimal, count=exact"}, timeout=timeout,
+        )
+        return _total_do_content_range(resposta)
+
+
+def _total_do_content_range(resposta: httpx.Response) -> int:
+    # Content-Range: "*/42" ou "0-9/42"
+    total = resposta.headers.get("content-range", "").rpartition("/")[2]
+    return int(total) if total.isdigit() else 0
@@ -20,3 +20,9 @@ try:
 except Exception as e:
     print(f"Erro ao conectar com Supabase: {e}")
     supabase = None
+
+# Cliente assíncrono (pool de conexões compartilhado) usado pelas rotas da API.
+# O cliente síncrono acima continua sendo usado pelos workers de processamento.
+from .supabase_async import PostgrestAsync
+
+supabase_async = PostgrestAsync(url, key)
@@ -0,0 +1,155 @@
+"""Mede a busca de clientes no ERP (backend/services/erp.py) contra um ERP falso local.
+
+Sobe um ERP falso com latência artificial e resolve N nomes distintos (como os
+de um relatório de desconexão) por três caminhos: nome a nome, em lotes e de
+novo com o cache já preenchido. Um em cada 10 nomes não existe no ERP, para
+exercitar o cache negativo.
+
+Uso:
+    python -m benchmarks.bench_erp --nomes 20000 --latencia-ms 30 --concorrencia 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Cache num arquivo descartável, para não misturar com o da aplicação
+os.environ["ERP_CACHE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench_erp_"), "erp.sqlite3")
+
+from backend.services import erp  # noqa: E402
+
+
+def _cliente_falso(nome: str):
+    numero = int(nome.rsplit(" ", 1)[-1])
+    return None if numero % 10 == 0 else {"id": 100000 + numero, "nome": nome}
+
+
+class ErpFalso:
+    """Servidor HTTP/1.1 mínimo (asyncio, com keep-alive) com o contrato descrito em backend/services/erp.py.
+
+    Responde após `latencia_s`; com `aceita_lote=False`, a busca em lote
+    responde 404 (ERP sem esse recurso). Roda num event loop próprio, em outra thread.
+    """
+
+    def __init__(self, latencia_s: float, aceita_lote: bool = True):
+        self.latencia_s = latencia_s
+        self.aceita_lote = aceita_lote
+        self.requisicoes = 0
+        self.porta = None
+        self._loop = asyncio.new_event_loop()
+        pronto = threading.Event()
+        threading.Thread(target=self._rodar, args=(pronto,), daemon=True).start()
+        pronto.wait()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.porta}"
+
+    def _rodar(self, pronto: threading.Event) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._servidor = self._loop.run_until_complete(asyncio.start_server(self._atender, "127.0.0.1", 0, backlog=4096))
+        self.porta = self._servidor.sockets[0].getsockname()[1]
+        pronto.set()
+        self._loop.run_forever()
+
+    def _responder(self, metodo: str, alvo: str, corpo: bytes):
+        partes = urlsplit(alvo)
+        if metodo == "GET" and partes.path == erp.ERP_CAMINHO_BUSCA:
+            cliente = _cliente_falso(parse_qs(partes.query)["nome"][0])
+            return 200, [cliente] if cliente else []
+        if metodo == "POST" and partes.path == erp.ERP_CAMINHO_BUSCA_LOTE and self.aceita_lote:
+            return 200, {nome: _cliente_falso(nome) for nome in json.loads(corpo)["nomes"]}
+        return 404, {"erro": "não encontrado"}
+
+    async def _atender(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                cabecalho = await reader.readuntil(b"\r\n\r\n")
+                linhas = cabecalho.decode("latin-1").split("\r\n")
+                metodo, alvo, _ = linhas[0].split(" ", 2)
+                tamanho = 0
+                for linha in linhas[1:]:
+                    nome, _, valor = linha.partition(":")
+                    if nome.strip().lower() == "content-length":
+                        tamanho = int(valor)
+                corpo = await reader.readexactly(tamanho) if tamanho else b""
+                self.requisicoes += 1
+                await asyncio.sleep(self.latencia_s)
+                status, dados = self._responder(metodo, alvo, corpo)
+                resposta = json.dumps(dados).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(resposta)}\r\n\r\n".encode() + resposta
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _encerrar(self) -> None:
+        self._servidor.close()
+        tarefas = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+
+    def parar(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._encerrar(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+async def medir(url: str, nomes, concorrencia: int, tamanho_lote: int, usar_cache: bool):
+    cliente = erp.ClienteErp(
+        url, "token-de-teste", concorrencia=concorrencia, requisicoes_por_segundo=0,
+        tamanho_lote=tamanho_lote, usar_cache=usar_cache,
+    )
+    try:
+        inicio = time.perf_counter()
+        resultados = await cliente.buscar_muitos(nomes)
+        return time.perf_counter() - inicio, resultados
+    finally:
+        await cliente.fechar()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nomes", type=int, default=20000)
+    parser.add_argument("--latencia-ms", type=float, default=30.0)
+    parser.add_argument("--concorrencia", type=int, default=erp.ERP_CONCORRENCIA)
+    parser.add_argument("--lote", type=int, default=erp.ERP_TAMANHO_LOTE)
+    args = parser.parse_args()
+
+    erp.inicializar_banco()
+    # Como em gerar_desconexao, com cada nome repetido (várias ONUs do mesmo cliente)
+    nomes = [f"Cliente {i}" for i in range(args.nomes)] * 2
+    servidor = ErpFalso(args.latencia_ms / 1000)
+    try:
+        print(f"{args.nomes} nomes distintos, latência simulada de {args.latencia_ms:.0f} ms, concorrência {args.concorrencia}")
+        casos = [
+            ("nome a nome (sem cache)", 0, False),
+            (f"lotes de {args.lote} (sem cache)", args.lote, False),
+            (f"lotes de {args.lote} (cache frio)", args.lote, True),
+            ("cache quente", args.lote, True),
+        ]
+        for descricao, tamanho_lote, usar_cache in casos:
+            servidor.requisicoes = 0
+            duracao, resultados = asyncio.run(medir(servidor.url, nomes, args.concorrencia, tamanho_lote, usar_cache))
+            encontrados = sum(cliente is not None for cliente in resultados.values())
+            print(
+                f"  {descricao:32s} {duracao:7.2f}s  {args.nomes / duracao:10.1f} nomes/s  "
+                f"{servidor.requisicoes:6d} requisições  {encontrados} encontrados"
+            )
+    finally:
+        servidor.parar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Benchmark do processamento de relatórios (desconexão, SAC e monitoria) com dados sintéticos.
+
+Cenários:
+  processador  chama `processar_relatorio_*` direto sobre um DataFrame em memória;
+  arquivo      lê o arquivo gerado em chunks (`processar_em_chunks`), como o worker;
+  upload       caminho completo: POST /upload -> fila -> worker -> gravação.
+
+Tudo roda contra um Supabase falso em processo (ver supabase_falso.py), então
+os números medem só o nosso código. Cada medição registra tempo, linhas/s,
+pico de memória (RSS acima do início da medição) e o tempo por etapa, e é
+anexada como uma linha JSON em `--saida` para acompanhar regressões.
+
+Uso:
+    python -m benchmarks.bench_ingestao --linhas 10000,100000 --cenarios processador,arquivo
+    python -m benchmarks.bench_ingestao --linhas 1000000 --formatos xlsx --cenarios upload
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+# A API e os workers leem a configuração no import: usa diretórios temporários
+# e credenciais fictícias antes de importar o backend.
+_TMP = tempfile.mkdtemp(prefix="bench_ingestao_")
+os.environ["UPLOAD_SPOOL_DIR"] = _TMP
+os.environ["JOBS_DB_PATH"] = os.path.join(_TMP, "jobs.sqlite3")
+os.environ.setdefault("SUPABASE_URL", "http://supabase.invalid")
+os.environ.setdefault("SUPABASE_KEY", "chave-de-teste")
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import pandas as pd  # noqa: E402
+
+from backend.services import metricas  # noqa: E402
+from backend.services.ingestion import processar_em_chunks  # noqa: E402
+from backend.services.processors import (  # noqa: E402
+    ALIASES_COLUNAS, FILTROS_LINHAS, FINALIZADORES, PROCESSORS, TIPOS_COLUNAS,
+)
+from benchmarks.geradores import GERADORES, obter_arquivo  # noqa: E402
+from benchmarks.supabase_falso import SupabaseFalso  # noqa: E402
+
+FORMATOS: Dict[str, Tuple[str, str, str]] = {
+    "csv_virgula_utf8": ("csv", ",", "utf-8-sig"),
+    "csv_pontoevirgula_latin1": ("csv", ";", "latin-1"),
+    "xlsx": ("xlsx", ",", "utf-8-sig"),
+}
+SAIDA_PADRAO = os.path.join(RAIZ, "benchmarks", "resultados.jsonl")
+
+
+def _commit_atual() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecido"
+
+
+def _medir(funcao) -> Dict[str, Any]:
+    """Executa `funcao` coletando tempos por etapa e o pico de memória (via services/metricas)."""
+    with metricas.coletar(0, "bench") as coleta:
+        funcao()
+    resumo = coleta.resumo()
+    return {
+        "segundos": resumo["duracao_s"],
+        "pico_memoria_mb": round((resumo["pico_memoria_mb"] or 0) - (resumo["memoria_inicial_mb"] or 0), 1),
+        "etapas": {nome: dados["segundos"] for nome, dados in resumo["etapas"].items()},
+    }
+
+
+def bench_processador(tipo: str, linhas: int, **_) -> Dict[str, Any]:
+    df = GERADORES[tipo](linhas)
+    supabase_falso = SupabaseFalso()
+    resultado = _medir(lambda: PROCESSORS[tipo](df=df, relatorio_id=1, supabase_client=supabase_falso))
+    resultado["registros_gravados"] = sum(supabase_falso.linhas_gravadas.values())
+    return resultado
+
+
+def bench_arquivo(tipo: str, linhas: int, formato: str, **_) -> Dict[str, Any]:
+    extensao, separador, encoding = FORMATOS[formato]
+    caminho = obter_arquivo(tipo, linhas, extensao, separador, encoding)
+    supabase_falso = SupabaseFalso()
+    resultado = _medir(lambda: processar_em_chunks(
+        caminho, os.path.basename(caminho), PROCESSORS[tipo], 1, supabase_falso,
+        finalizador=FINALIZADORES.get(tipo), aliases=ALIASES_COLUNAS.get(tipo), tipos=TIPOS_COLUNAS.get(tipo),
+        filtro_linhas=FILTROS_LINHAS.get(tipo),
+    ))
+    resultado["registros_gravados"] = sum(supabase_falso.linhas_gravadas.values())
+    return resultado
+
+
+class _AmbienteUpload:
+    """Sobe a API em processo com Supabase falso e o worker numa thread (em vez do pool de processos)."""
+
+    def __init__(self):
+        import httpx
+        from fastapi.testclient import TestClient
+
+        import backend.main as api
+        from backend.services import dedup, jobs, supabase_client
+
+        self.api, self.dedup, self.jobs = api, dedup, jobs
+        self.supabase_falso = SupabaseFalso()
+        supabase_client.supabase = self.supabase_falso
+        api.supabase = self.supabase_falso
+        api.gerenciador_jobs._criar_pool = lambda: ThreadPoolExecutor(max_workers=1)
+
+        self._proximo_id = 1
+
+        def responder(request: "httpx.Request") -> "httpx.Response":
+            if request.method == "POST" and request.url.path.endswith("/relatorios"):
+                relatorio = {"id": self._proximo_id, **json.loads(request.content)}
+                self._proximo_id += 1
+                return httpx.Response(201, json=[relatorio])
+            if request.method == "GET":
+                return httpx.Response(200, json=[])
+            return httpx.Response(204)
+
+        api.supabase_async._client = httpx.AsyncClient(
+            transport=httpx.MockTransport(responder), base_url=api.supabase_async.base_url,
+        )
+        self.cliente = TestClient(api.app)
+
+    def __enter__(self) -> "_AmbienteUpload":
+        self.cliente.__enter__()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cliente.__exit__(*exc)
+
+    def enviar(self, caminho: str, tipo: str) -> Dict[str, Any]:
+        # Cada repetição deve reprocessar o arquivo, não cair na deduplicação
+        self.dedup.esquecer()
+        gravadas_antes = sum(self.supabase_falso.linhas_gravadas.values())
+        estado: Dict[str, Any] = {}
+
+        def executar():
+            with open(caminho, "rb") as arquivo:
+                resposta = self.cliente.post(
+                    "/upload", data={"report_type": tipo}, files={"file": (os.path.basename(caminho), arquivo)},
+                )
+            resposta.raise_for_status()
+            relatorio_id = resposta.json()["relatorio_id"]
+            while True:
+                job = self.jobs.obter_job(relatorio_id)
+                if job["status"] not in (self.jobs.PENDING, self.jobs.PROCESSING):
+                    break
+                time.sleep(0.01)
+            estado["status"] = job["status"]
+            estado["metricas_worker"] = json.loads(job["metricas"]) if job["metricas"] else None
+
+        # O worker abre a própria coleta de métricas; aqui medimos só tempo total e memória
+        amostrador = metricas.MetricasRelatorio(0, "bench")
+        executar()
+        amostrador.encerrar()
+        etapas = (estado["metricas_worker"] or {}).get("etapas", {})
+        return {
+            "segundos": round(amostrador.duracao, 3),
+            "pico_memoria_mb": round(((amostrador.pico_memoria or 0) - (amostrador.memoria_inicial or 0)) / 2 ** 20, 1),
+            "etapas": {nome: dados["segundos"] for nome, dados in etapas.items()},
+            "status": estado["status"],
+            "registros_gravados": sum(self.supabase_falso.linhas_gravadas.values()) - gravadas_antes,
+        }
+
+
+_ambiente_upload = None
+
+
+def bench_upload(tipo: str, linhas: int, formato: str, **_) -> Dict[str, Any]:
+    global _ambiente_upload
+    if _ambiente_upload is None:
+        _ambiente_upload = _AmbienteUpload().__enter__()
+    extensao, separador, encoding = FORMATOS[formato]
+    return _ambiente_upload.enviar(obter_arquivo(tipo, linhas, extensao, separador, encoding), tipo)
+
+
+CENARIOS = {"processador": bench_processador, "arquivo": bench_arquivo, "upload": bench_upload}
+
+
+def _lista(texto: str) -> List[str]:
+    return [item.strip() for item in texto.split(",") if item.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", default="10000,100000", help="Tamanhos, ex.: 10000,100000,1000000")
+    parser.add_argument("--tipos", default="desconexao,sac,monitoria")
+    parser.add_argument("--cenarios", default="processador,arquivo,upload")
+    parser.add_argument("--formatos", default=",".join(FORMATOS))
+    parser.add_argument("--repeticoes", type=int, default=1)
+    parser.add_argument("--saida", default=SAIDA_PADRAO, help="Arquivo JSONL onde os resultados são anexados")
+    args = parser.parse_args()
+
+    base = {
+        "executado_em": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _commit_atual(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+    }
+    resultados = []
+    try:
+        for cenario in _lista(args.cenarios):
+            # O cenário "processador" não depende do formato do arquivo
+            formatos = [None] if cenario == "processador" else _lista(args.formatos)
+            for tipo in _lista(args.tipos):
+                for linhas in (int(n) for n in _lista(args.linhas)):
+                    for formato in formatos:
+                        for repeticao in range(1, args.repeticoes + 1):
+                            medicao = CENARIOS[cenario](tipo=tipo, linhas=linhas, formato=formato)
+                            registro = {
+                                **base, "cenario": cenario, "tipo": tipo, "linhas": linhas, "formato": formato,
+                                "repeticao": repeticao, **medicao,
+                                "linhas_por_segundo": round(linhas / medicao["segundos"], 1) if medicao["segundos"] else None,
+                            }
+                            resultados.append(registro)
+                            print(
+                                f"{cenario:<12} {tipo:<11} {formato or '-':<25} {linhas:>9} linhas  "
+                                f"{registro['segundos']:8.2f}s  {registro['linhas_por_segundo'] or 0:>11,.0f} linhas/s  "
+                                f"+{registro['pico_memoria_mb']:7.1f} MB",
+                                flush=True,
+                            )
+    finally:
+        if _ambiente_upload is not None:
+            _ambiente_upload.__exit__(None, None, None)
+        if resultados:
+            with open(args.saida, "a", encoding="utf-8") as f:
+                for registro in resultados:
+                    f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            print(f"{len(resultados)} medições anexadas a {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
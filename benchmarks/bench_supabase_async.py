@@ -0,0 +1,128 @@
+"""Compara o acesso síncrono (supabase-py no threadpool) com o cliente assíncrono em pool.
+
+Sobe um PostgREST falso local com latência artificial e dispara N chamadas de
+RPC com alta concorrência pelos dois caminhos, simulando várias telas do
+dashboard consultando /stats ao mesmo tempo.
+
+Uso:
+    python -m benchmarks.bench_supabase_async --requests 500 --latencia-ms 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.supabase_async import PostgrestAsync  # noqa: E402
+
+# Mesmo tamanho do threadpool padrão do AnyIO, usado pelo FastAPI nas rotas `def`
+THREADPOOL_PADRAO = 40
+RESPOSTA = json.dumps([{"cidade": "Londrina", "total": 123}, {"cidade": "Maringá", "total": 98}]).encode()
+
+
+class PostgrestFalso:
+    """Servidor HTTP/1.1 mínimo (asyncio, com keep-alive) que responde toda requisição após `latencia_s`.
+
+    Roda num event loop próprio, em outra thread, para não competir com o
+    cliente medido e aguentar milhares de conexões simultâneas.
+    """
+
+    def __init__(self, latencia_s: float):
+        self.latencia_s = latencia_s
+        self.porta = None
+        self._loop = asyncio.new_event_loop()
+        pronto = threading.Event()
+        threading.Thread(target=self._rodar, args=(pronto,), daemon=True).start()
+        pronto.wait()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.porta}"
+
+    def _rodar(self, pronto: threading.Event) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._servidor = self._loop.run_until_complete(asyncio.start_server(self._atender, "127.0.0.1", 0, backlog=4096))
+        self.porta = self._servidor.sockets[0].getsockname()[1]
+        pronto.set()
+        self._loop.run_forever()
+
+    async def _atender(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                cabecalho = await reader.readuntil(b"\r\n\r\n")
+                tamanho = 0
+                for linha in cabecalho.split(b"\r\n"):
+                    nome, _, valor = linha.partition(b":")
+                    if nome.strip().lower() == b"content-length":
+                        tamanho = int(valor)
+                if tamanho:
+                    await reader.readexactly(tamanho)
+                await asyncio.sleep(self.latencia_s)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(RESPOSTA)).encode() + b"\r\n\r\n" + RESPOSTA
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _encerrar(self) -> None:
+        self._servidor.close()
+        tarefas = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+
+    def parar(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._encerrar(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def medir_sync(url: str, total: int) -> float:
+    from supabase import create_client
+
+    cliente = create_client(url, "chave-de-teste")
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADPOOL_PADRAO) as executor:
+        list(executor.map(lambda _: cliente.rpc("get_clients_by_city").execute(), range(total)))
+    return time.perf_counter() - inicio
+
+
+async def medir_async(url: str, total: int) -> float:
+    cliente = PostgrestAsync(url, "chave-de-teste")
+    try:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente.rpc("get_clients_by_city") for _ in range(total)))
+        return time.perf_counter() - inicio
+    finally:
+        await cliente.fechar()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--latencia-ms", type=float, default=30.0)
+    args = parser.parse_args()
+
+    servidor = PostgrestFalso(args.latencia_ms / 1000)
+    try:
+        t_sync = medir_sync(servidor.url, args.requests)
+        t_async = asyncio.run(medir_async(servidor.url, args.requests))
+    finally:
+        servidor.parar()
+
+    print(f"{args.requests} RPCs, latência simulada de {args.latencia_ms:.0f} ms")
+    print(f"  síncrono (threadpool de {THREADPOOL_PADRAO}): {t_sync:6.2f}s  {args.requests / t_sync:8.1f} req/s")
+    print(f"  assíncrono (pool httpx):     {t_async:6.2f}s  {args.requests / t_async:8.1f} req/s")
+    print(f"  ganho: {t_sync / t_async:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
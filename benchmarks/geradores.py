@@ -0,0 +1,222 @@
+"""Geradores de relatórios sintéticos (OLT Cloud, SAC e monitoria) para os benchmarks.
+
+Os dados são determinísticos para uma mesma semente e imitam as exportações
+reais: todas as OLTs do `OLT_CIDADE_MAP` (mais algumas desconhecidas), status
+LOSS / Sem Energia / Online com variações de caixa e espaços, e cabeçalhos
+"bagunçados" que exercitam os aliases dos processadores.
+
+Uso:
+    python -m benchmarks.geradores --tipo desconexao --linhas 100000 --formato csv --separador ";" --encoding latin-1
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.processors.desconexao_processor import OLT_CIDADE_MAP  # noqa: E402
+
+DADOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados")
+
+# Variações de cabeçalho vistas nas exportações; todas normalizam para um alias conhecido
+CABECALHOS_DESCONEXAO: List[Dict[str, str]] = [
+    {
+        "nome_cliente": "Cliente", "serial_onu": "SN ONU", "olt_regiao": "OLT", "status_conexao": "Status",
+        "data_desconexao": "Última Alteração de Status", "cto": "CTO", "slot_pon_onu": "SlotPonOnu ID",
+        "modelo_onu": "Modelo", "rx_onu": "RX ONU", "rx_olt": "RX OLT", "distancia_m": "Distância entre OLT e ONU (m)",
+    },
+    {
+        "nome_cliente": " CLIENTE ", "serial_onu": "sn-onu", "olt_regiao": "Olt", "status_conexao": "STATUS",
+        "data_desconexao": "Ultima Atualizacao de Sinal", "cto": "cto", "slot_pon_onu": "slotpononu id",
+        "modelo_onu": "MODELO", "rx_onu": "Rx-Onu", "rx_olt": "Rx Olt", "distancia_m": "Distancia entre OLT e ONU (m)",
+    },
+    {
+        "nome_cliente": "Cliente", "serial_onu": "SN ONU", "olt_regiao": "OLT", "status_conexao": "Status",
+        "data_desconexao": "Última Comunicação", "cto": "CTO", "slot_pon_onu": "SlotPonOnu ID",
+        "modelo_onu": "Modelo", "rx_onu": "RX ONU", "rx_olt": "RX OLT", "distancia_m": "Distância entre OLT e ONU (m)",
+    },
+]
+
+# Colunas extras presentes nas exportações e ignoradas pelo processador
+COLUNAS_EXTRAS = {"Plano": ["100MB", "300MB", "500MB", "1GB"], "Observação": ["", "", "Cliente reclamou", "Troca de ONU"]}
+
+STATUS = ["LOSS", "Loss", "LOSS ", "Sem Energia", "SEM ENERGIA", " sem energia", "Online", "ONLINE", "online"]
+# Cerca de 15% LOSS e 5% Sem Energia; o restante online
+PESOS_STATUS = [0.10, 0.03, 0.02, 0.03, 0.015, 0.005, 0.50, 0.20, 0.10]
+
+MODELOS = ["HG8245H", "EG8145V5", "F670L", "AN5506-04-F1", "HS8545M5", "ONU-PARKS-1GE"]
+OLTS_DESCONHECIDAS = ["OLT-XYZ-NOKIA-TESTE", "OLT-NOVA-SEM-CADASTRO"]
+
+CABECALHOS_SAC: List[Dict[str, str]] = [
+    {
+        "agente": "Nome", "atendimentos": "Atendimentos", "cliente_atendido": "Cliente Atendido", "encerrado": "Encerrado",
+        "data_atendimento": "Data", "nota_monitoria": "Nota Monitoria", "tempo_medio_atendimento_minutos": "Tempo Médio",
+    },
+    {
+        "agente": "ATENDENTE", "atendimentos": "atendimentos", "cliente_atendido": "cliente atendido", "encerrado": "ENCERRADO",
+        "data_atendimento": "data", "nota_monitoria": "Nota", "tempo_medio_atendimento_minutos": "tempo_medio",
+    },
+]
+
+CABECALHOS_MONITORIA: List[Dict[str, str]] = [
+    {
+        "agente": "Atendente", "data_monitoria": "Data da Monitoria", "avaliador": "Monitor", "protocolo": "Protocolo",
+        "canal": "Canal", "pontos_obtidos": "Pontos Obtidos", "pontos_possiveis": "Pontos Possíveis",
+        "nota": "Nota Final", "falha_critica": "Falha Crítica",
+    },
+    {
+        "agente": "COLABORADOR", "data_monitoria": "data", "avaliador": "Avaliador", "protocolo": "ID Atendimento",
+        "canal": "canal", "pontos_obtidos": "pontuação obtida", "pontos_possiveis": "Pontuação Máxima",
+        "nota": "nota", "falha_critica": "ERRO CRÍTICO",
+    },
+]
+
+AGENTES = [f"{nome} {sobrenome}" for nome in ("Ana", "Bruno", "Carla", "Diego", "Elisa", "Fábio", "Gabriela", "Heitor")
+           for sobrenome in ("Souza", "Lima", "Araújo", "Pereira")]
+
+
+def _escolher(rng: np.random.Generator, opcoes, n: int, pesos=None) -> np.ndarray:
+    return np.asarray(opcoes, dtype=object)[rng.choice(len(opcoes), size=n, p=pesos)]
+
+
+def gerar_desconexao(linhas: int, semente: int = 42, variante_cabecalho: Optional[int] = None) -> pd.DataFrame:
+    """Exportação sintética do OLT Cloud com `linhas` ONUs."""
+    rng = np.random.default_rng(semente)
+    olts = list(OLT_CIDADE_MAP) + OLTS_DESCONHECIDAS
+    # Nomes reais variam o sufixo (ex.: "OLT-LDB-HUAWEI-DC-02 / Slot 1"); o mapa casa por substring
+    sufixos = _escolher(rng, ["", "", "", " / POP", "-BKP"], linhas)
+    olt = _escolher(rng, olts, linhas).astype(str) + sufixos.astype(str)
+
+    agora = datetime(2025, 1, 31, 12, 0, 0)
+    segundos_atras = rng.integers(60, 30 * 24 * 3600, size=linhas)
+    datas = pd.to_datetime(agora) - pd.to_timedelta(segundos_atras, unit="s")
+    datas_texto = datas.strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object)
+    # Algumas linhas sem data válida, como acontece nas exportações reais
+    datas_texto[rng.random(linhas) < 0.01] = ""
+
+    colunas = {
+        "nome_cliente": np.char.add("Cliente ", np.arange(linhas).astype(str)),
+        "serial_onu": ("HWTC" + pd.Series(rng.integers(0, 2 ** 32, size=linhas)).map("{:08X}".format)).to_numpy(),
+        "olt_regiao": olt,
+        "status_conexao": _escolher(rng, STATUS, linhas, PESOS_STATUS),
+        "data_desconexao": datas_texto,
+        "cto": np.char.add("CTO-", np.char.zfill(rng.integers(1, 5000, size=linhas).astype(str), 4)),
+        "slot_pon_onu": np.char.add(np.char.add("0/", rng.integers(1, 16, size=linhas).astype(str)),
+                                    np.char.add("/", rng.integers(0, 128, size=linhas).astype(str))),
+        "modelo_onu": _escolher(rng, MODELOS, linhas),
+        "rx_onu": np.round(rng.normal(-21, 3, size=linhas), 2),
+        "rx_olt": np.round(rng.normal(-24, 2.5, size=linhas), 2),
+        "distancia_m": rng.integers(50, 20000, size=linhas),
+    }
+    variante = CABECALHOS_DESCONEXAO[(semente if variante_cabecalho is None else variante_cabecalho) % len(CABECALHOS_DESCONEXAO)]
+    df = pd.DataFrame({variante[chave]: valores for chave, valores in colunas.items()})
+    for nome, opcoes in COLUNAS_EXTRAS.items():
+        df[nome] = _escolher(rng, opcoes, linhas)
+    return df
+
+
+def gerar_sac(linhas: int, semente: int = 42, variante_cabecalho: Optional[int] = None) -> pd.DataFrame:
+    """Relatório sintético de performance do SAC (uma linha por agente/dia)."""
+    rng = np.random.default_rng(semente)
+    minutos = rng.integers(1, 90, size=linhas)
+    segundos = rng.integers(0, 60, size=linhas)
+    tempo = np.where(
+        minutos >= 60,
+        np.char.add(np.char.add("01:", np.char.zfill((minutos - 60).astype(str), 2)), np.char.add(":", np.char.zfill(segundos.astype(str), 2))),
+        np.char.add(np.char.add(np.char.zfill(minutos.astype(str), 2), ":"), np.char.zfill(segundos.astype(str), 2)),
+    ).astype(object)
+    tempo[rng.random(linhas) < 0.02] = ""
+
+    inicio = datetime(2025, 1, 1)
+    dias = rng.integers(0, 31, size=linhas)
+    colunas = {
+        "agente": _escolher(rng, AGENTES, linhas),
+        "atendimentos": rng.integers(0, 80, size=linhas),
+        "cliente_atendido": rng.integers(0, 60, size=linhas),
+        "encerrado": rng.integers(0, 60, size=linhas),
+        "data_atendimento": (pd.Timestamp(inicio) + pd.to_timedelta(dias, unit="D")).strftime("%Y-%m-%d").to_numpy(dtype=object),
+        "nota_monitoria": np.round(rng.uniform(0, 10, size=linhas), 1),
+        "tempo_medio_atendimento_minutos": tempo,
+    }
+    variante = CABECALHOS_SAC[(semente if variante_cabecalho is None else variante_cabecalho) % len(CABECALHOS_SAC)]
+    return pd.DataFrame({variante[chave]: valores for chave, valores in colunas.items()})
+
+
+def gerar_monitoria(linhas: int, semente: int = 42, variante_cabecalho: Optional[int] = None) -> pd.DataFrame:
+    """Planilha sintética de monitoria de qualidade (uma linha por avaliação).
+
+    A nota final vem preenchida em cerca de 70% das linhas, às vezes com
+    vírgula decimal; nas demais a nota sai dos pontos obtidos/possíveis.
+    """
+    rng = np.random.default_rng(semente)
+    possiveis = _escolher(rng, [50, 80, 100], linhas).astype(int)
+    obtidos = np.minimum(np.round(possiveis * rng.beta(8, 2, size=linhas)).astype(int), possiveis)
+    nota = np.round(10 * obtidos / possiveis, 1).astype(str).astype(object)
+    virgula = rng.random(linhas) < 0.3
+    nota[virgula] = np.char.replace(nota[virgula].astype(str), ".", ",")
+    nota[rng.random(linhas) < 0.3] = ""
+    falha = _escolher(rng, ["Não", "Não", "Não", "Não", "Não", "Não", "Não", "Não", "Não", "Sim"], linhas)
+
+    inicio = datetime(2025, 1, 1)
+    dias = rng.integers(0, 31, size=linhas)
+    colunas = {
+        "agente": _escolher(rng, AGENTES, linhas),
+        "data_monitoria": (pd.Timestamp(inicio) + pd.to_timedelta(dias, unit="D")).strftime("%Y-%m-%d").to_numpy(dtype=object),
+        "avaliador": _escolher(rng, ["Marina Costa", "Rafael Nunes", "Tatiane Rocha"], linhas),
+        "protocolo": np.char.add("ATD-", np.char.zfill(np.arange(linhas).astype(str), 8)),
+        "canal": _escolher(rng, ["Telefone", "WhatsApp", "Chat"], linhas),
+        "pontos_obtidos": obtidos,
+        "pontos_possiveis": possiveis,
+        "nota": nota,
+        "falha_critica": falha,
+    }
+    variante = CABECALHOS_MONITORIA[(semente if variante_cabecalho is None else variante_cabecalho) % len(CABECALHOS_MONITORIA)]
+    return pd.DataFrame({variante[chave]: valores for chave, valores in colunas.items()})
+
+
+GERADORES = {"desconexao": gerar_desconexao, "sac": gerar_sac, "monitoria": gerar_monitoria}
+
+
+def escrever_arquivo(df: pd.DataFrame, caminho: str, separador: str = ",", encoding: str = "utf-8-sig") -> str:
+    """Grava o DataFrame como .csv (com separador/encoding dados) ou .xlsx, conforme a extensão."""
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    if caminho.endswith(".xlsx"):
+        df.to_excel(caminho, index=False, engine="openpyxl")
+    else:
+        df.to_csv(caminho, sep=separador, encoding=encoding, index=False)
+    return caminho
+
+
+def obter_arquivo(
+    tipo: str, linhas: int, formato: str = "csv", separador: str = ",", encoding: str = "utf-8-sig", semente: int = 42,
+) -> str:
+    """Caminho de um arquivo sintético em `benchmarks/dados/`, gerando-o apenas na primeira vez."""
+    nome_sep = {",": "virgula", ";": "pontoevirgula"}.get(separador, "sep")
+    sufixo = "" if formato == "xlsx" else f"_{nome_sep}_{encoding}"
+    caminho = os.path.join(DADOS_DIR, f"{tipo}_{linhas}_s{semente}{sufixo}.{formato}")
+    if not os.path.exists(caminho):
+        temporario = caminho + ".tmp." + formato
+        escrever_arquivo(GERADORES[tipo](linhas, semente), temporario, separador, encoding)
+        os.replace(temporario, caminho)
+    return caminho
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tipo", choices=sorted(GERADORES), default="desconexao")
+    parser.add_argument("--linhas", type=int, default=10000)
+    parser.add_argument("--formato", choices=["csv", "xlsx"], default="csv")
+    parser.add_argument("--separador", default=",")
+    parser.add_argument("--encoding", default="utf-8-sig")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+    print(obter_arquivo(args.tipo, args.linhas, args.formato, args.separador, args.encoding, args.semente))
+
+
+if __name__ == "__main__":
+    main()
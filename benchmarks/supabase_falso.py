@@ -0,0 +1,125 @@
+"""Cliente Supabase falso, em memória, com a mesma interface encadeada do supabase-py.
+
+Usado pelos benchmarks para medir o pipeline sem rede. Por padrão apenas
+conta as linhas gravadas por tabela (memória constante); com
+`guardar_linhas=True` mantém as linhas para conferência.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+
+class _Resposta:
+    def __init__(self, data: Any):
+        self.data = data
+        self.error = None
+
+
+class _Consulta:
+    def __init__(self, cliente: "SupabaseFalso", tabela: str):
+        self._cliente = cliente
+        self._tabela = tabela
+        self._operacao = "select"
+        self._payload: Any = None
+        self._intervalo: Optional[tuple] = None
+
+    def select(self, *args, **kwargs) -> "_Consulta":
+        self._operacao = "select"
+        return self
+
+    def insert(self, registros: Any, **kwargs) -> "_Consulta":
+        self._operacao, self._payload = "insert", registros
+        return self
+
+    def upsert(self, registros: Any, **kwargs) -> "_Consulta":
+        self._operacao, self._payload = "upsert", registros
+        return self
+
+    def update(self, valores: Dict[str, Any]) -> "_Consulta":
+        self._operacao, self._payload = "update", valores
+        return self
+
+    def delete(self) -> "_Consulta":
+        self._operacao = "delete"
+        return self
+
+    def range(self, inicio: int, fim: int) -> "_Consulta":
+        self._intervalo = (inicio, fim)
+        return self
+
+    def __getattr__(self, nome: str):
+        # Filtros e modificadores (eq, in_, order, limit...) são aceitos e ignorados
+        return lambda *args, **kwargs: self
+
+    def execute(self) -> _Resposta:
+        return self._cliente._executar(self._tabela, self._operacao, self._payload, self._intervalo)
+
+
+class SupabaseFalso:
+    def __init__(self, latencia_s: float = 0.0, guardar_linhas: bool = False):
+        self.latencia_s = latencia_s
+        self.guardar_linhas = guardar_linhas
+        self.linhas_gravadas: Dict[str, int] = defaultdict(int)
+        self.chamadas: Dict[str, int] = defaultdict(int)
+        self.tabelas: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._proximo_id = 1
+        self._lock = threading.Lock()
+
+    @property
+    def postgrest(self) -> "SupabaseFalso":
+        # O bulk_writer envia os lotes já serializados por `postgrest.session.post`
+        return self
+
+    @property
+    def session(self) -> "SupabaseFalso":
+        return self
+
+    def table(self, tabela: str) -> _Consulta:
+        return _Consulta(self, tabela)
+
+    def post(self, tabela: str, content: bytes, params=None, headers=None) -> httpx.Response:
+        operacao = "upsert" if "merge-duplicates" in (headers or {}).get("Prefer", "") else "insert"
+        if self.guardar_linhas:
+            self._executar(tabela, operacao, json.loads(content), None)
+        else:
+            # Sem guardar as linhas basta contá-las; decodificar o JSON aqui pesaria na medição
+            self._contar_envio(tabela, operacao, content.count(b'{"'))
+        return httpx.Response(201)
+
+    def _contar_envio(self, tabela: str, operacao: str, registros: int) -> None:
+        if self.latencia_s:
+            time.sleep(self.latencia_s)
+        with self._lock:
+            self.chamadas[f"{tabela}.{operacao}"] += 1
+            self.linhas_gravadas[tabela] += registros
+
+    def rpc(self, funcao: str, params: Optional[Dict[str, Any]] = None) -> _Consulta:
+        return _Consulta(self, f"rpc:{funcao}")
+
+    def _executar(self, tabela: str, operacao: str, payload: Any, intervalo: Optional[tuple]) -> _Resposta:
+        if self.latencia_s:
+            time.sleep(self.latencia_s)
+        with self._lock:
+            self.chamadas[f"{tabela}.{operacao}"] += 1
+            if operacao in ("insert", "upsert"):
+                registros = payload if isinstance(payload, list) else [payload]
+                self.linhas_gravadas[tabela] += len(registros)
+                if len(registros) == 1:
+                    # Inserções unitárias (ex.: `relatorios`) devolvem o id gerado, como o PostgREST
+                    retorno = [{"id": self._proximo_id, **registros[0]}]
+                    self._proximo_id += 1
+                else:
+                    retorno = registros
+                if self.guardar_linhas:
+                    self.tabelas[tabela].extend(retorno)
+                return _Resposta(retorno)
+            if operacao == "select":
+                linhas = self.tabelas.get(tabela, [])
+                if intervalo:
+                    linhas = linhas[intervalo[0]:intervalo[1] + 1]
+                return _Resposta(list(linhas))
+            return _Resposta([])
@@ -0,0 +1,3 @@
+-- Progresso da escrita em lotes dos relatórios (atualizado por backend/services/bulk_writer.py)
+ALTER TABLE relatorios ADD COLUMN IF NOT EXISTS progresso integer DEFAULT 0;
+ALTER TABLE relatorios ADD COLUMN IF NOT EXISTS registros_processados integer DEFAULT 0;
@@ -0,0 +1,27 @@
+-- Ingestão incremental de desconexão (DESCONEXAO_MODO_INGESTAO=incremental, ver
+-- backend/services/processors/desconexao_incremental.py).
+
+-- Uma linha por ONU em clientes_off: necessário para o upsert com on_conflict=serial_onu.
+-- Antes de criar, remova duplicatas deixadas pelo modo "completa".
+CREATE UNIQUE INDEX IF NOT EXISTS clientes_off_serial_onu_key ON clientes_off (serial_onu);
+
+-- Histórico de transições (nova queda, alteração, recuperação)
+CREATE TABLE IF NOT EXISTS eventos_onu (
+    id bigserial PRIMARY KEY,
+    serial_onu text NOT NULL,
+    olt_regiao text,
+    motivo_desconexao text,
+    horas_offline integer,
+    rx_onu real,
+    evento text NOT NULL,
+    relatorio_id integer,
+    ocorrido_em timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS eventos_onu_serial_onu_idx ON eventos_onu (serial_onu, ocorrido_em DESC);
+CREATE INDEX IF NOT EXISTS eventos_onu_ocorrido_em_idx ON eventos_onu (ocorrido_em DESC);
+
+-- Chave natural dos eventos (upsert com on_conflict=relatorio_id,serial_onu,evento): lotes
+-- reenviados após um timeout não duplicam eventos. Antes de criar, remova as duplicatas:
+--   DELETE FROM eventos_onu a USING eventos_onu b
+--   WHERE a.id < b.id AND a.relatorio_id = b.relatorio_id AND a.serial_onu = b.serial_onu AND a.evento = b.evento;
+CREATE UNIQUE INDEX IF NOT EXISTS eventos_onu_relatorio_serial_evento_key ON eventos_onu (relatorio_id, serial_onu, evento);
@@ -0,0 +1,2 @@
+-- Tempos por etapa, vazão e pico de memória do processamento (gravados por backend/services/jobs.py)
+ALTER TABLE relatorios ADD COLUMN IF NOT EXISTS metricas jsonb;
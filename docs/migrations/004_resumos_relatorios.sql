@@ -0,0 +1,145 @@
+-- Resumos por relatório, gravados pelos workers ao fim de cada ingestão
+-- (ver backend/services/processors/resumos.py) e lidos pelas rotas /stats.
+-- As consultas do dashboard passam a percorrer só esses resumos, que crescem
+-- com o número de relatórios e não com as linhas de clientes_off/sac_performance.
+
+CREATE TABLE IF NOT EXISTS resumo_relatorios (
+    relatorio_id integer PRIMARY KEY,
+    tipo text NOT NULL,
+    registros integer NOT NULL DEFAULT 0,
+    caso_mais_antigo timestamptz,
+    gerado_em timestamptz NOT NULL DEFAULT now()
+);
+
+-- Contagem de ONUs offline por dimensão: cidade, olt_regiao, motivo,
+-- faixa_horas_offline, data (dia UTC de data_desconexao), hora (só casos
+-- abertos nas 24h anteriores ao processamento, para o KPI de novos casos) e
+-- cto (as 50 CTOs com mais ONUs offline do relatório e o restante em 'outros').
+CREATE TABLE IF NOT EXISTS resumo_desconexao (
+    relatorio_id integer NOT NULL,
+    dimensao text NOT NULL,
+    valor text NOT NULL,
+    total integer NOT NULL,
+    PRIMARY KEY (relatorio_id, dimensao, valor)
+);
+CREATE INDEX IF NOT EXISTS resumo_desconexao_dimensao_idx ON resumo_desconexao (dimensao, valor);
+
+CREATE TABLE IF NOT EXISTS resumo_sac_agente (
+    relatorio_id integer NOT NULL,
+    agente text NOT NULL,
+    registros integer NOT NULL,
+    soma_nota double precision NOT NULL,
+    soma_tempo double precision NOT NULL,
+    PRIMARY KEY (relatorio_id, agente)
+);
+
+
+-- --- Leitura (mesmos formatos das RPCs originais) ---
+CREATE OR REPLACE FUNCTION get_resumo_clients_by_city()
+RETURNS TABLE (cidade text, total bigint) LANGUAGE sql STABLE AS $$
+    SELECT valor, sum(total)::bigint
+    FROM resumo_desconexao WHERE dimensao = 'cidade'
+    GROUP BY valor ORDER BY 2 DESC, 1;
+$$;
+
+CREATE OR REPLACE FUNCTION get_resumo_offline_history()
+RETURNS TABLE (data date, total bigint) LANGUAGE sql STABLE AS $$
+    SELECT valor::date, sum(total)::bigint
+    FROM resumo_desconexao WHERE dimensao = 'data'
+    GROUP BY valor ORDER BY 1;
+$$;
+
+CREATE OR REPLACE FUNCTION get_resumo_dashboard_kpis()
+RETURNS TABLE (new_critical_cases_24h integer, most_critical_olt text, oldest_case_days integer) LANGUAGE sql STABLE AS $$
+    SELECT
+        (SELECT coalesce(sum(total), 0)::integer FROM resumo_desconexao
+          WHERE dimensao = 'hora' AND valor::timestamptz >= now() - interval '24 hours'),
+        (SELECT valor FROM resumo_desconexao WHERE dimensao = 'olt_regiao'
+          GROUP BY valor ORDER BY sum(total) DESC, valor LIMIT 1),
+        (SELECT extract(day FROM now() - min(caso_mais_antigo))::integer FROM resumo_relatorios
+          WHERE tipo = 'desconexao');
+$$;
+
+CREATE OR REPLACE FUNCTION get_resumo_sac_kpis()
+RETURNS TABLE (media_nota_monitoria double precision, tempo_medio_atendimento_minutos double precision) LANGUAGE sql STABLE AS $$
+    SELECT coalesce(sum(soma_nota) / nullif(sum(registros), 0), 0),
+           coalesce(sum(soma_tempo) / nullif(sum(registros), 0), 0)
+    FROM resumo_sac_agente;
+$$;
+
+CREATE OR REPLACE FUNCTION get_resumo_performance_por_agente()
+RETURNS TABLE (agente text, nota_media double precision) LANGUAGE sql STABLE AS $$
+    SELECT agente, sum(soma_nota) / nullif(sum(registros), 0)
+    FROM resumo_sac_agente
+    GROUP BY agente ORDER BY 2 DESC NULLS LAST, 1;
+$$;
+
+
+-- --- Recálculo a partir das linhas (carga inicial e exclusão de clientes selecionados) ---
+-- Mesmas regras de ResumoRelatorio.acumular_desconexao.
+CREATE OR REPLACE FUNCTION recalcular_resumo_desconexao(relatorio_ids integer[])
+RETURNS void LANGUAGE sql AS $$
+    DELETE FROM resumo_desconexao WHERE relatorio_id = ANY(relatorio_ids);
+
+    INSERT INTO resumo_relatorios (relatorio_id, tipo, registros, caso_mais_antigo)
+    SELECT r.id, 'desconexao', count(c.relatorio_id), min(c.data_desconexao)
+    FROM unnest(relatorio_ids) AS r(id) LEFT JOIN clientes_off c ON c.relatorio_id = r.id
+    GROUP BY r.id
+    ON CONFLICT (relatorio_id) DO UPDATE SET
+        registros = excluded.registros, caso_mais_antigo = excluded.caso_mais_antigo;
+
+    INSERT INTO resumo_desconexao (relatorio_id, dimensao, valor, total)
+    SELECT c.relatorio_id, d.dimensao, d.valor, count(*)
+    FROM clientes_off c
+    JOIN resumo_relatorios rr ON rr.relatorio_id = c.relatorio_id
+    CROSS JOIN LATERAL (VALUES
+        ('cidade', c.cidade),
+        ('olt_regiao', c.olt_regiao),
+        ('motivo', nullif(upper(trim(c.motivo_desconexao)), '')),
+        ('faixa_horas_offline', CASE
+            WHEN c.horas_offline IS NULL THEN NULL
+            WHEN c.horas_offline < 24 THEN '0-24'
+            WHEN c.horas_offline < 48 THEN '24-48'
+            WHEN c.horas_offline < 72 THEN '48-72'
+            WHEN c.horas_offline < 168 THEN '72-168'
+            ELSE '168+' END),
+        ('data', to_char(c.data_desconexao AT TIME ZONE 'UTC', 'YYYY-MM-DD')),
+        ('hora', CASE WHEN c.data_desconexao >= rr.gerado_em - interval '24 hours'
+            THEN to_char(date_trunc('hour', c.data_desconexao AT TIME ZONE 'UTC'), 'YYYY-MM-DD"T"HH24":00:00+00:00"') END)
+    ) AS d(dimensao, valor)
+    WHERE c.relatorio_id = ANY(relatorio_ids) AND d.valor IS NOT NULL
+    GROUP BY c.relatorio_id, d.dimensao, d.valor;
+
+    -- CTO: as RESUMO_CTO_TOP_N (padrão 50) principais de cada relatório e o restante em 'outros'
+    INSERT INTO resumo_desconexao (relatorio_id, dimensao, valor, total)
+    SELECT relatorio_id, 'cto', CASE WHEN posicao <= 50 THEN cto ELSE 'outros' END, sum(total)
+    FROM (
+        SELECT relatorio_id, cto, count(*) AS total,
+               row_number() OVER (PARTITION BY relatorio_id ORDER BY count(*) DESC, cto) AS posicao
+        FROM clientes_off
+        WHERE relatorio_id = ANY(relatorio_ids) AND cto IS NOT NULL
+        GROUP BY relatorio_id, cto
+    ) AS t
+    GROUP BY 1, 3;
+$$;
+
+CREATE OR REPLACE FUNCTION recalcular_resumo_sac(relatorio_ids integer[])
+RETURNS void LANGUAGE sql AS $$
+    DELETE FROM resumo_sac_agente WHERE relatorio_id = ANY(relatorio_ids);
+
+    INSERT INTO resumo_relatorios (relatorio_id, tipo, registros)
+    SELECT r.id, 'sac', count(s.relatorio_id)
+    FROM unnest(relatorio_ids) AS r(id) LEFT JOIN sac_performance s ON s.relatorio_id = r.id
+    GROUP BY r.id
+    ON CONFLICT (relatorio_id) DO UPDATE SET registros = excluded.registros;
+
+    INSERT INTO resumo_sac_agente (relatorio_id, agente, registros, soma_nota, soma_tempo)
+    SELECT relatorio_id, agente, count(*), coalesce(sum(nota_monitoria), 0), coalesce(sum(tempo_medio_atendimento_minutos), 0)
+    FROM sac_performance
+    WHERE relatorio_id = ANY(relatorio_ids) AND agente IS NOT NULL
+    GROUP BY relatorio_id, agente;
+$$;
+
+-- Carga inicial com os relatórios já ingeridos (modo "completa")
+SELECT recalcular_resumo_desconexao(coalesce(array_agg(DISTINCT relatorio_id), '{}')) FROM clientes_off;
+SELECT recalcular_resumo_sac(coalesce(array_agg(DISTINCT relatorio_id), '{}')) FROM sac_performance;
@@ -0,0 +1,34 @@
+-- Índices da listagem GET /clients (backend/services/consulta_clientes.py).
+-- A paginação é por cursor (keyset): cada página continua de onde a anterior
+-- parou em `ORDER BY <coluna> <direção> NULLS LAST, id <direção>`, então um
+-- índice composto com a mesma ordem resolve a página com uma varredura curta,
+-- em vez de OFFSET percorrer e descartar as linhas das páginas anteriores.
+-- Os nulos ficam por último nas duas direções: um índice DESC NULLS LAST lido de
+-- trás para frente dá ASC NULLS FIRST, então cada direção precisa do seu índice.
+
+CREATE INDEX IF NOT EXISTS clientes_off_horas_offline_id_idx
+    ON clientes_off (horas_offline DESC NULLS LAST, id DESC);
+CREATE INDEX IF NOT EXISTS clientes_off_horas_offline_id_asc_idx
+    ON clientes_off (horas_offline ASC NULLS LAST, id ASC);
+CREATE INDEX IF NOT EXISTS clientes_off_data_desconexao_id_idx
+    ON clientes_off (data_desconexao DESC NULLS LAST, id DESC);
+CREATE INDEX IF NOT EXISTS clientes_off_data_desconexao_id_asc_idx
+    ON clientes_off (data_desconexao ASC NULLS LAST, id ASC);
+
+-- Filtros de igualdade mais usados combinados com a ordenação padrão (horas_offline
+-- decrescente); em ordem crescente, o filtro usa estes índices e ordena o resultado
+CREATE INDEX IF NOT EXISTS clientes_off_cidade_horas_idx
+    ON clientes_off (cidade, horas_offline DESC NULLS LAST, id DESC);
+CREATE INDEX IF NOT EXISTS clientes_off_olt_regiao_horas_idx
+    ON clientes_off (olt_regiao, horas_offline DESC NULLS LAST, id DESC);
+CREATE INDEX IF NOT EXISTS clientes_off_cto_horas_idx
+    ON clientes_off (cto, horas_offline DESC NULLS LAST, id DESC);
+CREATE INDEX IF NOT EXISTS clientes_off_motivo_horas_idx
+    ON clientes_off (motivo_desconexao, horas_offline DESC NULLS LAST, id DESC);
+
+-- Busca por trecho do nome ou do serial (`ilike '%termo%'`)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS clientes_off_nome_cliente_trgm_idx
+    ON clientes_off USING gin (nome_cliente gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS clientes_off_serial_onu_trgm_idx
+    ON clientes_off USING gin (serial_onu gin_trgm_ops);
@@ -0,0 +1,4 @@
+-- ID do cliente no ERP, preenchido na ingestão de desconexão quando ERP_ENRIQUECER_DESCONEXAO=1
+-- (backend/services/erp.py). Nulo se o nome não foi encontrado ou o ERP estava indisponível;
+-- nesse caso o botão "Abrir Atendimento" busca o cliente sob demanda (POST /erp/find-client).
+ALTER TABLE clientes_off ADD COLUMN IF NOT EXISTS erp_client_id bigint;
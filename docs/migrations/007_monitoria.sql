@@ -0,0 +1,58 @@
+-- Avaliações de monitoria de qualidade (uma linha por avaliação), gravadas pelo
+-- processador de monitoria (backend/services/processors/monitoria_processor.py).
+-- `nota` já vem na escala 0-10 e zerada quando houve falha crítica.
+
+CREATE TABLE IF NOT EXISTS monitoria (
+    id bigserial PRIMARY KEY,
+    relatorio_id integer NOT NULL,
+    agente text NOT NULL,
+    data_monitoria timestamptz,
+    avaliador text,
+    protocolo text,
+    canal text,
+    nota double precision NOT NULL,
+    falha_critica boolean NOT NULL DEFAULT false
+);
+CREATE INDEX IF NOT EXISTS monitoria_relatorio_idx ON monitoria (relatorio_id);
+CREATE INDEX IF NOT EXISTS monitoria_agente_data_idx ON monitoria (agente, data_monitoria);
+
+-- Resumo por agente e dia (UTC) de data_monitoria; avaliações sem data ficam
+-- numa linha com data nula, por isso a tabela não tem chave primária.
+CREATE TABLE IF NOT EXISTS resumo_monitoria_agente (
+    relatorio_id integer NOT NULL,
+    agente text NOT NULL,
+    data date,
+    avaliacoes integer NOT NULL,
+    soma_nota double precision NOT NULL,
+    falhas_criticas integer NOT NULL
+);
+CREATE INDEX IF NOT EXISTS resumo_monitoria_agente_idx ON resumo_monitoria_agente (relatorio_id, agente, data);
+
+
+-- --- Leitura ---
+CREATE OR REPLACE FUNCTION get_resumo_monitoria_por_agente()
+RETURNS TABLE (agente text, avaliacoes bigint, nota_media double precision, falhas_criticas bigint) LANGUAGE sql STABLE AS $$
+    SELECT agente, sum(avaliacoes)::bigint, sum(soma_nota) / nullif(sum(avaliacoes), 0), sum(falhas_criticas)::bigint
+    FROM resumo_monitoria_agente
+    GROUP BY agente ORDER BY 3 DESC NULLS LAST, 1;
+$$;
+
+
+-- --- Recálculo a partir das linhas ---
+-- Mesmas regras de ResumoRelatorio.acumular_monitoria.
+CREATE OR REPLACE FUNCTION recalcular_resumo_monitoria(relatorio_ids integer[])
+RETURNS void LANGUAGE sql AS $$
+    DELETE FROM resumo_monitoria_agente WHERE relatorio_id = ANY(relatorio_ids);
+
+    INSERT INTO resumo_relatorios (relatorio_id, tipo, registros)
+    SELECT r.id, 'monitoria', count(m.relatorio_id)
+    FROM unnest(relatorio_ids) AS r(id) LEFT JOIN monitoria m ON m.relatorio_id = r.id
+    GROUP BY r.id
+    ON CONFLICT (relatorio_id) DO UPDATE SET registros = excluded.registros;
+
+    INSERT INTO resumo_monitoria_agente (relatorio_id, agente, data, avaliacoes, soma_nota, falhas_criticas)
+    SELECT relatorio_id, agente, (data_monitoria AT TIME ZONE 'UTC')::date, count(*), sum(nota), count(*) FILTER (WHERE falha_critica)
+    FROM monitoria
+    WHERE relatorio_id = ANY(relatorio_ids)
+    GROUP BY relatorio_id, agente, (data_monitoria AT TIME ZONE 'UTC')::date;
+$$;
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from "react";
+import React, { useState, useEffect, useCallback, useRef } from "react";
 import toast, { Toaster } from "react-hot-toast";
 import {
   fetchClients,
@@ -6,11 +6,12 @@ import {
   deleteAllClients,
   deleteSelectedClients,
   fetchUniqueRegions,
-  fetchAllClientsForExport,
+  getClientsExportUrl,
   fetchDashboardKpis,
   fetchClientsByCityStats,
   fetchOfflineHistoryStats,
   fetchReportStatus,
+  subscribeToEvents,
   findErpClient,
 } from "../services/api";
 import KpiCard from "../components/KpiCard";
@@ -36,31 +37,6 @@ import {
   ClockIcon,
 } from "../components/Icons";
 
-const exportToCSV = (clients) => {
-  const headers =
-    "Nome Cliente,Serial ONU,OLT/Região,CTO,Cidade,Horas Offline,Data Desconexão,Motivo,RX ONU,RX OLT,Distância (m)";
-  const rows = clients.map(
-    (c) =>
-      `"${c.nome_cliente || ""}","${c.serial_onu}","${c.olt_regiao || ""}","${c.cto || ""}","${
-        c.cidade || ""
-      }",${c.horas_offline},"${new Date(c.data_desconexao).toLocaleString(
-        "pt-BR"
-      )}","${c.motivo_desconexao || ""}","${c.rx_onu || ""}","${c.rx_olt || ""}","${c.distancia_m || ""}"`
-  );
-  const csvContent =
-    "data:text/csv;charset=utf-8," +
-    encodeURIComponent([headers, ...rows].join("\n"));
-  const link = document.createElement("a");
-  link.setAttribute("href", csvContent);
-  link.setAttribute(
-    "download",
-    `clientes_offline_${new Date().toISOString().split("T")[0]}.csv`
-  );
-  document.body.appendChild(link);
-  link.click();
-  document.body.removeChild(link);
-};
-
 const CustomToast = ({ t, message, type = "success" }) => {
   const isVisible = t.visible;
   const baseClasses =
@@ -150,21 +126,39 @@ export default function ClientesCriticosPage() {
       { ...options, duration: Infinity }
     );
 
-  const loadClients = useCallback(async () => {
+  // Cursor de cada página já visitada (a listagem é paginada por cursor no backend).
+  // Qualquer mudança de filtro, ordenação ou tamanho de página recomeça do início.
+  const pageCursorsRef = useRef({ queryKey: null, cursors: [null] });
+
+  const loadClients = useCallback(async ({ recount = false } = {}) => {
+    const filters = {
+      searchTerm: debouncedSearchTerm,
+      regionFilter,
+      sortKey: sortConfig.key,
+      sortDirection: sortConfig.direction,
+      hoursFilter: debouncedHoursFilter,
+    };
+    const queryKey = JSON.stringify([itemsPerPage, filters]);
+    const queryChanged = pageCursorsRef.current.queryKey !== queryKey;
+    if (queryChanged) {
+      pageCursorsRef.current = { queryKey, cursors: [null] };
+    }
+    const cursor = pageCursorsRef.current.cursors[currentPage - 1];
+    // Página ainda sem cursor conhecido: a volta para a página 1 já está a caminho
+    if (cursor === undefined) return;
+
     setIsLoading(true);
     try {
-      const { data, error, count } = await fetchClients({
-        page: currentPage,
+      const { data, error, count, nextCursor } = await fetchClients({
+        ...filters,
         limit: itemsPerPage,
-        searchTerm: debouncedSearchTerm,
-        regionFilter,
-        sortKey: sortConfig.key,
-        sortDirection: sortConfig.direction,
-        hoursFilter: debouncedHoursFilter,
+        cursor,
+        withCount: recount || queryChanged || currentPage === 1,
       });
       if (error) throw new Error(error.message);
       setClients(data || []);
-      setTotalCount(count || 0);
+      if (count !== null && count !== undefined) setTotalCount(count);
+      pageCursorsRef.current.cursors[currentPage] = nextCursor || undefined;
     } catch (error) {
       showErrorToast(`Erro ao buscar clientes: ${error.message}`);
     } finally {
@@ -211,44 +205,57 @@ export default function ClientesCriticosPage() {
   }, [debouncedSearchTerm, regionFilter, itemsPerPage, debouncedHoursFilter]);
 
   const refreshAllData = useCallback(() => {
-    loadClients();
+    loadClients({ recount: true });
     loadDashboardData();
   }, [loadClients, loadDashboardData]);
 
+  // Uma única conexão de eventos por página: status dos relatórios enviados e estatísticas atualizadas
+  const reportWatchersRef = useRef({});
+
+  useEffect(
+    () =>
+      subscribeToEvents({
+        onReport: (report) => reportWatchersRef.current[report.relatorio_id]?.(report),
+        onStats: ({ tipo, stats }) => {
+          if (tipo !== "desconexao") return;
+          setKpiStats(stats["/stats/kpis"] || {});
+          setClientsByCityData(stats["/stats/clients-by-city"] || []);
+          setOfflineHistoryData(stats["/stats/offline-history"] || []);
+        },
+      }),
+    []
+  );
+
   const monitorReportStatus = useCallback(
     (reportId, toastId) => {
-      const interval = setInterval(async () => {
-        try {
-          const { status, detalhes_erro } = await fetchReportStatus(reportId);
-          if (status === "COMPLETED") {
-            clearInterval(interval);
-            toast.dismiss(toastId);
-            showSuccessToast("Relatório processado e dados atualizados!", {
-              id: toastId,
-            });
-            refreshAllData();
-          } else if (status === "FAILED") {
-            clearInterval(interval);
-            toast.dismiss(toastId);
-            showErrorToast(
-              `Falha no processamento: ${detalhes_erro || "Erro desconhecido"}`,
-              { id: toastId }
-            );
-          }
-        } catch (error) {
-          clearInterval(interval);
+      const stopWatching = () => delete reportWatchersRef.current[reportId];
+      const onReport = ({ status, progresso, detalhes_erro }) => {
+        if (status === "PROCESSING" && progresso != null) {
+          showLoadingToast(`Processando relatório... ${progresso}%`, { id: toastId });
+        } else if (status === "COMPLETED") {
+          stopWatching();
+          toast.dismiss(toastId);
+          showSuccessToast("Relatório processado e dados atualizados!", {
+            id: toastId,
+          });
+          // As estatísticas chegam pelo evento `stats`; aqui só a listagem é recarregada
+          loadClients({ recount: true });
+        } else if (status === "FAILED" || status === "CANCELLED") {
+          stopWatching();
           toast.dismiss(toastId);
           showErrorToast(
-            "Não foi possível verificar o estado do processamento.",
+            `Falha no processamento: ${detalhes_erro || "Erro desconhecido"}`,
             { id: toastId }
           );
         }
-      }, 5000);
-      setTimeout(() => {
-        clearInterval(interval);
-      }, 120000);
+      };
+      reportWatchersRef.current[reportId] = onReport;
+      // Estado atual uma vez (ex.: arquivo duplicado de um relatório já concluído); o resto vem pelos eventos
+      fetchReportStatus(reportId)
+        .then((report) => reportWatchersRef.current[reportId] === onReport && onReport(report))
+        .catch(() => {});
     },
-    [refreshAllData]
+    [loadClients]
   );
 
   // CORRIGIDO: agora recebe file + reportType
@@ -283,17 +290,27 @@ export default function ClientesCriticosPage() {
     }));
   };
 
-  const handleExport = async () => {
-    const toastId = "export-toast";
-    showLoadingToast("Exportando dados...", { id: toastId });
-    const { data, error } = await fetchAllClientsForExport();
-    toast.dismiss(toastId);
-    if (error) {
-      showErrorToast("Falha ao exportar dados.", { id: toastId });
-    } else {
-      exportToCSV(data);
-      showSuccessToast("Dados exportados!", { id: toastId });
-    }
+  const handleExport = () => {
+    // O backend gera o CSV em streaming com os filtros e a ordenação atuais
+    const link = document.createElement("a");
+    link.setAttribute(
+      "href",
+      getClientsExportUrl({
+        searchTerm: debouncedSearchTerm,
+        regionFilter,
+        sortKey: sortConfig.key,
+        sortDirection: sortConfig.direction,
+        hoursFilter: debouncedHoursFilter,
+      })
+    );
+    link.setAttribute(
+      "download",
+      `clientes_offline_${new Date().toISOString().split("T")[0]}.csv`
+    );
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    showSuccessToast("Exportação iniciada!", { id: "export-toast" });
   };
 
   const openDeleteModal = (onConfirm, title, message) =>
@@ -317,7 +334,7 @@ export default function ClientesCriticosPage() {
     setModalState({ isOpen: false });
   };
 
-  const handleAbrirAtendimento = async (clientName) => {
+  const handleAbrirAtendimento = async (clientName, erpClientId) => {
     if (!clientName) {
       showErrorToast("Nome do cliente inválido.");
       return;
@@ -327,8 +344,8 @@ export default function ClientesCriticosPage() {
     showLoadingToast(`Buscando ${clientName} no ERP...`, { id: toastId });
 
     try {
-      const erpClient = await findErpClient(clientName);
-      const { client_id } = erpClient;
+      // O ID já vem preenchido quando a ingestão consultou o ERP; senão, busca pelo nome
+      const client_id = erpClientId ?? (await findErpClient(clientName)).client_id;
 
       const erpUrlPattern = import.meta.env.VITE_ERP_CLIENT_URL_PATTERN;
       if (!erpUrlPattern) {
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Toaster } from 'react-hot-toast';
-import { fetchSacKpis, fetchAgentPerformance } from '../services/api';
+import { fetchSacKpis, fetchAgentPerformance, subscribeToEvents } from '../services/api';
 import KpiCard from '../components/KpiCard';
 import ChartContainer from '../components/ChartContainer';
 import { StarIcon, ClockIcon, UsersIcon } from '../components/Icons';
@@ -71,6 +71,15 @@ export default function SacPerformancePage() {
     loadData();
   }, []);
 
+  // Atualiza os indicadores quando um relatório de SAC termina de ser processado
+  useEffect(() => subscribeToEvents({
+    onStats: ({ tipo, stats }) => {
+      if (tipo !== 'sac') return;
+      setKpiData(stats['/stats/sac/kpis'] || {});
+      setAgentData(stats['/stats/sac/performance-agente'] || []);
+    },
+  }), []);
+
   return (
     <>
       <Toaster position="bottom-right" />
@@ -23,41 +23,40 @@ apiClient.interceptors.response.use(
   }
 );
 
-export const fetchClients = async (params = {}) => {
-  const { 
-    page = 1, limit = 10, searchTerm = '', regionFilter = '', 
-    sortKey = 'horas_offline', sortDirection = 'desc',
-    hoursFilter = 0
-  } = params;
-
-  let query = supabase.from('clientes_off').select('*', { count: 'exact' });
-
-  if (searchTerm) {
-    query = query.or(`nome_cliente.ilike.%${searchTerm}%,serial_onu.ilike.%${searchTerm}%`);
-  }
-  if (regionFilter) {
-    query = query.eq('olt_regiao', regionFilter);
-  }
-  if (sortKey && sortDirection) {
-    query = query.order(sortKey, { ascending: sortDirection === 'asc' });
-  }
+// Filtros e ordenação da listagem de clientes, no formato da rota GET /clients
+const clientQueryParams = ({
+  searchTerm = '', regionFilter = '', sortKey = 'horas_offline', sortDirection = 'desc', hoursFilter = 0,
+} = {}) => {
+  const params = { ordenar_por: sortKey, direcao: sortDirection };
+  if (searchTerm) params.busca = searchTerm;
+  if (regionFilter) params.olt_regiao = regionFilter;
+  if (hoursFilter > 0) params.horas_min = hoursFilter;
+  return params;
+};
 
-  // Novo filtro de horas
-  if (hoursFilter > 0) {
-    query = query.gte('horas_offline', hoursFilter);
+// Paginação por cursor: `nextCursor` da resposta é passado em `cursor` para buscar a próxima página.
+// O total só é calculado quando `withCount` é verdadeiro (basta na primeira página).
+export const fetchClients = async (params = {}) => {
+  const { limit = 10, cursor = null, withCount = false, ...filters } = params;
+  try {
+    const { data } = await apiClient.get('/clients', {
+      params: {
+        ...clientQueryParams(filters),
+        limite: limit,
+        ...(cursor ? { cursor } : {}),
+        ...(withCount ? { contar: true } : {}),
+      },
+    });
+    return { data: data.dados, count: data.total, nextCursor: data.proximo_cursor, error: null };
+  } catch (error) {
+    return { data: null, count: null, nextCursor: null, error };
   }
-
-  const from = (page - 1) * limit;
-  const to = from + limit - 1;
-  query = query.range(from, to);
-
-  const { data, error, count } = await query;
-  return { data, error, count };
 };
 
-export const fetchAllClientsForExport = async () => {
-  const { data, error } = await supabase.from('clientes_off').select('*').order('horas_offline', { ascending: false });
-  return { data, error };
+// URL da exportação em CSV, gerada em streaming pelo backend com os mesmos filtros da listagem
+export const getClientsExportUrl = (filters = {}) => {
+  const params = new URLSearchParams({ ...clientQueryParams(filters), formato: 'csv' });
+  return `${apiClient.defaults.baseURL}/clients?${params}`;
 };
 
 export const fetchUniqueRegions = async () => {
@@ -103,6 +102,19 @@ export const fetchReportStatus = async (reportId) => {
   return data;
 }
 
+// Eventos em tempo real (Server-Sent Events, rota /eventos): `onReport` recebe cada mudança de
+// status/progresso dos relatórios e `onStats` as estatísticas atualizadas quando um relatório termina.
+// Retorna a função que encerra a conexão; o navegador reconecta sozinho se ela cair.
+export const subscribeToEvents = ({ reportIds = [], onReport, onStats } = {}) => {
+  const params = new URLSearchParams();
+  reportIds.forEach((id) => params.append('relatorio_id', id));
+  const query = params.toString();
+  const source = new EventSource(`${apiClient.defaults.baseURL}/eventos${query ? `?${query}` : ''}`);
+  if (onReport) source.addEventListener('relatorio', (event) => onReport(JSON.parse(event.data)));
+  if (onStats) source.addEventListener('stats', (event) => onStats(JSON.parse(event.data)));
+  return () => source.close();
+};
+
 export const deleteAllClients = async () => {
     const response = await apiClient.delete('/clients/all');
     return response.data;
@@ -0,0 +1,17 @@
+"""Configuração comum dos testes: ambiente isolado, sem Supabase real.
+
+Uso (na raiz do repositório):
+    python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Definidas antes de qualquer import de `backend`: a fila, o spool e os caches ficam num diretório descartável
+_TMP = tempfile.mkdtemp(prefix="testes_desconexao_")
+os.environ["UPLOAD_SPOOL_DIR"] = _TMP
+os.environ["JOBS_DB_PATH"] = os.path.join(_TMP, "jobs.sqlite3")
+os.environ.setdefault("SUPABASE_URL", "http://supabase.invalid")
+os.environ.setdefault("SUPABASE_KEY", "chave-de-teste")
@@ -0,0 +1,122 @@
+import json
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.services import bulk_writer
+from backend.services.bulk_writer import inserir_em_lotes, serializar_registros
+
+
+def _cliente(responder):
+    """Cliente com a mesma sessão HTTP do supabase-py (`postgrest.session`), respondida por `responder`."""
+    sessao = httpx.Client(transport=httpx.MockTransport(responder), base_url="http://supabase.invalid/rest/v1/")
+    return SimpleNamespace(postgrest=SimpleNamespace(session=sessao))
+
+
+def test_serializa_direto_para_bytes_json():
+    df = pd.DataFrame({
+        "nome": ["José", None],
+        "rx_onu": np.array([-21.37, np.nan], dtype="float32"),
+        "distancia_m": pd.array([1500, None], dtype="Int64"),
+    })
+
+    corpo = serializar_registros(df)
+
+    assert isinstance(corpo, bytes)
+    assert json.loads(corpo) == [
+        {"nome": "José", "rx_onu": -21.37, "distancia_m": 1500},
+        {"nome": None, "rx_onu": None, "distancia_m": None},
+    ]
+
+
+def test_datas_com_e_sem_fuso_saem_em_utc_com_z():
+    df = pd.DataFrame({
+        "com_fuso": pd.to_datetime(["2024-03-01 12:00:00-03:00", None], utc=True),
+        "sem_fuso": pd.to_datetime(["2024-03-01 15:00:00", None]),
+    })
+
+    registros = json.loads(serializar_registros(df))
+
+    assert registros[0] == {"com_fuso": "2024-03-01T15:00:00.000000Z", "sem_fuso": "2024-03-01T15:00:00.000000Z"}
+    assert registros[1] == {"com_fuso": None, "sem_fuso": None}
+
+
+def test_lotes_vao_ao_postgrest_como_o_corpo_serializado():
+    requisicoes = []
+
+    def responder(request):
+        requisicoes.append(request)
+        return httpx.Response(201)
+
+    df = pd.DataFrame({"serial_onu": [f"S{i}" for i in range(5)], "horas_offline": range(5)})
+
+    assert inserir_em_lotes(_cliente(responder), "clientes_off", df, tamanho_lote=2, max_concorrencia=1) == 5
+    inserir_em_lotes(_cliente(responder), "clientes_off", df.head(1), on_conflict="serial_onu")
+
+    assert [r.url.path for r in requisicoes] == ["/rest/v1/clientes_off"] * 4
+    assert [len(json.loads(r.content)) for r in requisicoes[:3]] == [2, 2, 1]
+    assert requisicoes[0].headers["prefer"] == "return=minimal"
+    assert requisicoes[3].url.params["on_conflict"] == "serial_onu"
+    assert requisicoes[3].headers["prefer"] == "resolution=merge-duplicates,return=minimal"
+
+
+def _falhando(falhas):
+    """Responde com as `falhas` (exceções ou status HTTP) em ordem e depois com sucesso."""
+    tentativas = []
+
+    def responder(request):
+        tentativas.append(request)
+        if len(tentativas) <= len(falhas):
+            falha = falhas[len(tentativas) - 1]
+            if isinstance(falha, int):
+                return httpx.Response(falha, json={"message": "indisponível"})
+            raise falha("falha simulada", request=request)
+        return httpx.Response(201)
+
+    return responder, tentativas
+
+
+@pytest.fixture(autouse=True)
+def _sem_espera(monkeypatch):
+    monkeypatch.setattr(bulk_writer, "BULK_RETRY_BACKOFF_S", 0)
+
+
+@pytest.mark.parametrize("falha", [503, httpx.ReadTimeout, httpx.RemoteProtocolError])
+def test_insert_simples_nao_e_repetido_depois_de_poder_ter_sido_gravado(falha):
+    responder, tentativas = _falhando([falha])
+    df = pd.DataFrame({"agente": ["Ana"]})
+
+    with pytest.raises(Exception, match="após 1 tentativa"):
+        inserir_em_lotes(_cliente(responder), "sac_performance", df, max_tentativas=3)
+
+    assert len(tentativas) == 1
+
+
+@pytest.mark.parametrize("falha", [httpx.ConnectError, httpx.ConnectTimeout])
+def test_insert_simples_e_repetido_se_nao_chegou_a_ser_enviado(falha):
+    responder, tentativas = _falhando([falha, falha])
+    df = pd.DataFrame({"agente": ["Ana"]})
+
+    assert inserir_em_lotes(_cliente(responder), "sac_performance", df, max_tentativas=3) == 1
+    assert len(tentativas) == 3
+
+
+def test_upsert_e_repetido_apos_qualquer_falha():
+    responder, tentativas = _falhando([503, httpx.ReadTimeout])
+    df = pd.DataFrame({"serial_onu": ["A"]})
+
+    assert inserir_em_lotes(_cliente(responder), "clientes_off", df, max_tentativas=3, on_conflict="serial_onu") == 1
+    assert len(tentativas) == 3
+
+
+def test_upsert_desiste_ao_esgotar_as_tentativas():
+    responder, tentativas = _falhando([503, 503, 503])
+
+    with pytest.raises(Exception, match="após 3 tentativa"):
+        inserir_em_lotes(_cliente(responder), "clientes_off", pd.DataFrame({"serial_onu": ["A"]}),
+                         max_tentativas=3, on_conflict="serial_onu")
+
+    assert len(tentativas) == 3
@@ -0,0 +1,150 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.services.cache import CacheDeRespostas, etag_corresponde
+
+
+def test_misses_simultaneos_fazem_uma_unica_carga():
+    cache = CacheDeRespostas(ttl=60)
+    cargas = 0
+
+    async def carregar():
+        nonlocal cargas
+        cargas += 1
+        await asyncio.sleep(0.05)
+        return {"total": 10}
+
+    async def cenario():
+        return await asyncio.gather(*(cache.obter("stats:kpis", carregar) for _ in range(20)))
+
+    respostas = asyncio.run(cenario())
+
+    assert cargas == 1
+    assert len(set(respostas)) == 1
+    assert json.loads(respostas[0][0]) == {"total": 10}
+
+
+def test_falha_na_carga_chega_a_todos_e_nao_fica_em_cache():
+    cache = CacheDeRespostas(ttl=60)
+    cargas = 0
+
+    async def carregar():
+        nonlocal cargas
+        cargas += 1
+        await asyncio.sleep(0.01)
+        if cargas == 1:
+            raise RuntimeError("PostgREST indisponível")
+        return [1, 2]
+
+    async def cenario():
+        resultados = await asyncio.gather(*(cache.obter("k", carregar) for _ in range(5)), return_exceptions=True)
+        return resultados, await cache.obter("k", carregar)
+
+    resultados, depois = asyncio.run(cenario())
+
+    assert all(isinstance(r, RuntimeError) for r in resultados)
+    assert json.loads(depois[0]) == [1, 2]
+    assert cargas == 2
+
+
+def test_invalidacao_durante_a_carga_descarta_o_resultado():
+    cache = CacheDeRespostas(ttl=60)
+    valores = iter(["antigo", "novo"])
+
+    async def carregar():
+        valor = next(valores)
+        if valor == "antigo":
+            await asyncio.sleep(0.02)
+        return valor
+
+    async def cenario():
+        carga = asyncio.create_task(cache.obter("k", carregar))
+        await asyncio.sleep(0.005)
+        cache.invalidar()
+        primeira = await carga
+        return primeira, await cache.obter("k", carregar)
+
+    primeira, segunda = asyncio.run(cenario())
+
+    assert json.loads(primeira[0]) == "antigo"
+    assert json.loads(segunda[0]) == "novo"
+
+
+def test_ttl_zero_desliga_o_cache():
+    cache = CacheDeRespostas(ttl=0)
+    cargas = []
+
+    async def cenario():
+        for _ in range(3):
+            await cache.obter("k", lambda: cargas.append(1) or len(cargas))
+
+    asyncio.run(cenario())
+
+    assert len(cargas) == 3
+
+
+def test_invalidar_por_prefixo():
+    cache = CacheDeRespostas(ttl=60)
+    cargas = []
+
+    async def cenario():
+        for chave in ("stats:kpis", "stats:clients-by-city", "stats:kpis", "stats:clients-by-city"):
+            await cache.obter(chave, lambda: cargas.append(chave) or chave)
+            if len(cargas) == 2:
+                cache.invalidar("stats:kpis")
+
+    asyncio.run(cenario())
+
+    assert cargas == ["stats:kpis", "stats:clients-by-city", "stats:kpis"]
+
+
+@pytest.mark.parametrize("cabecalho, esperado", [
+    (None, False),
+    ("", False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", "abc"', True),
+    ("*", True),
+    ('"abcd"', False),
+])
+def test_etag_corresponde(cabecalho, esperado):
+    assert etag_corresponde(cabecalho, '"abc"') is esperado
+
+
+def test_rota_stats_responde_304_e_consulta_o_banco_uma_vez(monkeypatch):
+    import backend.main as api
+
+    chamadas = []
+    kpis = {"new_critical_cases_24h": 3, "most_critical_olt": "OLT-1", "oldest_case_days": 5}
+
+    def responder(request):
+        chamadas.append(request.url.path)
+        return httpx.Response(200, json=[kpis])
+
+    monkeypatch.setattr(api.supabase_async, "_client", httpx.AsyncClient(
+        transport=httpx.MockTransport(responder), base_url=api.supabase_async.base_url,
+    ))
+    api.cache_stats.invalidar()
+    cliente = TestClient(api.app)
+
+    primeira = cliente.get("/stats/kpis")
+    etag = primeira.headers["etag"]
+    segunda = cliente.get("/stats/kpis", headers={"If-None-Match": etag})
+
+    assert primeira.status_code == 200 and primeira.json() == kpis
+    assert segunda.status_code == 304 and segunda.content == b""
+    assert segunda.headers["etag"] == etag
+    assert len(chamadas) == 1
+
+    # Depois de um novo relatório (invalidação), o ETag antigo deixa de valer se os dados mudaram
+    kpis = {"new_critical_cases_24h": 4, "most_critical_olt": "OLT-1", "oldest_case_days": 5}
+    api.cache_stats.invalidar()
+    terceira = cliente.get("/stats/kpis", headers={"If-None-Match": etag})
+
+    assert terceira.status_code == 200 and terceira.json() == kpis
+    assert terceira.headers["etag"] != etag
+    assert len(chamadas) == 2
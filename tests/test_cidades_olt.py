@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from backend.services.processors.desconexao_processor import OLT_CIDADE_MAP, get_cidade_from_olt, mapear_cidades
+
+
+def _cidade_por_varredura(olt_regiao):
+    """Regra original: a primeira chave do mapa (na ordem do dicionário) contida no texto."""
+    if not isinstance(olt_regiao, str):
+        return 'Outra'
+    for key, city in OLT_CIDADE_MAP.items():
+        if key in olt_regiao:
+            return city
+    return 'Outra'
+
+
+@pytest.mark.parametrize("olt", list(OLT_CIDADE_MAP))
+def test_cada_chave_do_mapa_resolve_como_a_varredura(olt):
+    assert get_cidade_from_olt(olt) == _cidade_por_varredura(olt)
+    assert get_cidade_from_olt(f"PON 0/1/3 {olt} (backup)") == _cidade_por_varredura(f"PON 0/1/3 {olt} (backup)")
+
+
+@pytest.mark.parametrize("olt", [
+    # Chaves que contêm outras chaves do mapa
+    "OLT-LDB-HUAWEI-DC-02",
+    "OLT-LDB-HUAWEI-UTF-PR-2",
+    "OLT-MGF-PARKS-ORIENTAL-04---MIGRAÇÃO",
+    # Duas chaves no mesmo texto, em ordens diferentes
+    "OLT-APU-FH-SEDE / OLT-LDB-HUAWEI-DC",
+    "OLT-LDB-HUAWEI-DC / OLT-APU-FH-SEDE",
+    "OLT-ZTE-BANCADAOLT-MGF-ZTE-SERENITY-02",
+    # Sem correspondência, parcial e com caixa diferente
+    "OLT-XYZ-NOVA",
+    "OLT-LDB-HUAWEI",
+    "olt-ldb-huawei-dc",
+    "",
+])
+def test_textos_com_sobreposicao_resolvem_como_a_varredura(olt):
+    assert get_cidade_from_olt(olt) == _cidade_por_varredura(olt)
+
+
+@pytest.mark.parametrize("valor", [None, float("nan"), 42])
+def test_valores_que_nao_sao_texto_viram_outra(valor):
+    assert get_cidade_from_olt(valor) == 'Outra'
+
+
+def test_mapear_cidades_equivale_a_aplicar_linha_a_linha():
+    olts = pd.Series(["OLT-LDB-HUAWEI-DC-02", None, "OLT-XYZ", "OLT-LDB-HUAWEI-DC-02", "x OLT-CFN-FH-CALIFORNIA"], index=[5, 3, 9, 1, 7])
+
+    cidades = mapear_cidades(olts)
+
+    assert cidades.tolist() == [_cidade_por_varredura(olt) for olt in olts]
+    assert cidades.index.tolist() == [5, 3, 9, 1, 7]
+
+
+def test_mapear_cidades_aceita_coluna_categorica():
+    olts = pd.Series(["OLT-APS-FH-AGUIA", "OLT-APS-FH-AGUIA", None], dtype="category")
+
+    assert mapear_cidades(olts).tolist() == ["Arapongas", "Arapongas", "Outra"]
@@ -0,0 +1,164 @@
+import asyncio
+import re
+
+import pytest
+
+from backend.services.consulta_clientes import ConsultaClientes, CursorInvalido, codificar_cursor, decodificar_cursor
+
+
+def _dividir(texto):
+    """Separa os itens de uma lista lógica do PostgREST nas vírgulas de nível zero (fora de aspas e parênteses)."""
+    itens, nivel, aspas, atual, escape = [], 0, False, "", False
+    for char in texto:
+        if escape:
+            atual, escape = atual + char, False
+            continue
+        if char == "\\":
+            atual, escape = atual + char, True
+            continue
+        if char == '"':
+            aspas = not aspas
+        elif not aspas and char == "(":
+            nivel += 1
+        elif not aspas and char == ")":
+            nivel -= 1
+        elif not aspas and nivel == 0 and char == ",":
+            itens.append(atual)
+            atual = ""
+            continue
+        atual += char
+    return itens + [atual]
+
+
+def _valor(texto):
+    if texto.startswith('"'):
+        return re.sub(r"\\(.)", r"\1", texto[1:-1])
+    return float(texto)
+
+
+def _avaliar(expressao, linha):
+    """Avalia a condição lógica (subconjunto usado por ConsultaClientes) sobre uma linha."""
+    for operador, combinar in (("or(", any), ("and(", all)):
+        if expressao.startswith(operador):
+            return combinar(_avaliar(item, linha) for item in _dividir(expressao[len(operador):-1]))
+    coluna, op, bruto = expressao.split(".", 2)
+    atual = linha[coluna]
+    if op == "is":
+        return atual is None
+    if atual is None:
+        return False
+    valor = _valor(bruto)
+    return {"eq": atual == valor, "gt": atual > valor, "lt": atual < valor, "gte": atual >= valor, "lte": atual <= valor}[op]
+
+
+class _PostgrestEmMemoria:
+    """Responde `select` sobre uma lista de linhas, interpretando filtros, ordem e limite como o PostgREST."""
+
+    def __init__(self, linhas):
+        self.linhas = linhas
+        self.consultas = 0
+
+    async def select(self, tabela, colunas="*", filtros=None, ordem=None, limite=None, timeout=None):
+        self.consultas += 1
+        linhas = self.linhas
+        for coluna, filtro in (filtros or {}).items():
+            if coluna == "and":
+                linhas = [linha for linha in linhas if _avaliar(f"and{filtro}", linha)]
+            elif filtro.startswith("eq."):
+                linhas = [linha for linha in linhas if linha[coluna] == filtro[3:]]
+            else:
+                permitidos = {_valor(item) for item in _dividir(filtro[4:-1])}
+                linhas = [linha for linha in linhas if linha[coluna] in permitidos]
+        for chave in reversed(ordem.split(",")):
+            coluna, direcao = chave.split(".")[:2]
+            # "nullslast" nas duas direções: os nulos vão para o fim depois da ordenação pelo valor
+            linhas = sorted(linhas, key=lambda linha: (linha[coluna] is None, linha[coluna] or 0), reverse=direcao == "desc")
+            linhas = [linha for linha in linhas if linha[coluna] is not None] + [linha for linha in linhas if linha[coluna] is None]
+        return linhas[:limite]
+
+
+def _ordem_esperada(linhas, coluna, descendente):
+    preenchidas = sorted((l for l in linhas if l[coluna] is not None), key=lambda l: (l[coluna], l["id"]), reverse=descendente)
+    nulas = sorted((l for l in linhas if l[coluna] is None), key=lambda l: l["id"], reverse=descendente)
+    return [l["id"] for l in preenchidas + nulas]
+
+
+def _percorrer(consulta, cliente, limite):
+    async def todas():
+        ids, cursor = [], None
+        # Um cursor que não avança repetiria a mesma página para sempre
+        for _ in range(len(cliente.linhas) + 1):
+            pagina, cursor = await consulta.pagina(cliente, limite, cursor)
+            ids += [linha["id"] for linha in pagina]
+            if cursor is None:
+                return ids
+        pytest.fail(f"A paginação não terminou; ids até aqui: {ids}")
+    return asyncio.run(todas())
+
+
+# Empates e nulos de propósito, com ids fora de ordem em relação aos valores
+LINHAS = [
+    {"id": 1, "horas_offline": 72, "nome_cliente": "Ana", "cidade": "Londrina", "rx_onu": -21.5},
+    {"id": 2, "horas_offline": 48, "nome_cliente": None, "cidade": "Maringá", "rx_onu": None},
+    {"id": 3, "horas_offline": 72, "nome_cliente": "Bruno", "cidade": "Londrina", "rx_onu": -25.0},
+    {"id": 4, "horas_offline": None, "nome_cliente": "Ana", "cidade": "Londrina", "rx_onu": -21.5},
+    {"id": 5, "horas_offline": 72, "nome_cliente": 'Carla "Cacá"', "cidade": "Maringá", "rx_onu": None},
+    {"id": 6, "horas_offline": None, "nome_cliente": None, "cidade": "Outra", "rx_onu": -30.25},
+    {"id": 7, "horas_offline": 200, "nome_cliente": "Ana", "cidade": "Londrina", "rx_onu": -21.5},
+    {"id": 8, "horas_offline": 48, "nome_cliente": "Davi, o 2º", "cidade": "Maringá", "rx_onu": -19.0},
+    {"id": 9, "horas_offline": None, "nome_cliente": "Bruno", "cidade": "Londrina", "rx_onu": None},
+]
+
+
+@pytest.mark.parametrize("coluna", ["horas_offline", "nome_cliente", "rx_onu", "id"])
+@pytest.mark.parametrize("direcao", ["asc", "desc"])
+@pytest.mark.parametrize("limite", [1, 2, 4])
+def test_paginas_percorrem_todas_as_linhas_uma_vez_com_nulos_e_empates(coluna, direcao, limite):
+    consulta = ConsultaClientes(ordenar_por=coluna, direcao=direcao)
+
+    ids = _percorrer(consulta, _PostgrestEmMemoria(LINHAS), limite)
+
+    assert ids == _ordem_esperada(LINHAS, coluna, direcao == "desc")
+
+
+def test_cursor_combina_com_filtros():
+    consulta = ConsultaClientes(cidade=["Londrina", "Maringá"], horas_min=48, ordenar_por="horas_offline", direcao="desc")
+
+    ids = _percorrer(consulta, _PostgrestEmMemoria(LINHAS), 2)
+
+    assert ids == [7, 5, 3, 1, 8, 2]
+
+
+def test_cursor_no_meio_dos_nulos_continua_so_entre_eles():
+    linhas = [{"id": i, "horas_offline": None} for i in range(1, 6)] + [{"id": 6, "horas_offline": 10}]
+    consulta = ConsultaClientes(ordenar_por="horas_offline", direcao="asc")
+    cursor = codificar_cursor({"id": 2, "horas_offline": None}, "horas_offline")
+
+    pagina, proximo = asyncio.run(consulta.pagina(_PostgrestEmMemoria(linhas), 10, cursor))
+
+    assert [linha["id"] for linha in pagina] == [3, 4, 5]
+    assert proximo is None
+
+
+def test_ultima_pagina_cheia_nao_gera_cursor():
+    cliente = _PostgrestEmMemoria(LINHAS)
+
+    pagina, proximo = asyncio.run(ConsultaClientes(ordenar_por="id").pagina(cliente, len(LINHAS)))
+
+    assert len(pagina) == len(LINHAS)
+    assert proximo is None
+    assert cliente.consultas == 1
+
+
+def test_cursor_preserva_valor_e_id():
+    cursor = codificar_cursor({"id": 42, "nome_cliente": 'Zé "da" Silva'}, "nome_cliente")
+
+    assert decodificar_cursor(cursor) == ('Zé "da" Silva', 42)
+
+
+@pytest.mark.parametrize("cursor", ["nao-e-base64!", "W10", "eyJhIjoxfQ"])
+def test_cursor_invalido(cursor):
+    consulta = ConsultaClientes()
+
+    with pytest.raises(CursorInvalido):
+        consulta.parametros(cursor)
@@ -0,0 +1,102 @@
+import os
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.services import dedup, ingestion, jobs
+
+
+class _PostgrestFalso:
+    """Só a tabela `relatorios`, como o /upload a usa: criação e consulta do status por id."""
+
+    def __init__(self):
+        self.relatorios = {}
+        self.criacoes = 0
+
+    def __call__(self, request):
+        if request.method == "POST":
+            self.criacoes += 1
+            relatorio_id = 700 + self.criacoes
+            self.relatorios[relatorio_id] = "PENDING"
+            return httpx.Response(201, json=[{"id": relatorio_id}])
+        relatorio_id = int(request.url.params["id"].removeprefix("eq."))
+        status = self.relatorios.get(relatorio_id)
+        return httpx.Response(200, json=[{"status": status}] if status else [])
+
+
+@pytest.fixture
+def api(monkeypatch, tmp_path):
+    import backend.main as api
+
+    monkeypatch.setattr(dedup, "DEDUP_DB_PATH", str(tmp_path / "dedup.sqlite3"))
+    monkeypatch.setattr(jobs, "JOBS_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(ingestion, "UPLOAD_SPOOL_DIR", str(tmp_path / "spool"))
+    dedup.inicializar_banco()
+    jobs.inicializar_banco()
+    postgrest = _PostgrestFalso()
+    monkeypatch.setattr(api.supabase_async, "_client", httpx.AsyncClient(
+        transport=httpx.MockTransport(postgrest), base_url=api.supabase_async.base_url,
+    ))
+    return TestClient(api.app), postgrest
+
+
+def _enviar(cliente, conteudo, tipo="desconexao", nome="relatorio.csv"):
+    resposta = cliente.post("/upload", data={"report_type": tipo}, files={"file": (nome, conteudo, "text/csv")})
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+def test_mesmo_conteudo_reaproveita_o_relatorio(api, tmp_path):
+    cliente, postgrest = api
+
+    primeiro = _enviar(cliente, b"serial_onu;status\nA;LOSS\n")
+    segundo = _enviar(cliente, b"serial_onu;status\nA;LOSS\n", nome="copia.csv")
+
+    assert not primeiro.get("duplicado")
+    assert segundo == {
+        "message": "Este arquivo já foi enviado; exibindo o relatório existente.",
+        "relatorio_id": primeiro["relatorio_id"],
+        "duplicado": True,
+    }
+    assert postgrest.criacoes == 1
+    # Só o primeiro envio ficou no spool (entregue à fila); o duplicado foi descartado
+    assert len(os.listdir(tmp_path / "spool")) == 1
+    assert jobs.obter_job(primeiro["relatorio_id"])["status"] == jobs.PENDING
+
+
+def test_conteudo_ou_tipo_diferente_cria_outro_relatorio(api):
+    cliente, postgrest = api
+
+    ids = {
+        _enviar(cliente, b"serial_onu;status\nA;LOSS\n")["relatorio_id"],
+        _enviar(cliente, b"serial_onu;status\nB;LOSS\n")["relatorio_id"],
+        _enviar(cliente, b"serial_onu;status\nA;LOSS\n", tipo="sac")["relatorio_id"],
+    }
+
+    assert len(ids) == 3
+    assert postgrest.criacoes == 3
+
+
+def test_relatorio_anterior_com_falha_nao_e_reaproveitado(api):
+    cliente, postgrest = api
+    primeiro = _enviar(cliente, b"serial_onu;status\nA;LOSS\n")
+    postgrest.relatorios[primeiro["relatorio_id"]] = "FAILED"
+
+    segundo = _enviar(cliente, b"serial_onu;status\nA;LOSS\n")
+
+    assert not segundo.get("duplicado")
+    assert segundo["relatorio_id"] != primeiro["relatorio_id"]
+    # A entrada passa a apontar para o relatório novo
+    sha256 = dedup.buscar_por_relatorio(segundo["relatorio_id"])["sha256"]
+    assert dedup.buscar(sha256, "desconexao")["relatorio_id"] == segundo["relatorio_id"]
+
+
+def test_esquecer_libera_o_reenvio(api):
+    cliente, postgrest = api
+    _enviar(cliente, b"serial_onu;status\nA;LOSS\n")
+
+    assert dedup.esquecer(tipo="desconexao") == 1
+    _enviar(cliente, b"serial_onu;status\nA;LOSS\n")
+
+    assert postgrest.criacoes == 2
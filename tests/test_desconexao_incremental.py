@@ -0,0 +1,183 @@
+import json
+
+import httpx
+import pandas as pd
+
+from backend.services.processors import desconexao_processor
+from backend.services.processors.desconexao_incremental import (
+    CHAVE_EVENTOS, EVENTO_ALTERACAO, EVENTO_NOVA_QUEDA, EVENTO_RECUPERADA, IngestaoIncremental, faixa_horas_offline,
+)
+
+
+class _Resposta:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Consulta:
+    def __init__(self, cliente, tabela):
+        self.cliente, self.tabela = cliente, tabela
+        self.operacao, self.payload, self.opcoes, self.filtros, self.intervalo = "select", None, {}, [], None
+
+    def select(self, colunas):
+        return self
+
+    def order(self, coluna):
+        return self
+
+    def range(self, inicio, fim):
+        self.intervalo = (inicio, fim)
+        return self
+
+    def upsert(self, registros, **opcoes):
+        self.operacao, self.payload, self.opcoes = "upsert", registros, opcoes
+        return self
+
+    def insert(self, registros, **opcoes):
+        self.operacao, self.payload, self.opcoes = "insert", registros, opcoes
+        return self
+
+    def delete(self):
+        self.operacao = "delete"
+        return self
+
+    def in_(self, coluna, valores):
+        self.filtros.append((coluna, list(valores)))
+        return self
+
+    def execute(self):
+        self.cliente.operacoes.append((self.tabela, self.operacao, self.payload, self.opcoes, self.filtros))
+        if self.operacao == "select":
+            inicio, fim = self.intervalo
+            return _Resposta(self.cliente.estado[inicio:fim + 1])
+        return _Resposta(self.payload)
+
+
+class _SupabaseGravador:
+    """Devolve `estado` como o conteúdo de `clientes_off` e registra todas as escritas."""
+
+    def __init__(self, estado):
+        self.estado = estado
+        self.operacoes = []
+        # Os lotes do bulk_writer vão direto pela sessão HTTP do cliente (postgrest.session.post)
+        self.postgrest = self.session = self
+
+    def table(self, tabela):
+        return _Consulta(self, tabela)
+
+    def post(self, tabela, content, params=None, headers=None):
+        operacao = "upsert" if "merge-duplicates" in headers["Prefer"] else "insert"
+        self.operacoes.append((tabela, operacao, json.loads(content), dict(params or {}), []))
+        return httpx.Response(201)
+
+    def linhas(self, tabela, operacao):
+        return [linha for t, op, payload, _, _ in self.operacoes if (t, op) == (tabela, operacao) for linha in payload]
+
+
+def _onu(serial, olt, motivo="LOSS", horas=30, rx=-20.0):
+    return {"serial_onu": serial, "olt_regiao": olt, "motivo_desconexao": motivo, "horas_offline": horas, "rx_onu": rx}
+
+
+def _snapshot(*onus):
+    return pd.DataFrame([dict(onu, nome_cliente=f"Cliente {onu['serial_onu']}", relatorio_id=9) for onu in onus])
+
+
+def test_grava_so_onus_novas_ou_alteradas():
+    supabase = _SupabaseGravador([
+        _onu("A", "OLT-1"),
+        _onu("B", "OLT-1"),
+        _onu("C", "OLT-1", rx=-21.0),
+        _onu("D", "OLT-1", motivo="SEM ENERGIA"),
+    ])
+    sessao = IngestaoIncremental(supabase, relatorio_id=9)
+
+    gravadas = sessao.aplicar(_snapshot(
+        _onu("A", "OLT-1", motivo=" loss ", horas=40, rx=-20.001),  # mesma faixa, motivo e rx arredondado iguais
+        _onu("B", "OLT-1", horas=50),                                # mudou de faixa (24-48 -> 48-72)
+        _onu("C", "OLT-1", rx=-23.5),                                # rx mudou
+        _onu("D", "OLT-1", motivo="LOSS"),                           # motivo mudou
+        _onu("E", "OLT-1"),                                          # nova
+    ))
+
+    assert gravadas == 4
+    upserts = supabase.linhas("clientes_off", "upsert")
+    assert sorted(linha["serial_onu"] for linha in upserts) == ["B", "C", "D", "E"]
+    assert all(op[3] == {"on_conflict": "serial_onu"} for op in supabase.operacoes if op[:2] == ("clientes_off", "upsert"))
+    assert all(op[3] == {"on_conflict": CHAVE_EVENTOS} for op in supabase.operacoes if op[:2] == ("eventos_onu", "upsert"))
+    eventos = {linha["serial_onu"]: linha["evento"] for linha in supabase.linhas("eventos_onu", "upsert")}
+    assert eventos == {"B": EVENTO_ALTERACAO, "C": EVENTO_ALTERACAO, "D": EVENTO_ALTERACAO, "E": EVENTO_NOVA_QUEDA}
+    assert all(linha["relatorio_id"] == 9 for linha in supabase.linhas("eventos_onu", "upsert"))
+    assert sessao.contagem["inalteradas"] == 1
+
+
+def test_estado_em_memoria_evita_regravar_entre_chunks():
+    supabase = _SupabaseGravador([])
+    sessao = IngestaoIncremental(supabase, relatorio_id=9)
+
+    assert sessao.aplicar(_snapshot(_onu("A", "OLT-1"), _onu("B", "OLT-1"))) == 2
+    # A mesma ONU repetida num chunk seguinte (ex.: arquivo com linhas duplicadas) não gera nova escrita
+    assert sessao.aplicar(_snapshot(_onu("A", "OLT-1"), _onu("B", "OLT-1", horas=80))) == 1
+
+    eventos = [(linha["serial_onu"], linha["evento"]) for linha in supabase.linhas("eventos_onu", "upsert")]
+    assert eventos == [("A", EVENTO_NOVA_QUEDA), ("B", EVENTO_NOVA_QUEDA), ("B", EVENTO_ALTERACAO)]
+
+
+def test_ignora_onus_sem_serial_e_mantem_a_ultima_repetida():
+    supabase = _SupabaseGravador([])
+    sessao = IngestaoIncremental(supabase, relatorio_id=9)
+
+    gravadas = sessao.aplicar(_snapshot(
+        _onu(None, "OLT-1"), _onu("A", "OLT-1", horas=10), _onu("A", "OLT-1", horas=100),
+    ))
+
+    assert gravadas == 1
+    assert [linha["horas_offline"] for linha in supabase.linhas("clientes_off", "upsert")] == [100]
+
+
+def test_finalizar_remove_so_recuperadas_das_olts_do_snapshot():
+    supabase = _SupabaseGravador([
+        _onu("A", "OLT-1"),
+        _onu("B", "OLT-1"),   # não aparece mais: recuperada
+        _onu("C", "OLT-2"),   # OLT só com ONUs online no snapshot: recuperada
+        _onu("D", "OLT-3"),   # OLT fora do snapshot: continua offline
+    ])
+    sessao = IngestaoIncremental(supabase, relatorio_id=9)
+    sessao.registrar_olts(["OLT-2", None])
+
+    sessao.aplicar(_snapshot(_onu("A", "OLT-1")))
+    sessao.finalizar()
+
+    removidas = [valor for t, op, _, _, filtros in supabase.operacoes if (t, op) == ("clientes_off", "delete")
+                 for coluna, valores in filtros for valor in valores]
+    assert sorted(removidas) == ["B", "C"]
+    eventos = supabase.linhas("eventos_onu", "upsert")
+    assert sorted((linha["serial_onu"], linha["evento"]) for linha in eventos) == [("B", EVENTO_RECUPERADA), ("C", EVENTO_RECUPERADA)]
+    assert sorted(sessao.estado.index) == ["A", "D"]
+
+
+def test_onu_com_data_invalida_continua_offline(monkeypatch):
+    monkeypatch.setattr(desconexao_processor, "MODO_INGESTAO", "incremental")
+    supabase = _SupabaseGravador([_onu("A", "OLT-1"), _onu("B", "OLT-1"), _onu("C", "OLT-1")])
+    arquivo = pd.DataFrame({
+        "SN ONU": ["B", "A", "D"],
+        "OLT": ["OLT-1", "OLT-1", "OLT-1"],
+        "Status": ["LOSS", "LOSS", "LOSS"],
+        "Última Alteração de Status": ["2024-01-01 10:00:00", "nunca", "??"],
+        "RX ONU": ["-20", "-20", "-20"],
+    })
+
+    desconexao_processor.processar_relatorio_desconexao(arquivo, 9, supabase)
+
+    # A e D seguem offline no arquivo (só a data não pôde ser lida): nada é regravado nem dado como recuperado
+    assert [linha["serial_onu"] for linha in supabase.linhas("clientes_off", "upsert")] == ["B"]
+    removidas = [valor for t, op, _, _, filtros in supabase.operacoes if (t, op) == ("clientes_off", "delete")
+                 for coluna, valores in filtros for valor in valores]
+    assert removidas == ["C"]
+    eventos = sorted((linha["serial_onu"], linha["evento"]) for linha in supabase.linhas("eventos_onu", "upsert"))
+    assert eventos == [("B", EVENTO_ALTERACAO), ("C", EVENTO_RECUPERADA)]
+
+
+def test_faixa_horas_offline():
+    horas = pd.Series([0, 23, 24, 47.9, 48, 72, 167, 168, 1000, None, "abc"])
+
+    assert faixa_horas_offline(horas).tolist() == [0, 0, 1, 1, 2, 3, 3, 4, 4, -1, -1]
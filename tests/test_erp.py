@@ -0,0 +1,165 @@
+import asyncio
+
+import httpx
+import pandas as pd
+import pytest
+
+from backend.services import erp
+from backend.services.ingestion import encerrar_contexto
+
+
+@pytest.fixture(autouse=True)
+def cache_isolado(monkeypatch, tmp_path):
+    monkeypatch.setattr(erp, "ERP_CACHE_DB_PATH", str(tmp_path / "erp.sqlite3"))
+    erp.inicializar_banco()
+
+
+@pytest.fixture
+def esperas(monkeypatch):
+    """Registra as pausas entre tentativas em vez de esperar de fato."""
+    registradas = []
+
+    async def dormir(segundos):
+        registradas.append(segundos)
+
+    monkeypatch.setattr(erp.asyncio, "sleep", dormir)
+    return registradas
+
+
+def _erp(responder, requisicoes):
+    def transport(request):
+        requisicoes.append(request)
+        return responder(request)
+
+    return httpx.MockTransport(transport)
+
+
+def _clientes_conhecidos(request):
+    nome = request.url.params["nome"]
+    return httpx.Response(200, json=[] if nome.startswith("Fulano") else [{"id": 7, "nome": nome}])
+
+
+def _cliente(responder, requisicoes, **opcoes):
+    opcoes.setdefault("tamanho_lote", 0)
+    return erp.ClienteErp(url="http://erp.invalid", requisicoes_por_segundo=0, transport=_erp(responder, requisicoes), **opcoes)
+
+
+def test_respeita_retry_after_do_erp(esperas):
+    requisicoes = []
+    respostas = iter([httpx.Response(429, headers={"Retry-After": "3"}), httpx.Response(200, json=[{"id": 42, "nome": "Ana"}])])
+
+    async def cenario():
+        cliente = _cliente(lambda request: next(respostas), requisicoes, usar_cache=False)
+        try:
+            return await cliente.buscar("Ana")
+        finally:
+            await cliente.fechar()
+
+    assert asyncio.run(cenario()) == {"client_id": 42, "client_name": "Ana"}
+    assert len(requisicoes) == 2
+    assert esperas == [3.0]
+
+
+def test_sem_retry_after_usa_backoff_e_desiste_ao_esgotar_as_tentativas(esperas, monkeypatch):
+    monkeypatch.setattr(erp, "ERP_MAX_TENTATIVAS", 3)
+    requisicoes = []
+
+    async def cenario():
+        cliente = _cliente(lambda request: httpx.Response(503), requisicoes, usar_cache=False)
+        try:
+            return await cliente.buscar("Ana")
+        finally:
+            await cliente.fechar()
+
+    with pytest.raises(erp.ErroErp, match="503"):
+        asyncio.run(cenario())
+    assert len(requisicoes) == 3
+    assert esperas == [1, 2]
+
+
+def test_nome_inexistente_fica_em_cache_negativo(monkeypatch):
+    requisicoes = []
+
+    async def buscar(nomes):
+        cliente = _cliente(_clientes_conhecidos, requisicoes)
+        try:
+            return await cliente.buscar_muitos(nomes)
+        finally:
+            await cliente.fechar()
+
+    nomes = ["Ana Souza", "Fulano Inexistente"]
+    assert asyncio.run(buscar(nomes)) == {"ana_souza": {"client_id": 7, "client_name": "Ana Souza"}, "fulano_inexistente": None}
+    assert len(requisicoes) == 2
+
+    # Outro cliente (ex.: outro job) já sabe que o nome não existe, sem consultar o ERP
+    assert asyncio.run(buscar([" fulano   INEXISTENTE"])) == {"fulano_inexistente": None}
+    assert len(requisicoes) == 2
+
+    # Vencido o prazo do cache negativo (aqui, já ao gravar), o nome volta a ser consultado
+    monkeypatch.setattr(erp, "ERP_CACHE_TTL_NEGATIVO_S", -1)
+    asyncio.run(buscar(["Fulano Sumido"]))
+    assert asyncio.run(buscar(["Fulano Sumido", "Ana Souza"])) == {"fulano_sumido": None, "ana_souza": {"client_id": 7, "client_name": "Ana Souza"}}
+    assert [r.url.params["nome"] for r in requisicoes[2:]] == ["Fulano Sumido", "Fulano Sumido"]
+
+
+def test_falha_do_erp_nao_vai_para_o_cache(esperas):
+    requisicoes = []
+    respostas = iter([httpx.Response(500)] * erp.ERP_MAX_TENTATIVAS)
+
+    async def buscar(responder):
+        cliente = _cliente(responder, requisicoes)
+        try:
+            return await cliente.buscar_muitos(["Ana"])
+        finally:
+            await cliente.fechar()
+
+    with pytest.raises(erp.ErroErp):
+        asyncio.run(buscar(lambda request: next(respostas)))
+    assert asyncio.run(buscar(_clientes_conhecidos)) == {"ana": {"client_id": 7, "client_name": "Ana"}}
+
+
+def test_um_cliente_e_um_event_loop_por_relatorio(monkeypatch):
+    requisicoes = []
+    criados = []
+
+    class _ClienteContado(erp.ClienteErp):
+        def __init__(self, **opcoes):
+            super().__init__(url="http://erp.invalid", requisicoes_por_segundo=0, tamanho_lote=0,
+                             transport=_erp(_clientes_conhecidos, requisicoes))
+            criados.append((self, asyncio.get_running_loop()))
+
+    monkeypatch.setattr(erp, "ClienteErp", _ClienteContado)
+    contexto = {}
+    chunks = [pd.DataFrame({"nome_cliente": ["Ana", "Bruno"]}), pd.DataFrame({"nome_cliente": ["Carla", None]})]
+
+    resultados = [erp.enriquecer_com_erp(chunk, sessao=erp.obter_enriquecimento(contexto)) for chunk in chunks]
+
+    assert len(criados) == 1
+    assert resultados[1]["erp_client_id"].tolist() == [7, pd.NA]
+    assert len(requisicoes) == 3
+    cliente, loop = criados[0]
+    assert not loop.is_closed()
+
+    encerrar_contexto(contexto)
+
+    assert cliente._client.is_closed
+    assert loop.is_closed()
+
+
+def test_sem_contexto_o_cliente_e_fechado_na_mesma_chamada(monkeypatch):
+    criados = []
+
+    class _ClienteContado(erp.ClienteErp):
+        def __init__(self, **opcoes):
+            super().__init__(url="http://erp.invalid", requisicoes_por_segundo=0, tamanho_lote=0,
+                             transport=_erp(lambda request: httpx.Response(503), []))
+            criados.append(self)
+
+    monkeypatch.setattr(erp, "ClienteErp", _ClienteContado)
+    monkeypatch.setattr(erp, "ERP_MAX_TENTATIVAS", 1)
+
+    df = erp.enriquecer_com_erp(pd.DataFrame({"nome_cliente": ["Ana"]}))
+
+    # O ERP fora do ar não derruba a ingestão: a coluna fica nula
+    assert df["erp_client_id"].isna().all()
+    assert len(criados) == 1 and criados[0]._client.is_closed
@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import pytest
+
+from backend.services import jobs
+from backend.services.eventos import EVENTO_RELATORIO, CanalDeEventos, _Assinatura, estado_do_job
+
+
+@pytest.fixture(autouse=True)
+def fila_isolada(monkeypatch, tmp_path):
+    monkeypatch.setattr(jobs, "JOBS_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    jobs.inicializar_banco()
+
+
+def _job(relatorio_id, atualizado_em, status=jobs.PROCESSING, progresso=None):
+    jobs.enfileirar(relatorio_id, f"/tmp/{relatorio_id}.csv", f"{relatorio_id}.csv", "desconexao")
+    with jobs._conectar() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, progresso = ?, atualizado_em = ? WHERE relatorio_id = ?",
+            (status, progresso, atualizado_em, relatorio_id),
+        )
+
+
+def _canal_com_assinatura(relatorio_ids=None, desde=100.0):
+    canal = CanalDeEventos()
+    canal._ultima_leitura = desde
+    assinatura = _Assinatura(relatorio_ids)
+    canal._assinaturas.add(assinatura)
+    return canal, assinatura
+
+
+def _recebidos(assinatura):
+    mensagens = []
+    while not assinatura.fila.empty():
+        evento, dados = assinatura.fila.get_nowait().decode().strip().split("\n")
+        assert evento == f"event: {EVENTO_RELATORIO}"
+        mensagens.append(json.loads(dados.removeprefix("data: ")))
+    return [(m["relatorio_id"], m["status"], m["progresso"]) for m in mensagens]
+
+
+def test_publica_cada_mudanca_uma_unica_vez():
+    canal, assinatura = _canal_com_assinatura()
+    _job(1, 101.0, progresso=10)
+
+    asyncio.run(canal.sincronizar())
+    asyncio.run(canal.sincronizar())
+
+    assert _recebidos(assinatura) == [(1, jobs.PROCESSING, 10)]
+    _job(1, 102.0, status=jobs.COMPLETED)
+    asyncio.run(canal.sincronizar())
+    assert _recebidos(assinatura) == [(1, jobs.COMPLETED, 100)]
+
+
+def test_job_atualizado_no_mesmo_instante_do_ultimo_publicado_nao_se_perde():
+    canal, assinatura = _canal_com_assinatura()
+    _job(1, 105.0, progresso=30)
+    asyncio.run(canal.sincronizar())
+
+    # Outro job gravado com o mesmo `atualizado_em` depois da leitura
+    _job(2, 105.0, progresso=50)
+    asyncio.run(canal.sincronizar())
+
+    assert _recebidos(assinatura) == [(1, jobs.PROCESSING, 30), (2, jobs.PROCESSING, 50)]
+
+
+def test_mudancas_anteriores_a_ultima_leitura_sao_ignoradas():
+    canal, assinatura = _canal_com_assinatura(desde=200.0)
+    _job(1, 150.0)
+
+    asyncio.run(canal.sincronizar())
+
+    assert _recebidos(assinatura) == []
+
+
+def test_conexao_com_filtro_so_recebe_os_relatorios_pedidos():
+    canal, so_o_2 = _canal_com_assinatura(relatorio_ids={2})
+    todos = _Assinatura(None)
+    canal._assinaturas.add(todos)
+    _job(1, 101.0)
+    _job(2, 102.0)
+
+    asyncio.run(canal.sincronizar())
+
+    assert [r[0] for r in _recebidos(so_o_2)] == [2]
+    assert [r[0] for r in _recebidos(todos)] == [1, 2]
+
+
+def test_cliente_lento_perde_os_eventos_mais_antigos(monkeypatch):
+    monkeypatch.setattr("backend.services.eventos.EVENTOS_FILA_MAXIMA", 2)
+    canal, assinatura = _canal_com_assinatura()
+
+    for relatorio_id in (1, 2, 3):
+        canal.publicar(EVENTO_RELATORIO, {"relatorio_id": relatorio_id, "status": jobs.PROCESSING, "progresso": 0})
+
+    assert [r[0] for r in _recebidos(assinatura)] == [2, 3]
+
+
+def test_estado_do_job_cancelado_traz_o_motivo():
+    _job(1, 101.0, status=jobs.CANCELLED, progresso=40)
+
+    estado = estado_do_job(jobs.obter_job(1))
+
+    assert estado["status"] == jobs.CANCELLED
+    assert estado["detalhes_erro"] == "Processamento cancelado pelo usuário."
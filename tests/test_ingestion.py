@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+
+from backend.services import ingestion
+from backend.services.ingestion import detectar_formato_csv, ler_arquivo_em_chunks
+
+
+def _csv(tmp_path, linhas, encoding):
+    caminho = tmp_path / "relatorio.csv"
+    caminho.write_bytes(("\n".join(linhas) + "\n").encode(encoding))
+    return str(caminho)
+
+
+def test_latin1_com_o_primeiro_acento_depois_da_amostra(tmp_path):
+    # Só ASCII nos primeiros ~100 KiB; os acentos aparecem no fim do arquivo
+    linhas = ["nome;cidade"] + [f"Cliente {i};Londrina" for i in range(5000)] + ["João;Paiçandu", "Ângela;Maringá"]
+    caminho = _csv(tmp_path, linhas, "latin-1")
+
+    assert detectar_formato_csv(caminho) == (";", "latin-1")
+    df = pd.concat(ler_arquivo_em_chunks(caminho, "relatorio.csv", chunksize=1000))
+    assert df["nome"].tolist()[-2:] == ["João", "Ângela"]
+    assert df["cidade"].tolist()[-2:] == ["Paiçandu", "Maringá"]
+
+
+def test_utf8_com_caractere_cortado_entre_blocos(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, "UPLOAD_READ_BLOCK_BYTES", 7)
+    monkeypatch.setattr(ingestion, "CSV_SAMPLE_BYTES", 16)
+    caminho = _csv(tmp_path, ["nome,cidade", "Ana,Londrina", "José,Paiçandu", "Ângela,Maringá"], "utf-8")
+
+    assert detectar_formato_csv(caminho)[1] == "utf-8-sig"
+    assert pd.concat(ler_arquivo_em_chunks(caminho, "relatorio.csv"))["cidade"].tolist() == ["Londrina", "Paiçandu", "Maringá"]
+
+
+def test_utf8_com_bom(tmp_path):
+    caminho = _csv(tmp_path, ["\ufeffnome,cidade", "José,Paiçandu"], "utf-8")
+
+    df = pd.concat(ler_arquivo_em_chunks(caminho, "relatorio.csv"))
+
+    assert df.columns.tolist() == ["nome", "cidade"]
+    assert df["nome"].tolist() == ["José"]
+
+
+def test_bytes_invalidos_nao_sao_trocados_por_caractere_de_substituicao(tmp_path, monkeypatch):
+    caminho = _csv(tmp_path, ["nome,cidade", "José,Paiçandu"], "utf-8")
+    # Simula uma detecção errada: a leitura precisa falhar em vez de trocar os acentos por U+FFFD
+    monkeypatch.setattr(ingestion, "detectar_formato_csv", lambda caminho: (",", "ascii"))
+
+    with pytest.raises(UnicodeDecodeError):
+        list(ler_arquivo_em_chunks(caminho, "relatorio.csv"))
+
+
+@pytest.fixture
+def planilha_com_outra_aba_ativa(tmp_path):
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    dados = wb.active
+    dados.title = "Dados"
+    dados.append(["nome", "cidade"])
+    dados.append(["Ana", "Londrina"])
+    dados.append(["Bruno", "Maringá"])
+    resumo = wb.create_sheet("Resumo")
+    resumo.append(["total"])
+    for i in range(10):
+        resumo.append([i])
+    wb.active = 1
+    caminho = tmp_path / "relatorio.xlsx"
+    wb.save(caminho)
+    return str(caminho)
+
+
+@pytest.mark.parametrize("leitor", ["calamine", "openpyxl"])
+def test_planilha_lida_e_estimada_pela_primeira_aba(planilha_com_outra_aba_ativa, monkeypatch, leitor):
+    monkeypatch.setattr(ingestion, "INGESTION_XLSX_ENGINE", leitor)
+
+    df = pd.concat(ler_arquivo_em_chunks(planilha_com_outra_aba_ativa, "relatorio.xlsx"))
+
+    assert df.columns.tolist() == ["nome", "cidade"]
+    assert df["nome"].tolist() == ["Ana", "Bruno"]
+    assert ingestion.estimar_total_linhas(planilha_com_outra_aba_ativa) == 2
@@ -0,0 +1,240 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from backend.services import dedup, ingestion, jobs, supabase_client
+from backend.services.processors import FINALIZADORES, PROCESSORS, TABELAS_DESTINO
+from backend.services.processors.resumos import TABELAS_RESUMO
+
+
+class _Resposta:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Consulta:
+    def __init__(self, cliente, tabela):
+        self.cliente, self.tabela = cliente, tabela
+        self.operacao, self.payload, self.filtros = "select", None, []
+
+    def select(self, colunas):
+        return self
+
+    def update(self, payload):
+        self.operacao, self.payload = "update", payload
+        return self
+
+    def delete(self):
+        self.operacao = "delete"
+        return self
+
+    def eq(self, coluna, valor):
+        self.filtros.append((coluna, valor))
+        return self
+
+    def in_(self, coluna, valores):
+        self.filtros.append((coluna, list(valores)))
+        return self
+
+    def execute(self):
+        self.cliente.operacoes.append((self.tabela, self.operacao, self.payload, self.filtros))
+        return _Resposta(self.cliente.relatorios_abertos if self.operacao == "select" else [])
+
+
+class _SupabaseGravador:
+    """Registra as operações feitas pelo worker e pelo gerenciador; o select devolve `relatorios_abertos`."""
+
+    def __init__(self, relatorios_abertos=()):
+        self.relatorios_abertos = list(relatorios_abertos)
+        self.operacoes = []
+
+    def table(self, tabela):
+        return _Consulta(self, tabela)
+
+    def status_gravados(self, relatorio_id):
+        return [
+            payload["status"] for tabela, operacao, payload, filtros in self.operacoes
+            if tabela == "relatorios" and operacao == "update" and "status" in payload and ("id", relatorio_id) in filtros
+        ]
+
+    def exclusoes(self, relatorio_id):
+        return [
+            tabela for tabela, operacao, _, filtros in self.operacoes
+            if operacao == "delete" and ("relatorio_id", relatorio_id) in filtros
+        ]
+
+
+@pytest.fixture(autouse=True)
+def fila_isolada(monkeypatch, tmp_path):
+    monkeypatch.setattr(jobs, "JOBS_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    jobs.inicializar_banco()
+
+
+def _arquivo(tmp_path, nome="relatorio.csv", conteudo="serial\nA\nB\nC\n"):
+    caminho = tmp_path / nome
+    caminho.write_text(conteudo)
+    return str(caminho)
+
+
+def _marcar_processando(relatorio_id, tentativas=0):
+    with jobs._conectar() as conn:
+        conn.execute("UPDATE jobs SET status = ?, tentativas = ? WHERE relatorio_id = ?", (jobs.PROCESSING, tentativas, relatorio_id))
+
+
+def test_recuperar_devolve_a_fila_os_jobs_interrompidos(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_MAX_TENTATIVAS", 3)
+    jobs.enfileirar(1, _arquivo(tmp_path, "a.csv"), "a.csv", "sac")
+    jobs.enfileirar(2, str(tmp_path / "sumiu.csv"), "sumiu.csv", "sac")
+    jobs.enfileirar(3, _arquivo(tmp_path, "c.csv"), "c.csv", "sac")
+    jobs.enfileirar(4, _arquivo(tmp_path, "d.csv"), "d.csv", "sac")
+    _marcar_processando(1)
+    _marcar_processando(2)
+    _marcar_processando(3, tentativas=2)
+
+    jobs.GerenciadorDeJobs().recuperar()
+
+    assert (jobs.obter_job(1)["status"], jobs.obter_job(1)["tentativas"]) == (jobs.PENDING, 1)
+    # Sem o arquivo, ou depois de interrompido JOBS_MAX_TENTATIVAS vezes, o job não volta à fila
+    assert jobs.obter_job(2)["status"] == jobs.FAILED
+    assert (jobs.obter_job(3)["status"], jobs.obter_job(3)["tentativas"]) == (jobs.FAILED, 3)
+    assert jobs.obter_job(4)["status"] == jobs.PENDING
+
+
+def test_recuperar_encerra_relatorios_abertos_sem_job_ativo(tmp_path):
+    jobs.enfileirar(10, _arquivo(tmp_path), "relatorio.csv", "sac")
+    jobs.enfileirar(11, _arquivo(tmp_path), "relatorio.csv", "sac")
+    jobs.GerenciadorDeJobs().cancelar(11)
+    supabase = _SupabaseGravador([
+        {"id": 10, "status": jobs.PENDING},
+        {"id": 11, "status": jobs.PROCESSING},
+        {"id": 12, "status": jobs.PROCESSING},
+    ])
+
+    jobs.GerenciadorDeJobs().recuperar(supabase)
+
+    assert supabase.status_gravados(10) == []
+    assert supabase.status_gravados(11) == [jobs.CANCELLED]
+    assert supabase.status_gravados(12) == [jobs.FAILED]
+
+
+def test_cancelar_job_pendente_descarta_o_arquivo_na_hora(tmp_path):
+    caminho = _arquivo(tmp_path)
+    jobs.enfileirar(20, caminho, "relatorio.csv", "sac")
+    gerenciador = jobs.GerenciadorDeJobs()
+    finalizados = []
+    gerenciador.ao_finalizar.append(lambda *args: finalizados.append(args))
+    supabase = _SupabaseGravador()
+
+    assert gerenciador.cancelar(20, supabase) == jobs.CANCELLED
+
+    assert jobs.obter_job(20)["status"] == jobs.CANCELLED
+    assert not os.path.exists(caminho)
+    assert supabase.status_gravados(20) == [jobs.CANCELLED]
+    assert finalizados == [(20, "sac", jobs.CANCELLED)]
+    # Um job cancelado não é mais reservado pelo despachante
+    assert not jobs._reservar(20)
+
+
+def test_cancelar_job_em_execucao_so_sinaliza_o_worker(tmp_path):
+    jobs.enfileirar(21, _arquivo(tmp_path), "relatorio.csv", "sac")
+    _marcar_processando(21)
+    gerenciador = jobs.GerenciadorDeJobs()
+
+    assert gerenciador.cancelar(21) == jobs.PROCESSING
+
+    assert jobs.obter_job(21)["status"] == jobs.PROCESSING
+    assert jobs.cancelamento_solicitado(21)
+    assert gerenciador.cancelar(999) is None
+
+
+@pytest.fixture
+def tipo_de_teste(monkeypatch, tmp_path):
+    """Processador falso: acumula cada chunk e chama `depois_do_chunk` (que pode simular um cancelamento)."""
+    gravados = []
+    estado = {"depois_do_chunk": lambda: None}
+
+    def processar(df, relatorio_id, supabase_client, progresso=None, contexto=None):
+        gravados.append(df)
+        estado["depois_do_chunk"]()
+
+    monkeypatch.setitem(PROCESSORS, "teste", processar)
+    monkeypatch.setitem(TABELAS_DESTINO, "teste", "tabela_teste")
+    monkeypatch.setitem(FINALIZADORES, "teste", None)
+    monkeypatch.setattr(dedup, "DEDUP_DB_PATH", str(tmp_path / "dedup.sqlite3"))
+    dedup.inicializar_banco()
+    supabase = _SupabaseGravador()
+    monkeypatch.setattr(supabase_client, "supabase", supabase)
+    return supabase, gravados, estado
+
+
+def test_worker_interrompe_o_cancelado_e_remove_o_que_ja_gravou(tmp_path, tipo_de_teste, monkeypatch):
+    supabase, gravados, estado = tipo_de_teste
+    monkeypatch.setattr(ingestion, "INGESTION_CHUNK_ROWS", 10)
+    caminho = _arquivo(tmp_path, conteudo="serial\n" + "".join(f"S{i}\n" for i in range(25)))
+    jobs.enfileirar(30, caminho, "relatorio.csv", "teste")
+    _marcar_processando(30)
+
+    estado["depois_do_chunk"] = lambda: jobs.GerenciadorDeJobs().cancelar(30)
+
+    status = jobs.processar_relatorio(30, caminho, "relatorio.csv", "teste")
+
+    assert status == jobs.CANCELLED
+    assert supabase.status_gravados(30) == [jobs.PROCESSING, jobs.CANCELLED]
+    assert supabase.exclusoes(30) == ["tabela_teste", *TABELAS_RESUMO]
+    assert not os.path.exists(caminho)
+    # O cancelamento é percebido antes do chunk seguinte: só o primeiro chegou ao processador
+    assert len(gravados) == 1
+
+
+def test_job_retomado_remove_a_tentativa_anterior_antes_de_recomecar(tmp_path, tipo_de_teste):
+    supabase, gravados, _ = tipo_de_teste
+    caminho = _arquivo(tmp_path)
+    jobs.enfileirar(31, caminho, "relatorio.csv", "teste")
+    _marcar_processando(31)
+    jobs.GerenciadorDeJobs().recuperar()
+    assert jobs.obter_job(31)["tentativas"] == 1
+
+    assert jobs.processar_relatorio(31, caminho, "relatorio.csv", "teste") == jobs.COMPLETED
+
+    assert supabase.exclusoes(31) == ["tabela_teste", *TABELAS_RESUMO]
+    assert supabase.status_gravados(31) == [jobs.PROCESSING, jobs.COMPLETED]
+    assert len(pd.concat(gravados)) == 3
+
+
+def test_despachante_respeita_o_limite_por_tipo(tmp_path, monkeypatch):
+    liberar = threading.Event()
+    iniciados = []
+    iniciou = threading.Semaphore(0)
+
+    def executar(relatorio_id, caminho, nome_arquivo, tipo):
+        iniciados.append(relatorio_id)
+        iniciou.release()
+        liberar.wait(5)
+        return jobs.COMPLETED
+
+    gerenciador = jobs.GerenciadorDeJobs(max_workers=3, limites_por_tipo={"desconexao": 1}, executar=executar)
+    monkeypatch.setattr(gerenciador, "_criar_pool", lambda: ThreadPoolExecutor(3))
+    concluidos = threading.Semaphore(0)
+    gerenciador.ao_finalizar.append(lambda *args: concluidos.release())
+    for relatorio_id, tipo in ((40, "desconexao"), (41, "desconexao"), (42, "sac")):
+        jobs.enfileirar(relatorio_id, _arquivo(tmp_path, f"{relatorio_id}.csv"), f"{relatorio_id}.csv", tipo)
+
+    gerenciador._pool = gerenciador._criar_pool()
+    gerenciador._despachar()
+    try:
+        assert iniciou.acquire(timeout=5) and iniciou.acquire(timeout=5)
+        assert sorted(iniciados) == [40, 42]
+        assert jobs.obter_job(41)["status"] == jobs.PENDING
+    finally:
+        liberar.set()
+    for _ in range(2):
+        assert concluidos.acquire(timeout=5)
+    gerenciador._despachar()
+    assert concluidos.acquire(timeout=5)
+    gerenciador._pool.shutdown()
+
+    assert sorted(iniciados) == [40, 41, 42]
+    assert {jobs.obter_job(i)["status"] for i in (40, 41, 42)} == {jobs.COMPLETED}
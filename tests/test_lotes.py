@@ -0,0 +1,160 @@
+import asyncio
+import importlib
+import io
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.services import jobs, lotes
+from backend.services.processors import LOTES
+
+
+@pytest.fixture
+def lotes_com_8_nucleos(monkeypatch):
+    monkeypatch.delenv("LOTE_MAX_WORKERS", raising=False)
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    # O pool de jobs também usa todos os núcleos por padrão
+    monkeypatch.setattr(jobs, "JOBS_MAX_WORKERS", 8)
+    yield importlib.reload(lotes)
+    monkeypatch.undo()
+    importlib.reload(lotes)
+
+
+def test_por_padrao_o_lote_usa_todos_os_nucleos(lotes_com_8_nucleos):
+    assert lotes_com_8_nucleos.LOTE_MAX_WORKERS == 8
+
+
+def test_arquivos_do_lote_sao_preparados_em_paralelo(lotes_com_8_nucleos, monkeypatch, tmp_path):
+    modulo = lotes_com_8_nucleos
+    pools = []
+
+    class _PoolEmThreads(ThreadPoolExecutor):
+        def __init__(self, max_workers, mp_context=None):
+            pools.append(max_workers)
+            super().__init__(max_workers)
+
+    gravados = []
+    monkeypatch.setattr(modulo, "ProcessPoolExecutor", _PoolEmThreads)
+    monkeypatch.setitem(LOTES, "teste", (
+        lambda chunk, relatorio_id, escopo: chunk,
+        lambda df, relatorio_id, supabase, progresso, contexto, escopo: gravados.append(df),
+        "serial",
+    ))
+    jobs.inicializar_banco()
+    modulo.inicializar_banco()
+    arquivos = []
+    for i, conteudo in enumerate(["serial,valor\nA,1\nB,1\n", "serial,valor\nB,2\nC,2\n", "serial,valor\nD,3\n"]):
+        caminho = tmp_path / f"parte{i}.csv"
+        caminho.write_text(conteudo)
+        arquivos.append({"nome_arquivo": caminho.name, "caminho": str(caminho), "sha256": str(i), "status": jobs.PENDING})
+    modulo.registrar_arquivos(501, arquivos)
+
+    assert modulo.processar_lote(str(tmp_path), 501, "teste", supabase_client=None) == 5
+
+    assert pools == [3]
+    df = gravados[0]
+    assert sorted(zip(df["serial"], df["valor"])) == [("A", "1"), ("B", "2"), ("C", "2"), ("D", "3")]
+    assert {a["status"] for a in modulo.listar_arquivos(501)} == {jobs.COMPLETED}
+
+
+def _zip(caminho, entradas):
+    with zipfile.ZipFile(caminho, "w", zipfile.ZIP_DEFLATED) as zf:
+        for nome, conteudo in entradas.items():
+            if nome.endswith("/"):
+                zf.writestr(zipfile.ZipInfo(nome), "")
+            else:
+                zf.writestr(nome, conteudo)
+    return str(caminho)
+
+
+def test_extrai_so_as_entradas_suportadas(tmp_path):
+    destino = tmp_path / "extraidos"
+    destino.mkdir()
+    caminho = _zip(tmp_path / "envio.zip", {
+        "junho/olt1.csv": "serial\nA\n",
+        "junho/": "",
+        "leia-me.txt": "nada",
+        "__MACOSX/junho/._olt1.csv": "lixo",
+        "junho/.oculto.csv": "lixo",
+    })
+
+    arquivos = lotes._extrair_zip(caminho, "envio.zip", str(destino))
+
+    status = {a["nome_arquivo"]: a["status"] for a in arquivos}
+    assert status == {
+        "envio.zip/junho/olt1.csv": jobs.PENDING,
+        "envio.zip/leia-me.txt": lotes.IGNORADO,
+        "envio.zip/__MACOSX/junho/._olt1.csv": lotes.IGNORADO,
+        "envio.zip/junho/.oculto.csv": lotes.IGNORADO,
+    }
+    extraido = next(a for a in arquivos if a["status"] == jobs.PENDING)
+    # O nome em disco é gerado, nunca o caminho interno do zip
+    assert os.path.dirname(extraido["caminho"]) == str(destino)
+    with open(extraido["caminho"]) as f:
+        assert f.read() == "serial\nA\n"
+
+
+def test_zip_acima_do_limite_descompactado_e_recusado_sem_extrair(tmp_path, monkeypatch):
+    destino = tmp_path / "extraidos"
+    destino.mkdir()
+    # Poucos bytes compactados, muitos descompactados
+    caminho = _zip(tmp_path / "bomba.zip", {"a.csv": "0" * 10_000, "b.csv": "0" * 10_000})
+    monkeypatch.setattr(lotes, "LOTE_MAX_BYTES_ZIP", 15_000)
+
+    with pytest.raises(ValueError, match="excede o limite"):
+        lotes._extrair_zip(caminho, "bomba.zip", str(destino))
+
+    assert os.listdir(destino) == []
+
+
+def test_zip_corrompido(tmp_path):
+    caminho = tmp_path / "quebrado.zip"
+    caminho.write_bytes(b"PK\x03\x04 isto nao e um zip")
+
+    with pytest.raises(ValueError, match="não é um arquivo .zip válido"):
+        lotes._extrair_zip(str(caminho), "quebrado.zip", str(tmp_path))
+
+
+class _Upload:
+    def __init__(self, filename, conteudo):
+        self.filename = filename
+        self._conteudo = io.BytesIO(conteudo)
+
+    async def read(self, tamanho=-1):
+        return self._conteudo.read(tamanho)
+
+
+def test_salvar_lote_ignora_conteudo_repetido_e_formatos_nao_suportados(tmp_path):
+    compactado = io.BytesIO()
+    with zipfile.ZipFile(compactado, "w") as zf:
+        zf.writestr("dentro.csv", "serial\nA\n")
+
+    diretorio, arquivos = asyncio.run(lotes.salvar_lote_em_disco([
+        _Upload("a.csv", b"serial\nA\n"),
+        _Upload("envio.zip", compactado.getvalue()),
+        _Upload("foto.png", b"\x89PNG"),
+    ]))
+
+    try:
+        assert [(a["nome_arquivo"], a["status"]) for a in arquivos] == [
+            ("a.csv", jobs.PENDING), ("envio.zip/dentro.csv", lotes.IGNORADO), ("foto.png", lotes.IGNORADO),
+        ]
+        assert "a.csv" in arquivos[1]["detalhe"]
+        assert len(os.listdir(diretorio)) == 1
+    finally:
+        lotes.remover_arquivo(diretorio)
+
+
+def test_salvar_lote_remove_o_diretorio_quando_o_zip_excede_o_limite(monkeypatch):
+    monkeypatch.setattr(lotes, "LOTE_MAX_BYTES_ZIP", 10)
+    compactado = io.BytesIO()
+    with zipfile.ZipFile(compactado, "w") as zf:
+        zf.writestr("grande.csv", "0" * 1000)
+    antes = set(os.listdir(lotes.UPLOAD_SPOOL_DIR))
+
+    with pytest.raises(ValueError):
+        asyncio.run(lotes.salvar_lote_em_disco([_Upload("a.csv", b"x\n1\n"), _Upload("envio.zip", compactado.getvalue())]))
+
+    assert set(os.listdir(lotes.UPLOAD_SPOOL_DIR)) == antes
@@ -0,0 +1,91 @@
+import json
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.services.processors.monitoria_processor import (
+    calcular_notas, marcar_falhas_criticas, processar_relatorio_monitoria,
+)
+
+
+@pytest.mark.parametrize("nota, esperada", [
+    ("8,5", 8.5),
+    (" 9,25 ", 9.25),
+    ("7.5", 7.5),
+    ("85%", 8.5),
+    ("92,5%", 9.25),
+    ("100", 10.0),
+    ("abc", np.nan),
+    (None, np.nan),
+])
+def test_nota_aceita_virgula_decimal_e_percentual(nota, esperada):
+    calculada = calcular_notas(pd.DataFrame({"nota": [nota]}))[0]
+
+    if np.isnan(esperada):
+        assert np.isnan(calculada)
+    else:
+        assert calculada == esperada
+
+
+def test_nota_numerica_da_planilha():
+    assert calcular_notas(pd.DataFrame({"nota": [8.5, 95, 0]})).tolist() == [8.5, 9.5, 0.0]
+
+
+def test_sem_nota_usa_a_razao_entre_pontos():
+    df = pd.DataFrame({
+        "nota": [None, "6", None, None],
+        "pontos_obtidos": ["17,5", "20", "5", "3"],
+        "pontos_possiveis": ["20", "20", "0", None],
+    })
+
+    notas = calcular_notas(df)
+
+    assert notas[0] == 8.75
+    # A nota da planilha tem prioridade sobre os pontos
+    assert notas[1] == 6.0
+    # Sem pontos possíveis válidos não há como calcular
+    assert notas[2:].isna().all()
+
+
+@pytest.mark.parametrize("categoria", [False, True])
+def test_falha_critica_zera_a_nota(categoria):
+    df = pd.DataFrame({
+        "nota": ["9,5", "90%", "8", "7", None],
+        "falha_critica": ["Sim", " x ", "Não", None, "Sim"],
+    })
+    if categoria:
+        df["falha_critica"] = df["falha_critica"].astype("category")
+
+    notas = calcular_notas(df)
+
+    assert notas[:4].tolist() == [0.0, 0.0, 8.0, 7.0]
+    # Sem nota, a avaliação continua sem nota (e fica fora do ranking) mesmo com falha crítica
+    assert np.isnan(notas[4])
+    assert marcar_falhas_criticas(df["falha_critica"]).tolist() == [True, True, False, False, True]
+
+
+def test_processa_o_chunk_e_descarta_avaliacoes_sem_agente_ou_nota():
+    enviados = []
+
+    def responder(request):
+        enviados.append(json.loads(request.content))
+        return httpx.Response(201)
+
+    sessao = httpx.Client(transport=httpx.MockTransport(responder), base_url="http://supabase.invalid/rest/v1/")
+    supabase = SimpleNamespace(postgrest=SimpleNamespace(session=sessao))
+    df = pd.DataFrame({
+        "Atendente": ["Ana ", "Bruno", None, "Carla"],
+        "Nota Final": ["8,5", "95%", "7", ""],
+        "Falha Crítica": ["", "Sim", "", ""],
+        "Data da Monitoria": ["2024-03-01", "2024-03-02", "2024-03-03", "2024-03-04"],
+    })
+
+    processar_relatorio_monitoria(df, relatorio_id=5, supabase_client=supabase, contexto={})
+
+    linhas = [linha for lote in enviados for linha in lote]
+    assert [(l["agente"], l["nota"], l["falha_critica"]) for l in linhas] == [("Ana", 8.5, False), ("Bruno", 0.0, True)]
+    assert {l["relatorio_id"] for l in linhas} == {5}
+    assert linhas[0]["data_monitoria"] == "2024-03-01T00:00:00.000000Z"
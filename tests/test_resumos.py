@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+
+from backend.services.processors import resumos
+from backend.services.processors.resumos import rotular_faixas_horas
+
+
+@pytest.mark.parametrize("horas, rotulo", [
+    (0, "0-24"),
+    (23.9, "0-24"),
+    (24, "24-48"),
+    (47, "24-48"),
+    (48, "48-72"),
+    (72, "72-168"),
+    (167.99, "72-168"),
+    (168, "168+"),
+    (1000, "168+"),
+    (-5, "0-24"),
+    ("30", "24-48"),
+])
+def test_limites_das_faixas(horas, rotulo):
+    assert rotular_faixas_horas(pd.Series([horas])).tolist() == [rotulo]
+
+
+def test_valores_ausentes_ou_invalidos_ficam_sem_faixa():
+    rotulos = rotular_faixas_horas(pd.Series([None, float("nan"), "abc", 10], dtype=object))
+
+    # Com inferência de string do pandas os ausentes podem vir como NaN em vez de None
+    assert rotulos.isna().tolist() == [True, True, True, False]
+    assert rotulos.iloc[3] == "0-24"
+
+
+def test_preserva_o_indice_do_chunk():
+    # Chunks seguintes do mesmo arquivo chegam com índice deslocado
+    horas = pd.Series([100, 5, 200], index=[5000, 5001, 5002])
+
+    rotulos = rotular_faixas_horas(horas)
+
+    assert rotulos.index.tolist() == [5000, 5001, 5002]
+    assert rotulos.tolist() == ["72-168", "0-24", "168+"]
+
+
+def _chunk_desconexao(ctos):
+    return pd.DataFrame({
+        "cidade": "Londrina", "olt_regiao": "OLT-1", "motivo_desconexao": "LOSS", "horas_offline": 30,
+        "data_desconexao": pd.Timestamp("2024-01-01", tz="UTC"), "cto": ctos,
+    })
+
+
+def test_resumo_guarda_as_principais_ctos_e_soma_o_resto(monkeypatch):
+    monkeypatch.setattr(resumos, "RESUMO_CTO_TOP_N", 2)
+    resumo = resumos.ResumoRelatorio(relatorio_id=7, tipo="desconexao")
+
+    # Acumulado entre chunks: CTO-B só passa CTO-C no segundo
+    resumo.acumular_desconexao(_chunk_desconexao(["CTO-A", "CTO-A", "CTO-A", "CTO-C", "CTO-C", "CTO-B", None]))
+    resumo.acumular_desconexao(_chunk_desconexao(["CTO-B", "CTO-B", "CTO-D", "CTO-E"]))
+
+    assert resumo._contagens_cto() == {"CTO-A": 3, "CTO-B": 3, "outros": 4}
+
+
+def test_ctos_empatadas_no_limite_desempatam_pelo_nome(monkeypatch):
+    monkeypatch.setattr(resumos, "RESUMO_CTO_TOP_N", 2)
+    resumo = resumos.ResumoRelatorio(relatorio_id=7, tipo="desconexao")
+
+    resumo.acumular_desconexao(_chunk_desconexao(["CTO-Z", "CTO-Z", "CTO-M", "CTO-B"]))
+
+    assert resumo._contagens_cto() == {"CTO-Z": 2, "CTO-B": 1, "outros": 1}
+
+
+def test_poucas_ctos_nao_geram_linha_de_outros():
+    resumo = resumos.ResumoRelatorio(relatorio_id=7, tipo="desconexao")
+
+    resumo.acumular_desconexao(_chunk_desconexao(["CTO-A", "CTO-B", None]))
+
+    assert resumo._contagens_cto() == {"CTO-A": 1, "CTO-B": 1}